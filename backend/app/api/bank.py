@@ -1,11 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional, Dict
-from pydantic import BaseModel
-from ..db.database import db
-import random
+import codecs
+import csv
+import json
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import List, Optional, Dict, Literal
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from ..auth import require_admin
+from ..db.database import adb
+from ..repositories import bank as repo
+from ..events import bus, farmer_topic
+from ..services import export
+from ..coalesce import single_flight
+from ..serialization import FastJSONResponse, dumps, map_rows
+from ..services.payments import PaymentRow, parse_payment
+from .pagination import encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/api/bank", tags=["bank"])
 
+# Payments applied per transaction by the bulk endpoints
+BULK_BATCH_SIZE = 1000
+
 # --- Models ---
 class DashboardStats(BaseModel):
     total_portfolio: float
@@ -23,98 +37,294 @@ class Application(BaseModel):
     credit_score: int
     status: str
     created_at: str
+    version: int = 0 # Send back with a review for optimistic concurrency
     # AI Analysis Fields
     yield_potential: str 
     risk_factors: List[str]
     ai_score_breakdown: Dict[str, int]
 
+# Application fields read from the queue row, and from the stored analysis
+ANALYSIS_FIELDS = ("yield_potential", "risk_factors", "ai_score_breakdown")
+APPLICATION_COLUMNS = tuple(f for f in Application.model_fields if f not in ANALYSIS_FIELDS)
+
+class ApplicationPage(BaseModel):
+    items: List[Application]
+    total: int
+    next_cursor: Optional[str] = None
+
+class FarmerListing(BaseModel):
+    id: int
+    name: str
+    email: str
+    farms: Optional[str] = None # Farm names, space separated
+    credit_score: Optional[int] = None
+    loan_count: int
+    active_loans: int
+    active_debt: float
+
+FARMER_LISTING_COLUMNS = tuple({"name": "full_name"}.get(f, f) for f in FarmerListing.model_fields)
+
+class FarmerSearchPage(BaseModel):
+    items: List[FarmerListing]
+    next_cursor: Optional[str] = None
+    fuzzy: bool = False # No exact prefix match; results are spelling corrections
+
 class ApprovalRequest(BaseModel):
     approved: bool
+    version: Optional[int] = None # Fail with 409 if the application changed since
+    # Loan terms set on approval; product defaults otherwise
+    rate: Optional[float] = Field(None, ge=0, le=100) # Annual %
+    schedule_method: Optional[Literal["flat", "annuity"]] = None
+
+class BulkPayment(BaseModel):
+    loan_id: int
+    amount: float
+    idempotency_key: Optional[str] = None
+    payment_date: Optional[str] = None
+
+class BulkPaymentRequest(BaseModel):
+    payments: List[BulkPayment]
 
 # --- Endpoints ---
 
+async def coalesced(name, params, build, scope="bank"):
+    """Serve `build()` through the single-flight layer (app/coalesce.py).
+
+    Concurrent requests with the same route and parameters share one
+    build. Bank officers all see the same data and the bank routes carry
+    no per-officer auth yet, so they share one scope.
+    """
+    key = f"{scope}:{name}?{dumps(sorted(params.items())).decode()}"
+
+    async def encoded():
+        return dumps(await build())
+
+    return Response(content=await single_flight.do(key, encoded), media_type="application/json")
+
 @router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats():
-    with db.get_connection() as conn:
-        # Calculate Total Portfolio (Sum of all active loan amounts)
-        portfolio_res = conn.execute("SELECT SUM(amount) as total FROM loan_requests WHERE status = 'active'").fetchone()
-        total_portfolio = portfolio_res['total'] or 0
-        
-        # Active Loans Count
-        active_res = conn.execute("SELECT COUNT(*) as count FROM loan_requests WHERE status = 'active'").fetchone()
-        active_loans = active_res['count'] or 0
-        
-        # Pending Applications Count
-        pending_res = conn.execute("SELECT COUNT(*) as count FROM loan_requests WHERE status = 'pending'").fetchone()
-        pending_apps = pending_res['count'] or 0
-        
-        return DashboardStats(
-            total_portfolio=total_portfolio,
-            active_loans=active_loans,
-            pending_applications=pending_apps,
-            risk_level="Low" # Mock risk level for now
-        )
-
-@router.get("/applications", response_model=List[Application])
-async def get_applications():
-    with db.get_connection() as conn:
-        # Join with farmers and farms to get names
-        query = """
-            SELECT lr.*, f.full_name as farmer_name, f.credit_score, fa.name as farm_name
-            FROM loan_requests lr
-            JOIN farms fa ON lr.farm_id = fa.id
-            JOIN farmers f ON fa.farmer_id = f.id
-            WHERE lr.status = 'pending'
-            ORDER BY lr.created_at DESC
-        """
-        rows = conn.execute(query).fetchall()
-        
-        apps = []
-        for row in rows:
-            # Deterministic/Mock AI Analysis based on id
-            yield_potential = "High" if row['credit_score'] > 700 else "Medium"
-            risk_factors = []
-            if row['credit_score'] < 650:
-                risk_factors.append("Recent late payments")
-                risk_factors.append("Low equity")
-            else:
-                risk_factors.append("Stable market demand")
-                
-            if row['amount'] > 5000:
-                risk_factors.append("High capital exposure")
-
-            apps.append(Application(
-                id=row['id'],
-                farmer_name=row['farmer_name'],
-                farm_name=row['farm_name'],
-                amount=row['amount'],
-                term_months=row['term_months'],
-                purpose=row['purpose'],
-                credit_score=row['credit_score'],
-                status=row['status'],
-                created_at=row['created_at'],
-                yield_potential=f"{random.randint(4,8)} tons/ha",
-                risk_factors=risk_factors,
-                ai_score_breakdown={
-                    "Collateral": 85,
-                    "History": row['credit_score'] // 10,
-                    "Market": 90
-                }
-            ))
-            
-        return apps
+    return await coalesced("dashboard", {}, _build_dashboard)
+
+async def _build_dashboard():
+    totals = await adb.run(repo.get_dashboard_totals)
+    return {
+        "total_portfolio": totals['total_portfolio'],
+        "active_loans": totals['active_loans'],
+        "pending_applications": totals['pending_applications'],
+        "risk_level": "Low", # Mock risk level for now
+    }
+
+@router.post("/dashboard/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_dashboard(repair: bool = True):
+    # Verify the maintained aggregates against a full recompute
+    mismatches = await adb.run(repo.reconcile_portfolio, repair=repair, timeout=120)
+    return {"mismatches": mismatches, "repaired": repair and bool(mismatches)}
+
+@router.post("/portfolio/rescore", dependencies=[Depends(require_admin)])
+async def rescore_portfolio():
+    # Nightly batch re-score of the loan book; commits chunk by chunk
+    return await adb.run(repo.rescore_portfolio, timeout=3600)
+
+@router.get("/applications", response_model=ApplicationPage)
+async def get_applications(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sort: Literal["created_at", "amount"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    purpose: Optional[str] = None,
+    farmer: Optional[str] = None, # Borrower name, email or farm, matched by prefix
+):
+    filters = {
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+        "min_score": min_score,
+        "max_score": max_score,
+        "purpose": purpose,
+        "farmer": farmer,
+    }
+    params = dict(filters, limit=limit, cursor=cursor, sort=sort, order=order)
+    return await coalesced("applications", params,
+                           lambda: _build_application_page(filters, limit, cursor, sort, order))
+
+async def _build_application_page(filters, limit, cursor, sort, order):
+    sort_key = f"{sort}:{order}"
+    after = decode_cursor(cursor, sort_key) if cursor else None
+    rows, analyses, total, has_more = await adb.run(
+        repo.get_application_page, filters, sort=sort, descending=order == "desc", after=after, limit=limit
+    )
+
+    # Rows and stored analyses are ours: encoded directly, without models
+    apps = map_rows(rows, APPLICATION_COLUMNS)
+    for item in apps:
+        analysis = analyses[item['id']]
+        for field in ANALYSIS_FIELDS:
+            item[field] = analysis[field]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_key, (last[sort], last['id']))
+    return {"items": apps, "total": total, "next_cursor": next_cursor}
+
+@router.get("/farmers", response_model=FarmerSearchPage)
+async def search_farmers(
+    q: str = "",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    # Ranked full-text search over the farmer directory; every farmer by id
+    # when q is empty. The cursor is tied to the query it was issued for.
+    sort_key = f"search:{' '.join(q.lower().split())}"
+    # (mode, id) when listing, (mode, rank, id) when matching
+    after = decode_cursor(cursor, sort_key, lengths=(2, 3)) if cursor else None
+    try:
+        rows, mode, has_more = await adb.run(repo.search_farmers, q, after=after, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    items = map_rows(rows, FarmerListing.model_fields, FARMER_LISTING_COLUMNS)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        key = (mode, last['id']) if mode == "list" else (mode, last['rank'], last['id'])
+        next_cursor = encode_cursor(sort_key, key)
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor, "fuzzy": mode == "fuzzy"})
+
+@router.get("/export", dependencies=[Depends(require_admin)])
+async def export_portfolio(
+    format: Literal["csv", "columnar"] = "csv",
+    status: Optional[List[str]] = Query(None),
+    chunk_size: int = Query(export.EXPORT_CHUNK_SIZE, ge=100, le=100_000),
+):
+    """Stream the loan book with farm, farmer and payment totals.
+
+    One chunk is read and encoded per executor call, so memory stays flat
+    and no connection is held while the client drains the stream.
+    """
+    media_type, extension, header, encode, footer = export.FORMATS[format]
+
+    async def body():
+        yield header()
+        after_id = 0
+        while True:
+            after_id, data = await adb.run(repo.get_export_chunk, after_id, chunk_size, status, encode)
+            if after_id is None:
+                break
+            yield data
+        yield footer()
+
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="portfolio.{extension}"'},
+    )
 
 @router.post("/applications/{app_id}/review")
 async def review_application(app_id: int, review: ApprovalRequest):
-    with db.get_connection() as conn:
-        # Check if exists
-        app = conn.execute("SELECT * FROM loan_requests WHERE id = ?", (app_id,)).fetchone()
-        if not app:
-            raise HTTPException(status_code=404, detail="Application not found")
-            
-        new_status = 'waiting_signature' if review.approved else 'rejected'
-        
-        conn.execute("UPDATE loan_requests SET status = ? WHERE id = ?", (new_status, app_id))
-        conn.commit()
-        
-        return {"message": f"Application {new_status}"}
+    annual_rate = review.rate / 100 if review.rate is not None else None
+    loan = await adb.run(repo.review_application, app_id, review.approved, review.version,
+                         annual_rate, review.schedule_method)
+
+    bus.publish(farmer_topic(loan['farmer_id']), {"type": "loan.reviewed", "loan_id": app_id, "status": loan['status']})
+
+    return {"message": f"Application {loan['status']}", "status": loan['status'], "version": loan['version']}
+
+class _BulkRun:
+    """Applies payments batch by batch and collects per-row results."""
+
+    def __init__(self):
+        self.results = []
+        self.batch = []
+
+    async def add(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= BULK_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        offset = len(self.results)
+        results = await adb.run(repo.apply_payment_batch, batch)
+
+        # Batch committed - notify the affected farmers once each
+        changed = {}
+        for result in results:
+            result['index'] += offset
+            farmer_id = result.pop('farmer_id', None)
+            if farmer_id is not None:
+                changed.setdefault(farmer_id, []).append(result['loan_id'])
+        for farmer_id, loan_ids in changed.items():
+            bus.publish(farmer_topic(farmer_id), {"type": "loan.payment", "loan_ids": loan_ids})
+        self.results.extend(results)
+
+    def report(self):
+        summary = {"applied": 0, "paid_off": 0, "duplicate": 0, "rejected": 0}
+        for result in self.results:
+            summary[result['status']] += 1
+        # Plain JSON types already - skip FastAPI's per-item encoder pass
+        return JSONResponse({"total": len(self.results), "summary": summary, "results": self.results})
+
+@router.post("/payments/bulk", dependencies=[Depends(require_admin)])
+async def bulk_payments(req: BulkPaymentRequest):
+    run = _BulkRun()
+    for p in req.payments:
+        if p.payment_date is not None:
+            try:
+                row = parse_payment(p.model_dump())
+            except ValueError as exc:
+                row = exc
+        else:
+            row = PaymentRow(p.loan_id, p.amount, p.idempotency_key)
+        await run.add(row)
+    await run.flush()
+    return run.report()
+
+async def _lines(request):
+    # Decode the request body incrementally and yield complete lines
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+@router.post("/payments/bulk/upload", dependencies=[Depends(require_admin)])
+async def upload_payments(request: Request):
+    """Streamed NDJSON (one payment object per line) or CSV with a header
+    row (loan_id,amount[,idempotency_key][,payment_date])."""
+    content_type = request.headers.get("content-type", "")
+    is_csv = "csv" in content_type
+    run = _BulkRun()
+    header = None
+    async for line in _lines(request):
+        if not line.strip():
+            continue
+        if is_csv:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            data = dict(zip(header, values))
+        else:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                await run.add(ValueError("invalid JSON line"))
+                continue
+        try:
+            row = parse_payment(data)
+        except ValueError as exc:
+            row = exc
+        await run.add(row)
+    await run.flush()
+    return run.report()
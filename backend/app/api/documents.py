@@ -1,67 +1,106 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
+import asyncio
 import datetime
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from ..db.database import adb
+from ..repositories import bank as bank_repo
+from ..services.documents import renderer, ZipStream
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
+# Largest batch accepted by /batch
+MAX_BATCH = 5000
+# Archive entries compressed per streamed chunk
+ZIP_CHUNK = 100
+
 class DocumentRequest(BaseModel):
     application_id: int
     farmer_name: str
     amount: float
-    date: str = datetime.date.today().isoformat()
+    date: str = Field(default_factory=lambda: datetime.date.today().isoformat())
 
 class DocumentResponse(BaseModel):
     title: str
     content: str
 
-@router.post("/contract", response_model=DocumentResponse)
-async def generate_contract(req: DocumentRequest):
-    return DocumentResponse(
-        title="LOAN AGREEMENT",
-        content=f"""
-LOAN AGREEMENT
-
-This Agreement is made on {req.date} between AgroCredit Bank ("Lender") and {req.farmer_name} ("Borrower").
+class BatchItem(DocumentRequest):
+    template: Literal["contract", "rejection"]
 
-1. LOAN AMOUNT
-The Lender agrees to lend the Borrower the principal sum of ${req.amount:,.2f}.
+class BatchRequest(BaseModel):
+    # Either explicit items, or application ids rendered with one template
+    items: List[BatchItem] = []
+    application_ids: List[int] = []
+    template: Optional[Literal["contract", "rejection"]] = None
+    format: Literal["json", "zip"] = "json"
 
-2. TERMS
-The loan shall be repaid in monthly installments as per the agreed schedule.
-
-3. AI ASSESSMENT
-The loan has been approved based on an AI-driven assessment of crop yield potential and creditworthiness.
+class BatchDocument(DocumentResponse):
+    application_id: int
+    template: str
 
-4. COLLATERAL
-The Borrower grants the Lender a security interest in the future crop harvest of the indicated fields.
+def _render(template, req):
+    title, content = renderer.render(template, req.model_dump())
+    return DocumentResponse(title=title, content=content)
 
-Signed:
-___________________ (Bank)
-___________________ ({req.farmer_name})
-        """
-    )
+@router.post("/contract", response_model=DocumentResponse)
+async def generate_contract(req: DocumentRequest):
+    return _render("contract", req)
 
 @router.post("/rejection", response_model=DocumentResponse)
 async def generate_rejection(req: DocumentRequest):
-    return DocumentResponse(
-        title="NOTICE OF ADVERSE ACTION",
-        content=f"""
-NOTICE OF ADVERSE ACTION
-
-Date: {req.date}
-To: {req.farmer_name}
-
-Thank you for your application for a loan of ${req.amount:,.2f}.
-
-After careful review by our AI Risk Assessment model and credit officers, we regret to inform you that we are unable to approve your request at this time.
-
-Principal reasons for denial:
-- Insufficient historical crop yield data
-- High risk factors identified in market analysis
-
-You have the right to request a full copy of your credit report within 60 days.
-
-Sincerely,
-AgroCredit AI Risk Team
-        """
+    return _render("rejection", req)
+
+async def _batch_items(req):
+    items = [(item.template, item.model_dump(exclude={"template"})) for item in req.items]
+    if req.application_ids:
+        if req.template is None:
+            raise HTTPException(status_code=400, detail="template is required with application_ids")
+        rows = await adb.run(bank_repo.get_document_rows, req.application_ids)
+        missing = [app_id for app_id in req.application_ids if app_id not in rows]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Applications not found: {missing[:20]}")
+        today = datetime.date.today().isoformat()
+        for app_id in req.application_ids:
+            row = rows[app_id]
+            items.append((req.template, {
+                "application_id": app_id,
+                "farmer_name": row['farmer_name'],
+                "amount": row['amount'],
+                "date": today,
+            }))
+    if len(items) > MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH} documents per batch")
+    return items
+
+@router.post("/batch")
+async def generate_batch(req: BatchRequest):
+    """Render many contracts/notices in one call, as JSON or a streamed zip."""
+    items = await _batch_items(req)
+    documents = await renderer.render_batch(items)
+    entries = [
+        (name, data['application_id'], title, content)
+        for (name, data), (title, content) in zip(items, documents)
+    ]
+    if req.format == "json":
+        return [
+            BatchDocument(application_id=app_id, template=name, title=title, content=content)
+            for name, app_id, title, content in entries
+        ]
+
+    def compress(archive, chunk):
+        for name, app_id, _, content in chunk:
+            archive.add(f"{name}_{app_id}.txt", content)
+        return archive.drain()
+
+    async def body():
+        archive = ZipStream()
+        for start in range(0, len(entries), ZIP_CHUNK):
+            yield await asyncio.to_thread(compress, archive, entries[start:start + ZIP_CHUNK])
+        yield archive.close()
+
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="documents.zip"'},
     )
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict
 from pydantic import BaseModel
-from ..db.database import db
+from ..auth import Identity, current_farmer
+from ..cache import response_cache
+from ..db.database import adb
+from ..events import bus, farmer_topic
+from ..repositories import farmers as repo
+from ..serialization import FastJSONResponse, dumps, map_objects, map_rows
+from ..services import timeseries
+from ..services.balances import balance_for
 
 router = APIRouter(prefix="/api/farmers", tags=["farmers"])
 
+# Seconds between SSE keep-alive comments (keeps proxies from closing idle streams)
+STREAM_KEEPALIVE = 15
+
 # --- Models ---
 class FarmerSummary(BaseModel):
     total_debt: float
@@ -25,13 +37,22 @@ class Loan(BaseModel):
     id: int
     amount: float
     remaining: float
-    rate: float = 12.0 # Hardcoded for now or fetch from DB if column added
+    rate: float = 12.0 # Annual %, per loan
     term_months: int
     status: str
     paid: float
     progress: int
     next_payment: float
     due_date: str
+    arrears: float = 0 # Installments past due and not yet paid
+
+class Installment(BaseModel):
+    seq: int
+    due_date: str
+    principal: float
+    interest: float
+    amount: float
+    cumulative: float
 
 class LoanCreate(BaseModel):
     amount: float
@@ -42,7 +63,27 @@ class UtilityReading(BaseModel):
     type: str # electricity, gas, water
     value: float
     unit: str
-    diff: float = 0 # Placeholder for monthly difference
+    diff: float = 0 # Change since the previous month's last reading
+
+class UtilityReadingIn(BaseModel):
+    type: str
+    value: float
+    unit: Optional[str] = None # Defaults per utility type
+    reading_date: Optional[str] = None # ISO date/datetime; defaults to now
+    farm_id: Optional[int] = None # Defaults to the farmer's first farm
+
+class UtilityPoint(BaseModel):
+    t: str
+    min: float
+    max: float
+    avg: float
+    last: float
+    count: int
+
+class UtilityHistory(BaseModel):
+    type: str
+    bucket: str
+    points: List[UtilityPoint]
 
 class Recommendation(BaseModel):
     title: str
@@ -51,258 +92,242 @@ class Recommendation(BaseModel):
 
 # --- Endpoints ---
 
+async def cached(farmer_id, name, build):
+    """Serve `build()` from the response cache, keyed per farmer.
+
+    The farmer's scope is dropped whenever a write publishes on their topic.
+    """
+    topic = farmer_topic(farmer_id)
+    key = f"{topic}:{name}"
+    body = response_cache.get(key)
+    if body is None:
+        version = bus.version(topic)
+        body = dumps(await build())
+        # Don't store a body that a concurrent write may have made stale
+        if bus.version(topic) == version:
+            response_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
+
 @router.get("/profile", response_model=FarmerProfile)
-async def get_profile():
-    with db.get_connection() as conn:
-        farmer = conn.execute("SELECT * FROM farmers WHERE id = 1").fetchone()
-        if not farmer:
-            raise HTTPException(status_code=404, detail="Farmer not found")
-            
-        farm = conn.execute("SELECT * FROM farms WHERE farmer_id = 1").fetchone()
-        farm_name = farm['name'] if farm else "No Farm"
-        farm_size = farm['size_acres'] if farm else 0.0
-        
-        return FarmerProfile(
-            id=farmer['id'],
-            email=farmer['email'],
-            full_name=farmer['full_name'],
-            credit_score=farmer['credit_score'],
-            farm_name=farm_name,
-            farm_size=farm_size,
-            joined_date="15.01.2023" # Hardcoded for demo
-        )
+async def get_profile(farmer: Identity = Depends(current_farmer)):
+    return await cached(farmer.farmer_id, "profile", lambda: _build_profile(farmer))
+
+async def _build_profile(identity):
+    farmer, farm = await adb.run(repo.get_profile, identity)
+    if not farmer:
+        raise HTTPException(status_code=404, detail="Farmer not found")
+
+    farm_name = farm['name'] if farm else "No Farm"
+    farm_size = farm['size_acres'] if farm else 0.0
+
+    return FarmerProfile(
+        id=farmer['id'],
+        email=farmer['email'],
+        full_name=farmer['full_name'],
+        credit_score=farmer['credit_score'],
+        farm_name=farm_name,
+        farm_size=farm_size,
+        joined_date="15.01.2023" # Hardcoded for demo
+    )
 
 @router.get("/summary", response_model=FarmerSummary)
-async def get_summary():
-    # For V2 demo, we assume single farmer (ID 1)
-    # In real app, getting from auth token
-    with db.get_connection() as conn:
-        farmer = conn.execute("SELECT * FROM farmers WHERE id = 1").fetchone()
-        if not farmer:
-            # Trigger seed if not found (just in case)
-            db.seed_data(conn)
-            farmer = conn.execute("SELECT * FROM farmers WHERE id = 1").fetchone()
-            
-        # Calc stats
-        loans = conn.execute("SELECT * FROM loan_requests WHERE farm_id IN (SELECT id FROM farms WHERE farmer_id = 1)").fetchall()
-        
-        active_loans = [l for l in loans if l['status'] == 'active']
-        active_credits = len(active_loans)
-        
-        total_debt = sum(l['amount'] for l in active_loans)
-        
-        # Calc total paid
-        total_paid = 0
-        for loan in active_loans:
-            paid_res = conn.execute("SELECT SUM(amount) as total FROM payments WHERE loan_id = ?", (loan['id'],)).fetchone()
-            total_paid += (paid_res['total'] or 0)
-            
-        return FarmerSummary(
-            total_debt=total_debt,
-            active_credits=active_credits,
-            credit_score=farmer['credit_score'],
-            total_paid=total_paid
-        )
+async def get_summary(farmer: Identity = Depends(current_farmer)):
+    return await cached(farmer.farmer_id, "summary", lambda: _build_summary(farmer))
+
+async def _build_summary(identity):
+    farmer, balances = await adb.run(repo.get_summary_rows, identity)
+    if not farmer:
+        raise HTTPException(status_code=404, detail="Farmer not found")
+
+    return FarmerSummary(
+        total_debt=sum(b.amount for b in balances),
+        active_credits=len(balances),
+        credit_score=farmer['credit_score'],
+        total_paid=sum(b.paid for b in balances)
+    )
+
+def _loan_from_balance(balance):
+    return Loan(
+        id=balance.loan_id,
+        amount=balance.amount,
+        remaining=balance.remaining,
+        rate=balance.rate,
+        term_months=balance.term_months,
+        status=balance.status,
+        paid=balance.paid,
+        progress=balance.progress,
+        next_payment=balance.monthly,
+        due_date=balance.due_date,
+        arrears=balance.arrears
+    )
+
+# Loan fields and the LoanBalance attributes they are read from
+LOAN_FIELDS = tuple(Loan.model_fields)
+LOAN_ATTRIBUTES = tuple({"id": "loan_id", "next_payment": "monthly"}.get(f, f) for f in LOAN_FIELDS)
 
 @router.get("/loans", response_model=List[Loan])
-async def get_loans():
-    loans_list = []
-    with db.get_connection() as conn:
-        # Get active loans for farmer 1
-        loans = conn.execute("""
-            SELECT lr.* 
-            FROM loan_requests lr
-            JOIN farms f ON lr.farm_id = f.id
-            WHERE f.farmer_id = 1 AND lr.status IN ('active', 'pending', 'waiting_signature')
-        """).fetchall()
-        
-        for loan in loans:
-            paid_res = conn.execute("SELECT SUM(amount) as total FROM payments WHERE loan_id = ?", (loan['id'],)).fetchone()
-            paid = paid_res['total'] or 0
-            
-            # Simple interest calculation for demo: 12% annual
-            interest = loan['amount'] * 0.12 * (loan['term_months'] / 12)
-            total_repayment = loan['amount'] + interest
-            remaining = total_repayment - paid
-            
-            progress = int((paid / total_repayment) * 100) if total_repayment > 0 else 0
-            monthly = total_repayment / loan['term_months']
-            
-            # Simulated due date
-            due_date = "15.06.2024" 
-            
-            # For pending loans, everything is 0/mock
-            if loan['status'] == 'pending':
-                remaining = total_repayment
-                paid = 0
-                progress = 0
-                due_date = "-"
-            
-            loans_list.append(Loan(
-                id=loan['id'],
-                amount=loan['amount'],
-                remaining=round(remaining, 2),
-                rate=12.0,
-                term_months=loan['term_months'],
-                status=loan['status'],
-                paid=paid,
-                progress=progress,
-                next_payment=round(monthly, 2),
-                due_date=due_date
-            ))
-            
-    return loans_list
+async def get_loans(include_history: bool = False, farmer: Identity = Depends(current_farmer)):
+    # include_history adds paid-off loans, archived ones included
+    balances = await adb.run(repo.get_open_loans, farmer, include_history)
+    # Computed from our own rows: encoded directly, without Loan models
+    return FastJSONResponse(map_objects(balances, LOAN_FIELDS, LOAN_ATTRIBUTES))
+
+@router.get("/loans/{loan_id}/schedule", response_model=List[Installment])
+async def get_loan_schedule(loan_id: int, farmer: Identity = Depends(current_farmer)):
+    rows = await adb.run(repo.get_schedule, farmer, loan_id)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    return FastJSONResponse(map_rows(rows, Installment.model_fields))
 
 @router.post("/loans", response_model=Loan)
-async def create_loan(loan_data: LoanCreate):
-    with db.get_connection() as conn:
-        # Get farm
-        farm = conn.execute("SELECT id FROM farms WHERE farmer_id = 1").fetchone()
-        if not farm:
-            raise HTTPException(status_code=404, detail="Farm not found")
-            
-        # Insert
-        cursor = conn.execute("""
-            INSERT INTO loan_requests (farm_id, amount, term_months, purpose, status)
-            VALUES (?, ?, ?, ?, 'pending')
-        """, (farm['id'], loan_data.amount, loan_data.term_months, loan_data.purpose))
-        loan_id = cursor.lastrowid
-        
-        # Return mock loan object
-        monthly = (loan_data.amount + (loan_data.amount * 0.12 * (loan_data.term_months/12))) / loan_data.term_months
-        
-        return Loan(
-            id=loan_id,
-            amount=loan_data.amount,
-            remaining=loan_data.amount + (loan_data.amount * 0.12 * (loan_data.term_months/12)),
-            rate=12.0,
-            term_months=loan_data.term_months,
-            status='pending',
-            paid=0,
-            progress=0,
-            next_payment=round(monthly, 2),
-            due_date="-"
-        )
+async def create_loan(loan_data: LoanCreate, farmer: Identity = Depends(current_farmer)):
+    loan_id = await adb.run(repo.create_loan, farmer, loan_data.amount, loan_data.term_months, loan_data.purpose)
+    if loan_id is None:
+        raise HTTPException(status_code=404, detail="Farm not found")
+
+    bus.publish(farmer_topic(farmer.farmer_id), {"type": "loan.created", "loan_id": loan_id, "status": "pending"})
+
+    balance = balance_for({
+        'id': loan_id,
+        'amount': loan_data.amount,
+        'term_months': loan_data.term_months,
+        'status': 'pending',
+    }, 0)
+    return _loan_from_balance(balance)
 
 @router.get("/utilities", response_model=List[UtilityReading])
-async def get_utilities():
-    readings = []
-    with db.get_connection() as conn:
-        rows = conn.execute("""
-            SELECT * FROM utility_readings 
-            WHERE farm_id IN (SELECT id FROM farms WHERE farmer_id = 1)
-        """).fetchall()
-        
-        for row in rows:
-            readings.append(UtilityReading(
-                type=row['utility_type'],
-                value=row['reading_value'],
-                unit=row['unit'],
-                diff=100 # Mock diff for now
-            ))
-    return readings
+async def get_utilities(farmer: Identity = Depends(current_farmer)):
+    return await cached(farmer.farmer_id, "utilities", lambda: _build_utilities(farmer))
+
+async def _build_utilities(identity):
+    rows = await adb.run(repo.get_utility_readings, identity)
+    return map_rows(rows, UtilityReading.model_fields)
+
+@router.post("/utilities/readings")
+async def add_utility_readings(readings: List[UtilityReadingIn], farmer: Identity = Depends(current_farmer)):
+    rows = []
+    for reading in readings:
+        unit = reading.unit or timeseries.UTILITY_UNITS.get(reading.type)
+        if unit is None:
+            raise HTTPException(status_code=400, detail=f"Unknown utility type {reading.type}")
+        try:
+            ts = timeseries.normalize_timestamp(reading.reading_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="reading_date must be an ISO date or datetime")
+        rows.append((reading.farm_id, reading.type, reading.value, unit, ts))
+
+    stored = await adb.run(repo.add_utility_readings, farmer, rows)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Farm not found")
+    if stored:
+        bus.publish(farmer_topic(farmer.farmer_id), {"type": "utilities.readings", "count": stored})
+    return {"stored": stored}
+
+@router.get("/utilities/history", response_model=UtilityHistory)
+async def get_utility_history(
+    type: str,
+    start: str,
+    end: str,
+    max_points: int = Query(timeseries.DEFAULT_MAX_POINTS, ge=1, le=2000),
+    bucket: Optional[str] = Query(None, pattern="^(day|month)$"),
+    farmer: Identity = Depends(current_farmer),
+):
+    try:
+        start, end = timeseries.normalize_timestamp(start), timeseries.normalize_timestamp(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates or datetimes")
+    bucket, points = await adb.run(repo.get_utility_history, farmer, type, start, end, max_points, bucket)
+    # Points are built in the UtilityPoint shape by timeseries.range_query
+    return FastJSONResponse({"type": type, "bucket": bucket, "points": points})
 
 @router.get("/recommendations/latest", response_model=Recommendation)
-async def get_latest_recommendation():
-    with db.get_connection() as conn:
-        row = conn.execute("""
-            SELECT * FROM recommendations 
-            WHERE farm_id IN (SELECT id FROM farms WHERE farmer_id = 1)
-            ORDER BY created_at DESC LIMIT 1
-        """).fetchone()
-        
-        if row:
-            return Recommendation(
-                title=row['title'],
-                message=row['message'],
-                type=row['type'] or "general"
-            )
-        return Recommendation(title="No Recommendations", message="Everything looks great!", type="general")
+async def get_latest_recommendation(farmer: Identity = Depends(current_farmer)):
+    return await cached(farmer.farmer_id, "recommendations_latest", lambda: _build_latest_recommendation(farmer))
+
+async def _build_latest_recommendation(identity):
+    row = await adb.run(repo.get_latest_recommendation, identity)
+    if row:
+        return Recommendation(
+            title=row['title'],
+            message=row['message'],
+            type=row['type'] or "general"
+        )
+    return Recommendation(title="No Recommendations", message="Everything looks great!", type="general")
 
 @router.post("/loans/{loan_id}/sign")
-async def sign_loan(loan_id: int):
-    with db.get_connection() as conn:
-        # Verify loan exists and is in correct status
-        loan = conn.execute("SELECT * FROM loan_requests WHERE id = ?", (loan_id,)).fetchone()
-        if not loan:
-            raise HTTPException(status_code=404, detail="Loan not found")
-        
-        if loan['status'] != 'waiting_signature':
-            raise HTTPException(status_code=400, detail="Loan is not ready for signature")
-            
-        # Update status to active
-        conn.execute("UPDATE loan_requests SET status = 'active' WHERE id = ?", (loan_id,))
-        conn.commit()
-        
-        return {"message": "Contract signed successfully", "status": "active"}
+async def sign_loan(loan_id: int, version: Optional[int] = None, farmer: Identity = Depends(current_farmer)):
+    loan = await adb.run(repo.sign_loan, loan_id, version, farmer)
+
+    bus.publish(farmer_topic(loan['farmer_id']), {"type": "loan.signed", "loan_id": loan_id, "status": "active"})
+
+    return {"message": "Contract signed successfully", "status": "active", "version": loan['version']}
+
+async def _load_notifications(identity):
+    # Rows written by the notifications job (services/notifications.py)
+    return await adb.run(repo.get_notifications, identity)
 
 @router.get("/notifications")
-async def get_notifications():
-    notifications = []
-    with db.get_connection() as conn:
-        # Check for loans waiting signature
-        pending_sign = conn.execute("""
-            SELECT lr.*, f.name as farm_name 
-            FROM loan_requests lr
-            JOIN farms f ON lr.farm_id = f.id
-            WHERE f.farmer_id = 1 AND lr.status = 'waiting_signature'
-        """).fetchall()
-        
-        for loan in pending_sign:
-            notifications.append({
-                "id": f"sign_{loan['id']}",
-                "title": "Action Required",
-                "message": f"Loan application for ${loan['amount']:,.0f} approved! Please sign the contract.",
-                "type": "alert",
-                "link": "/farmer/loans"
-            })
-            
-        # Check active loans
-        active = conn.execute("""
-             SELECT lr.* 
-             FROM loan_requests lr
-             JOIN farms f ON lr.farm_id = f.id
-             WHERE f.farmer_id = 1 AND lr.status = 'active'
-        """).fetchall()
-        
-        if active:
-             notifications.append({
-                "id": "active_summary",
-                "title": "Monthly Update",
-                "message": f"You have {len(active)} active credits. Next payment due in 15 days.",
-                "type": "info",
-                "link": "/farmer/loans"
-            })
-            
+async def get_notifications(request: Request, farmer: Identity = Depends(current_farmer)):
+    # The ETag is the farmer's event version, so an unchanged poll is
+    # answered with 304 before any query runs
+    topic = farmer_topic(farmer.farmer_id)
+    etag = bus.etag(topic)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    notifications = await _load_notifications(farmer)
+    return FastJSONResponse(notifications, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/notifications/stream")
+async def stream_notifications(request: Request, farmer: Identity = Depends(current_farmer)):
+    """Server-sent events: the current notifications on connect, then again
+    whenever a loan of this farmer changes state."""
+    topic = farmer_topic(farmer.farmer_id)
+
+    async def events():
+        async with bus.subscribe(topic) as queue:
+            while True:
+                notifications = await _load_notifications(farmer)
+                yield f"event: notifications\ndata: {dumps(notifications).decode()}\n\n"
+                while True:
+                    try:
+                        await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                        break
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keep-alive\n\n"
+                # Collapse a burst of events into one reload
+                while not queue.empty():
+                    queue.get_nowait()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/loans/{loan_id}/pay")
-async def make_payment(loan_id: int, payment: Dict[str, float]):
+async def make_payment(
+    loan_id: int,
+    payment: Dict[str, float],
+    idempotency_key: Optional[str] = Header(None),
+    farmer: Identity = Depends(current_farmer),
+):
     amount = payment.get('amount', 0)
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Invalid payment amount")
 
-    with db.get_connection() as conn:
-        # Verify loan
-        loan = conn.execute("SELECT * FROM loan_requests WHERE id = ?", (loan_id,)).fetchone()
-        if not loan or loan['status'] != 'active':
-             raise HTTPException(status_code=400, detail="Loan not active or found")
-
-        # Record payment
-        conn.execute("INSERT INTO payments (loan_id, amount, payment_date) VALUES (?, ?, CURRENT_DATE)", 
-                     (loan_id, amount))
-        
-        # Check if fully paid
-        paid_res = conn.execute("SELECT SUM(amount) as total FROM payments WHERE loan_id = ?", (loan_id,)).fetchone()
-        total_paid = paid_res['total'] or 0
-        
-        # Recalculate total repayment (same logic as in get_loans)
-        interest = loan['amount'] * 0.12 * (loan['term_months'] / 12)
-        total_repayment = loan['amount'] + interest
-        
-        if total_paid >= total_repayment - 0.01: # Small epsilon for float comparison
-            # Fully paid - delete loan and payments
-            conn.execute("DELETE FROM payments WHERE loan_id = ?", (loan_id,))
-            conn.execute("DELETE FROM loan_requests WHERE id = ?", (loan_id,))
-            
-        conn.commit()
-        
-        return {"message": "Payment successful"}
+    loan, result = await adb.run(repo.record_payment, loan_id, amount, idempotency_key, farmer)
+    if result['status'] == 'rejected':
+        raise HTTPException(status_code=400, detail=result['error'])
+
+    if result['status'] != 'duplicate':
+        paid_off = result['status'] == 'paid_off'
+        bus.publish(farmer_topic(loan['farmer_id']), {
+            "type": "loan.paid_off" if paid_off else "loan.payment",
+            "loan_id": loan_id,
+            "status": "paid_off" if paid_off else "active",
+        })
+
+    return {"message": "Payment successful"}
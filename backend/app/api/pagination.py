@@ -0,0 +1,30 @@
+import base64
+import json
+from fastapi import HTTPException
+
+# Keyset cursors are opaque to clients: base64url JSON of the last row's
+# sort key plus the sort they were issued for, so a cursor can't be
+# replayed against a different ordering.
+
+def encode_cursor(sort, key):
+    raw = json.dumps([sort, list(key)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor, sort, lengths=(2,)):
+    """The key tuple of a cursor issued for `sort`; 400 if it is not one of
+    ours. `lengths` are the key sizes the caller issues."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        issued_for, key = json.loads(base64.urlsafe_b64decode(padded))
+        # Well-formed base64 JSON is not enough: the key is bound as SQL
+        # parameters, so it must be a list of scalars of a size we issue
+        if not isinstance(key, list) or len(key) not in lengths:
+            raise ValueError("unexpected cursor key")
+        if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in key):
+            raise ValueError("unexpected cursor key")
+        key = tuple(key)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if issued_for != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+    return key
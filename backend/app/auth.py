@@ -0,0 +1,212 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import Header, HTTPException, Query
+from jose import JWTError, jwt
+
+from .cache import CacheStats
+from .db.database import adb
+from .repositories import farmers as repo
+
+# Farmer identity for the farmer portal. Requests carry a JWT whose `sub`
+# is the farmer id; `current_farmer` decodes it once per request and
+# resolves the farmer's farm ids through a short-TTL LRU, so repository
+# queries take `farm_id IN (...)` parameters instead of re-running a
+# farms subquery in every statement.
+
+# Requests without a token act as this farmer when set (the demo frontend
+# has no login yet); unset, they get a 401
+DEMO_FARMER_ID = os.environ.get("AGROCREDIT_DEMO_FARMER_ID")
+# Tokens are only verified against a configured secret. Demo mode may run
+# without one, and then accepts no tokens at all.
+JWT_SECRET = os.environ.get("AGROCREDIT_JWT_SECRET") or None
+JWT_ALGORITHM = os.environ.get("AGROCREDIT_JWT_ALGORITHM", "HS256")
+# Role claim of operator tokens (require_admin)
+ADMIN_ROLE = "admin"
+# Lifetime of tokens minted by create_token
+TOKEN_TTL = int(os.environ.get("AGROCREDIT_JWT_TTL", str(12 * 3600)))
+
+
+def check_settings():
+    """Refuse to start without a signing secret outside demo mode (run in
+    the app lifespan)."""
+    if JWT_SECRET is None and DEMO_FARMER_ID is None:
+        raise RuntimeError(
+            "AGROCREDIT_JWT_SECRET is not set; set it, or set AGROCREDIT_DEMO_FARMER_ID to run in demo mode"
+        )
+
+
+@dataclass(frozen=True)
+class Identity:
+    farmer_id: int
+    farm_ids: Tuple[int, ...]  # ascending; the first is the default farm
+
+
+class FarmIdCache:
+    """Farmer id -> farm ids, LRU-bounded with a TTL.
+
+    Farms are only created by seeding and data loads, so a short TTL is
+    enough to pick them up; `invalidate` drops one farmer immediately.
+    """
+
+    def __init__(self, max_entries=100_000, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # farmer_id -> (expires_at, farm_ids)
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, farmer_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(farmer_id)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            expires_at, farm_ids = entry
+            if expires_at <= now:
+                del self._entries[farmer_id]
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(farmer_id)
+            self._stats.hits += 1
+            return farm_ids
+
+    def set(self, farmer_id, farm_ids):
+        with self._lock:
+            self._entries.pop(farmer_id, None)
+            self._entries[farmer_id] = (time.monotonic() + self.ttl, farm_ids)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate(self, farmer_id=None):
+        """Drop one farmer, or everyone when farmer_id is None."""
+        with self._lock:
+            if farmer_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(farmer_id, None)
+            self._stats.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl,
+                    **self._stats.as_dict()}
+
+
+farm_ids_cache = FarmIdCache(
+    max_entries=int(os.environ.get("AGROCREDIT_IDENTITY_CACHE_SIZE", "100000")),
+    ttl=float(os.environ.get("AGROCREDIT_IDENTITY_TTL", "30")),
+)
+
+
+def create_token(subject, ttl=None, role=None):
+    """Farmer token for `subject` (a farmer id), or an operator token with `role`."""
+    if JWT_SECRET is None:
+        raise RuntimeError("AGROCREDIT_JWT_SECRET is not set; tokens cannot be signed without it")
+    now = int(time.time())
+    claims = {"sub": str(subject), "iat": now, "exp": now + (TOKEN_TTL if ttl is None else ttl)}
+    if role is not None:
+        claims["role"] = role
+    return jwt.encode(claims, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def decode_claims(token):
+    """Verified claims of a token; raises ValueError if invalid or expired."""
+    if JWT_SECRET is None:
+        raise ValueError("invalid token: no signing secret configured")
+    try:
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except JWTError as exc:
+        raise ValueError(f"invalid token: {exc}") from exc
+
+
+def decode_token(token):
+    """Farmer id from a token; raises ValueError if invalid or expired."""
+    claims = decode_claims(token)
+    try:
+        return int(claims["sub"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"invalid token: {exc}") from exc
+
+
+def _unauthorized(detail):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def _bearer(authorization):
+    # Token of an `Authorization: Bearer ...` header, None without one
+    if not authorization:
+        return None
+    scheme, _, credentials = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not credentials:
+        raise _unauthorized("Authorization must be a Bearer token")
+    return credentials
+
+
+async def identity_for(farmer_id):
+    farm_ids = farm_ids_cache.get(farmer_id)
+    if farm_ids is None:
+        farm_ids = await adb.run(repo.get_farm_ids, farmer_id)
+        farm_ids_cache.set(farmer_id, farm_ids)
+    return Identity(farmer_id, farm_ids)
+
+
+async def current_farmer(
+    authorization: Optional[str] = Header(None),
+    access_token: Optional[str] = Query(None, include_in_schema=False),
+):
+    """Dependency: the requesting farmer's Identity.
+
+    The token comes from `Authorization: Bearer ...`, or from the
+    `access_token` query parameter for EventSource clients, which cannot
+    set headers. In demo mode without a secret, requests act as the demo
+    farmer and any token gets a 401: there is nothing to verify it with.
+    """
+    token = _bearer(authorization) or access_token
+    if token is None:
+        if DEMO_FARMER_ID is None:
+            raise _unauthorized("Not authenticated")
+        return await identity_for(int(DEMO_FARMER_ID))
+    try:
+        farmer_id = decode_token(token)
+    except ValueError:
+        raise _unauthorized("Invalid or expired token")
+    return await identity_for(farmer_id)
+
+
+async def require_admin(authorization: Optional[str] = Header(None)):
+    """Dependency for operations endpoints (jobs, compaction, archiving,
+    portfolio recompute): a bearer token with role "admin".
+
+    Demo mode does not apply here; farmer tokens get a 403, and without a
+    configured AGROCREDIT_JWT_SECRET every request gets a 503.
+    """
+    if JWT_SECRET is None:
+        raise HTTPException(status_code=503, detail="Operations endpoints need AGROCREDIT_JWT_SECRET")
+    token = _bearer(authorization)
+    if token is None:
+        raise _unauthorized("Not authenticated")
+    try:
+        claims = decode_claims(token)
+    except ValueError:
+        raise _unauthorized("Invalid or expired token")
+    if claims.get("role") != ADMIN_ROLE:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    return claims.get("sub")
+
+
+if __name__ == "__main__":
+    # Mint a token for local use: python -m app.auth <farmer_id>, or
+    # python -m app.auth --admin <operator name>
+    if sys.argv[1] == "--admin":
+        print(create_token(sys.argv[2] if len(sys.argv) > 2 else "admin", role=ADMIN_ROLE))
+    else:
+        print(create_token(int(sys.argv[1])))
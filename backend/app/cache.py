@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from .events import bus
+
+# Response cache for read-mostly endpoints. Values are serialized response
+# bodies (bytes), so memory accounting is exact. Keys are scoped
+# "<scope>:<name>" (e.g. "farmer:1:summary") and whole scopes are dropped
+# when the event bus reports a write for them.
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class CacheBackend:
+    """Interface for response cache stores."""
+
+    def get(self, key):
+        """Return the cached bytes or None."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def invalidate_scope(self, scope):
+        """Drop every key starting with "<scope>:"."""
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """In-process TTL + LRU cache bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=10_000, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                self._remove(key)
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats.evictions += 1
+
+    def invalidate_scope(self, scope):
+        prefix = scope + ":"
+        with self._lock:
+            doomed = [key for key in self._entries if key.startswith(prefix)]
+            for key in doomed:
+                self._remove(key)
+            self._stats.invalidations += len(doomed)
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self):
+        with self._lock:
+            data = self._stats.as_dict()
+            data.update(backend="memory", entries=len(self._entries), bytes=self._bytes)
+        return data
+
+
+class SQLiteCache(CacheBackend):
+    """Local shared store: one SQLite file used by every worker on the host.
+
+    A stand-in for an external cache in multi-worker deployments, so an
+    invalidation in one worker is seen by all of them. Counters are per
+    process.
+    """
+
+    # Bound enforcement costs a COUNT(*), so it runs every N writes
+    PRUNE_EVERY = 128
+
+    def __init__(self, path, max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing the cache on crash is fine
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self._stats, name, getattr(self._stats, name) + n)
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        if row[1] <= time.time():
+            self._count("expirations")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return row[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            if not prune:
+                return
+            # Expired entries first, then oldest-expiring, once over the bound
+            removed = conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            over = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if over > 0:
+                removed += conn.execute("""
+                    DELETE FROM response_cache WHERE key IN (
+                        SELECT key FROM response_cache ORDER BY expires_at LIMIT ?
+                    )
+                """, (over,)).rowcount
+        if removed:
+            self._count("evictions", removed)
+
+    def invalidate_scope(self, scope):
+        # Key range scan on the primary key: [scope + ":", scope + ";")
+        with self._conn() as conn:
+            removed = conn.execute(
+                "DELETE FROM response_cache WHERE key >= ? AND key < ?", (scope + ":", scope + ";")
+            ).rowcount
+        self._count("invalidations", removed)
+
+    def stats(self):
+        with self._lock:
+            data = self._stats.as_dict()
+        entries = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM response_cache").fetchone()
+        data.update(backend="sqlite", entries=entries[0], bytes=entries[1])
+        return data
+
+
+class ResponseCache:
+    """Front for a CacheBackend with a default TTL and an on/off switch."""
+
+    def __init__(self, backend, ttl=30.0, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+
+    def get(self, key):
+        return self.backend.get(key) if self.enabled else None
+
+    def set(self, key, value, ttl=None):
+        if self.enabled:
+            self.backend.set(key, value, self.ttl if ttl is None else ttl)
+
+    def invalidate_scope(self, scope):
+        self.backend.invalidate_scope(scope)
+
+    def on_event(self, topic, event):
+        # Event-bus listener: a write for a topic drops that topic's scope
+        self.invalidate_scope(topic)
+
+    def stats(self):
+        data = self.backend.stats()
+        data.update(enabled=self.enabled, ttl=self.ttl)
+        return data
+
+
+def cache_from_env():
+    env = os.environ
+    if env.get("AGROCREDIT_CACHE_BACKEND", "memory") == "sqlite":
+        default_path = os.path.join(os.path.dirname(__file__), "..", "data", "response_cache.db")
+        backend = SQLiteCache(env.get("AGROCREDIT_CACHE_PATH", default_path))
+    else:
+        backend = MemoryCache(max_bytes=int(env.get("AGROCREDIT_CACHE_MAX_BYTES", 32 * 1024 * 1024)))
+    return ResponseCache(
+        backend,
+        ttl=float(env.get("AGROCREDIT_CACHE_TTL", "30")),
+        enabled=env.get("AGROCREDIT_CACHE_ENABLED", "1") != "0",
+    )
+
+
+response_cache = cache_from_env()
+bus.add_listener(response_cache.on_event)
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from .events import bus
+
+# Request coalescing ("single flight") for read endpoints that many clients
+# poll at once (the bank dashboard and application queue). Concurrent
+# requests with the same key share one computation: the first becomes the
+# leader and runs the build, the others await its result. A finished body
+# may also be reused for `reuse` seconds, so a burst arriving just after it
+# completed does not start another one.
+#
+# Keys are "<auth scope>:<route>?<params>". Results are serialized response
+# bodies (bytes). Any publish on the event bus drops reusable results and
+# detaches in-flight builds, so a request that starts after a write never
+# gets a body computed before it. Errors reach every waiter of that flight
+# and are never reused.
+
+
+class KeyStats:
+    def __init__(self):
+        self.requests = 0
+        self.computed = 0  # led a flight (ran the build)
+        self.coalesced = 0  # joined a flight in progress
+        self.reused = 0  # served a result finished within the reuse window
+        self.errors = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class SingleFlight:
+    def __init__(self, reuse=0.25, enabled=True, max_keys=256):
+        self.reuse = reuse
+        self.enabled = enabled
+        self.max_keys = max_keys
+        self._inflight = {}  # key -> task
+        self._results = OrderedDict()  # key -> (expires, body), oldest first
+        self._generation = 0
+        self._keys = OrderedDict()  # key -> KeyStats, LRU-bounded
+        self.totals = KeyStats()
+        self.invalidations = 0
+
+    def _key_stats(self, key):
+        stats = self._keys.get(key)
+        if stats is None:
+            stats = self._keys[key] = KeyStats()
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(key)
+        return stats
+
+    def _count(self, stats, name):
+        setattr(stats, name, getattr(stats, name) + 1)
+        setattr(self.totals, name, getattr(self.totals, name) + 1)
+
+    async def do(self, key, build):
+        """Return the body of `build()` (an async callable returning bytes),
+        shared with concurrent callers of the same key."""
+        if not self.enabled:
+            return await build()
+        stats = self._key_stats(key)
+        self._count(stats, "requests")
+
+        entry = self._results.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._count(stats, "reused")
+                return entry[1]
+            del self._results[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._count(stats, "computed")
+            # A task of its own: a leader whose client disconnects must not
+            # fail the requests waiting on it. It inherits the leader's
+            # context, so its statements count towards the leader's request.
+            task = asyncio.ensure_future(self._lead(key, build, self._generation, stats))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._landed(key, done))
+        else:
+            self._count(stats, "coalesced")
+        return await asyncio.shield(task)
+
+    async def _lead(self, key, build, generation, stats):
+        try:
+            body = await build()
+        except Exception:
+            self._count(stats, "errors")
+            raise
+        # Not stored if a write came in while it was being built
+        if self.reuse > 0 and generation == self._generation:
+            self._store(key, body)
+        return body
+
+    def _store(self, key, body):
+        now = time.monotonic()
+        self._results.pop(key, None)
+        self._results[key] = (now + self.reuse, body)
+        # Same window for every key, so the oldest entries expire first
+        while self._results:
+            oldest = next(iter(self._results.values()))
+            if oldest[0] > now:
+                break
+            self._results.popitem(last=False)
+
+    def _landed(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the error retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def invalidate(self):
+        self._generation += 1
+        self._results.clear()
+        self._inflight.clear()
+        self.invalidations += 1
+
+    def on_event(self, topic, event):
+        # Event-bus listener: bank reads aggregate every farmer, so any
+        # write makes them stale
+        self.invalidate()
+
+    def stats(self):
+        data = self.totals.as_dict()
+        data.update(
+            enabled=self.enabled,
+            reuse_ms=round(self.reuse * 1000, 3),
+            in_flight=len(self._inflight),
+            reusable=len(self._results),
+            invalidations=self.invalidations,
+            keys={key: stats.as_dict() for key, stats in self._keys.items()},
+        )
+        return data
+
+
+def single_flight_from_env():
+    env = os.environ
+    return SingleFlight(
+        reuse=float(env.get("AGROCREDIT_COALESCE_REUSE_MS", "250")) / 1000,
+        enabled=env.get("AGROCREDIT_COALESCE_ENABLED", "1") != "0",
+        max_keys=int(env.get("AGROCREDIT_COALESCE_STATS_KEYS", "256")),
+    )
+
+
+single_flight = single_flight_from_env()
+bus.add_listener(single_flight.on_event)
@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class AsyncDatabase:
+    """Runs blocking sqlite3 work off the event loop.
+
+    Every call checks out a pooled connection on a worker thread, so the
+    executor is sized to the pool and never queues on pool checkout.
+    """
+
+    def __init__(self, manager, max_workers=None, default_timeout=None):
+        self.manager = manager
+        self.max_workers = max_workers or manager.pool.settings.max_size
+        self.default_timeout = default_timeout if default_timeout is not None else float(
+            os.environ.get("AGROCREDIT_DB_QUERY_TIMEOUT", "10")
+        )
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+        return self._executor
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Call fn(conn, *args, **kwargs) on a worker thread inside one transaction."""
+        holder = {}
+
+        def work():
+            with self.manager.get_connection() as conn:
+                holder["conn"] = conn
+                try:
+                    return fn(conn, *args, **kwargs)
+                finally:
+                    holder.pop("conn", None)
+
+        loop = asyncio.get_running_loop()
+        # Copy the caller's context so request-scoped contextvars are visible in the worker
+        ctx = contextvars.copy_context()
+        future = loop.run_in_executor(self.executor, partial(ctx.run, work))
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            # Abort the running statement; the worker's transaction rolls back
+            conn = holder.get("conn")
+            if conn is not None:
+                conn.interrupt()
+            future.add_done_callback(_consume_result)
+            raise QueryTimeout(f"Query exceeded {timeout}s")
+
+    async def fetchone(self, sql, params=(), timeout=None):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone(), timeout=timeout)
+
+    async def fetchall(self, sql, params=(), timeout=None):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall(), timeout=timeout)
+
+    async def execute(self, sql, params=(), timeout=None):
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount, timeout=timeout)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def _consume_result(future):
+    # Retrieve the abandoned worker's outcome so asyncio doesn't warn about it
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,644 @@
+import sqlite3
+import time
+
+# Ordered schema migrations. Each entry is (version, name, steps) where a
+# step is a SQL string or a callable taking the connection. Steps must be
+# idempotent (IF NOT EXISTS etc.) so a half-applied migration can re-run.
+
+
+def _base_schema(conn):
+    # Farmers Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS farmers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL, -- Used as ID
+            full_name TEXT NOT NULL,
+            credit_score INTEGER DEFAULT 0
+        )
+    """)
+
+    # Farms Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS farms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            farmer_id INTEGER NOT NULL,
+            name TEXT,
+            size_acres REAL,
+            FOREIGN KEY (farmer_id) REFERENCES farmers(id)
+        )
+    """)
+
+    # Loan Requests (Applications)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS loan_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            farm_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            term_months INTEGER NOT NULL,
+            purpose TEXT,
+            status TEXT DEFAULT 'pending', -- pending, approved, rejected, active, paid_off
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (farm_id) REFERENCES farms(id)
+        )
+    """)
+
+    # Payments (NEW)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (loan_id) REFERENCES loan_requests(id)
+        )
+    """)
+
+    # Utility Readings (NEW)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS utility_readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            farm_id INTEGER NOT NULL,
+            utility_type TEXT NOT NULL, -- electricity, water, gas
+            reading_value REAL NOT NULL,
+            unit TEXT NOT NULL,
+            reading_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (farm_id) REFERENCES farms(id)
+        )
+    """)
+
+    # Recommendations (NEW)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            farm_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            type TEXT, -- irrigation, pest, general
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (farm_id) REFERENCES farms(id)
+        )
+    """)
+
+
+def _portfolio_stats(conn):
+    # Per-status loan counts and amounts, kept current by triggers in the
+    # same transaction as the loan write so the dashboard is an O(1) read
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS portfolio_stats (
+            status TEXT PRIMARY KEY,
+            loan_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_portfolio_stats_insert AFTER INSERT ON loan_requests
+        BEGIN
+            INSERT INTO portfolio_stats (status, loan_count, total_amount) VALUES (NEW.status, 1, NEW.amount)
+            ON CONFLICT(status) DO UPDATE SET
+                loan_count = loan_count + 1,
+                total_amount = total_amount + excluded.total_amount;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_portfolio_stats_delete AFTER DELETE ON loan_requests
+        BEGIN
+            UPDATE portfolio_stats SET
+                loan_count = loan_count - 1,
+                total_amount = total_amount - OLD.amount
+            WHERE status = OLD.status;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_portfolio_stats_update AFTER UPDATE OF status, amount ON loan_requests
+        WHEN OLD.status IS NOT NEW.status OR OLD.amount IS NOT NEW.amount
+        BEGIN
+            UPDATE portfolio_stats SET
+                loan_count = loan_count - 1,
+                total_amount = total_amount - OLD.amount
+            WHERE status = OLD.status;
+            INSERT INTO portfolio_stats (status, loan_count, total_amount) VALUES (NEW.status, 1, NEW.amount)
+            ON CONFLICT(status) DO UPDATE SET
+                loan_count = loan_count + 1,
+                total_amount = total_amount + excluded.total_amount;
+        END
+    """)
+    # Backfill from the current loan book
+    conn.execute("DELETE FROM portfolio_stats")
+    conn.execute("""
+        INSERT INTO portfolio_stats (status, loan_count, total_amount)
+        SELECT status, COUNT(*), COALESCE(SUM(amount), 0) FROM loan_requests GROUP BY status
+    """)
+
+
+def _application_scores(conn):
+    # Stored risk analyses (see services/scoring.py), one per loan
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS application_scores (
+            loan_id INTEGER PRIMARY KEY,
+            model_version TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            analysis TEXT NOT NULL, -- JSON
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (loan_id) REFERENCES loan_requests(id)
+        )
+    """)
+    # Invalidate only when a scoring input changes
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_scores_loan_update
+        AFTER UPDATE OF amount, term_months, purpose, farm_id ON loan_requests
+        BEGIN
+            DELETE FROM application_scores WHERE loan_id = NEW.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_scores_loan_delete AFTER DELETE ON loan_requests
+        BEGIN
+            DELETE FROM application_scores WHERE loan_id = OLD.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_scores_credit_update AFTER UPDATE OF credit_score ON farmers
+        WHEN OLD.credit_score IS NOT NEW.credit_score
+        BEGIN
+            DELETE FROM application_scores WHERE loan_id IN (
+                SELECT lr.id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+                WHERE fa.farmer_id = NEW.id
+            );
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_scores_farm_update AFTER UPDATE OF size_acres ON farms
+        WHEN OLD.size_acres IS NOT NEW.size_acres
+        BEGIN
+            DELETE FROM application_scores WHERE loan_id IN (
+                SELECT id FROM loan_requests WHERE farm_id = NEW.id
+            );
+        END
+    """)
+
+
+def _utility_rollups(conn):
+    # Daily and monthly aggregates per farm and utility (services/timeseries.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS utility_rollups (
+            farm_id INTEGER NOT NULL,
+            utility_type TEXT NOT NULL,
+            period TEXT NOT NULL, -- day, month
+            period_start TEXT NOT NULL, -- YYYY-MM-DD
+            unit TEXT NOT NULL,
+            reading_count INTEGER NOT NULL,
+            value_min REAL NOT NULL,
+            value_max REAL NOT NULL,
+            value_sum REAL NOT NULL,
+            first_value REAL NOT NULL,
+            last_value REAL NOT NULL,
+            first_at TIMESTAMP NOT NULL,
+            last_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (farm_id, utility_type, period, period_start)
+        ) WITHOUT ROWID
+    """)
+    # Retention compaction deletes raw rows by age
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_utility_readings_date ON utility_readings (reading_date)")
+    from ..services.timeseries import rebuild_rollups
+    rebuild_rollups(conn)
+
+
+def _installments(conn):
+    # Per-loan terms (NULL = product defaults) and stored amortization
+    # schedules (services/amortization.py)
+    conn.execute("ALTER TABLE loan_requests ADD COLUMN annual_rate REAL")
+    conn.execute("ALTER TABLE loan_requests ADD COLUMN schedule_method TEXT")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS installments (
+            loan_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL, -- 1-based
+            due_date TEXT NOT NULL, -- YYYY-MM-DD
+            principal REAL NOT NULL,
+            interest REAL NOT NULL,
+            amount REAL NOT NULL,
+            cumulative REAL NOT NULL, -- total due through this installment
+            PRIMARY KEY (loan_id, seq)
+        ) WITHOUT ROWID
+    """)
+    # Active loans predate schedules: schedule them from their creation date
+    from ..services.amortization import backfill_schedules
+    backfill_schedules(conn)
+
+
+def _farmer_search(conn):
+    # Bank directory search (services/search.py): one FTS5 document per
+    # farmer plus per-farmer loan aggregates, both maintained by triggers
+    from ..services.search import RANK, REFRESH_DOCUMENT, rebuild
+
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS farmer_search USING fts5(
+            full_name, email, farms, purposes,
+            prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("INSERT INTO farmer_search (farmer_search, rank) VALUES ('rank', ?)", (RANK,))
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS farmer_search_vocab USING fts5vocab(farmer_search, 'row')")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS farmer_stats (
+            farmer_id INTEGER PRIMARY KEY,
+            loan_count INTEGER NOT NULL DEFAULT 0,
+            active_loans INTEGER NOT NULL DEFAULT 0,
+            active_debt REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+    def refresh(farmer):
+        return REFRESH_DOCUMENT.format(farmer=farmer)
+
+    old_farmer = "(SELECT farmer_id FROM farms WHERE id = OLD.farm_id)"
+    new_farmer = "(SELECT farmer_id FROM farms WHERE id = NEW.farm_id)"
+
+    def purpose_unique(row, farmer):
+        # Only a purpose the farmer has on no other loan changes the document
+        return f"""{row}.purpose IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+            WHERE fa.farmer_id = {farmer} AND lr.purpose = {row}.purpose AND lr.id != {row}.id
+        )"""
+
+    def adjust(row, sign):
+        return f"""
+            UPDATE farmer_stats SET
+                loan_count = loan_count {sign} 1,
+                active_loans = active_loans {sign} ({row}.status = 'active'),
+                active_debt = active_debt {sign} IIF({row}.status = 'active', {row}.amount, 0)
+            WHERE farmer_id = {old_farmer if row == "OLD" else new_farmer};
+        """
+
+    triggers = {
+        "trg_farmer_search_farmer_insert": f"""
+            AFTER INSERT ON farmers BEGIN
+                INSERT OR IGNORE INTO farmer_stats (farmer_id) VALUES (NEW.id);
+                {refresh("NEW.id")}
+            END""",
+        "trg_farmer_search_farmer_update": f"""
+            AFTER UPDATE OF full_name, email ON farmers
+            WHEN OLD.full_name IS NOT NEW.full_name OR OLD.email IS NOT NEW.email BEGIN
+                {refresh("NEW.id")}
+            END""",
+        "trg_farmer_search_farmer_delete": """
+            AFTER DELETE ON farmers BEGIN
+                DELETE FROM farmer_search WHERE rowid = OLD.id;
+                DELETE FROM farmer_stats WHERE farmer_id = OLD.id;
+            END""",
+        "trg_farmer_search_farm_insert": f"""
+            AFTER INSERT ON farms BEGIN
+                {refresh("NEW.farmer_id")}
+            END""",
+        "trg_farmer_search_farm_update": f"""
+            AFTER UPDATE OF name, farmer_id ON farms
+            WHEN OLD.name IS NOT NEW.name OR OLD.farmer_id IS NOT NEW.farmer_id BEGIN
+                {refresh("OLD.farmer_id")}
+                {refresh("NEW.farmer_id")}
+            END""",
+        "trg_farmer_search_farm_delete": f"""
+            AFTER DELETE ON farms BEGIN
+                {refresh("OLD.farmer_id")}
+            END""",
+        "trg_farmer_search_loan_insert": f"""
+            AFTER INSERT ON loan_requests WHEN {purpose_unique("NEW", new_farmer)} BEGIN
+                {refresh(new_farmer)}
+            END""",
+        "trg_farmer_search_loan_delete": f"""
+            AFTER DELETE ON loan_requests WHEN {purpose_unique("OLD", old_farmer)} BEGIN
+                {refresh(old_farmer)}
+            END""",
+        "trg_farmer_search_loan_update": f"""
+            AFTER UPDATE OF purpose, farm_id ON loan_requests
+            WHEN OLD.purpose IS NOT NEW.purpose OR OLD.farm_id IS NOT NEW.farm_id BEGIN
+                {refresh(old_farmer)}
+                {refresh(new_farmer)}
+            END""",
+        "trg_farmer_stats_loan_insert": f"""
+            AFTER INSERT ON loan_requests BEGIN
+                {adjust("NEW", "+")}
+            END""",
+        "trg_farmer_stats_loan_delete": f"""
+            AFTER DELETE ON loan_requests BEGIN
+                {adjust("OLD", "-")}
+            END""",
+        "trg_farmer_stats_loan_update": f"""
+            AFTER UPDATE OF status, amount, farm_id ON loan_requests
+            WHEN OLD.status IS NOT NEW.status OR OLD.amount IS NOT NEW.amount OR OLD.farm_id IS NOT NEW.farm_id
+            BEGIN
+                {adjust("OLD", "-")}
+                {adjust("NEW", "+")}
+            END""",
+    }
+    for name, body in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    # Backfill from the current farmers and loan book
+    rebuild(conn)
+
+
+def _background_jobs(conn):
+    # Scheduler bookkeeping and the rows its jobs maintain (app/scheduler.py,
+    # services/jobs.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            name TEXT PRIMARY KEY,
+            lease_owner TEXT, -- worker running it; NULL when free
+            lease_until REAL, -- epoch seconds
+            state TEXT, -- JSON, the job's watermark
+            last_started_at REAL,
+            last_finished_at REAL
+        )
+    """)
+    # Loans whose balance or status changed, appended by triggers; jobs
+    # keep a seq watermark and only look at newer rows
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS loan_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id INTEGER NOT NULL,
+            farmer_id INTEGER,
+            origin TEXT NOT NULL DEFAULT 'write' -- write (triggers) or overdue (the job)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loan_changes_farmer ON loan_changes (farmer_id, seq)")
+    farmer_of = "(SELECT farmer_id FROM farms WHERE id = {}.farm_id)"
+    triggers = {
+        "trg_loan_changes_insert": f"""
+            AFTER INSERT ON loan_requests BEGIN
+                INSERT INTO loan_changes (loan_id, farmer_id) VALUES (NEW.id, {farmer_of.format("NEW")});
+            END""",
+        "trg_loan_changes_update": f"""
+            AFTER UPDATE ON loan_requests BEGIN
+                INSERT INTO loan_changes (loan_id, farmer_id) VALUES (NEW.id, {farmer_of.format("NEW")});
+                INSERT INTO loan_changes (loan_id, farmer_id)
+                SELECT OLD.id, {farmer_of.format("OLD")} WHERE OLD.farm_id IS NOT NEW.farm_id;
+            END""",
+        "trg_loan_changes_delete": f"""
+            AFTER DELETE ON loan_requests BEGIN
+                INSERT INTO loan_changes (loan_id, farmer_id) VALUES (OLD.id, {farmer_of.format("OLD")});
+            END""",
+        "trg_loan_changes_payment": """
+            AFTER INSERT ON payments BEGIN
+                INSERT INTO loan_changes (loan_id, farmer_id)
+                SELECT NEW.loan_id, fa.farmer_id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+                WHERE lr.id = NEW.loan_id;
+            END""",
+    }
+    for name, body in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    # Next installment due date per active loan, kept by the overdue job
+    # (not on the write path) so it finds the loans falling due each day
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS loan_due_dates (
+            loan_id INTEGER PRIMARY KEY,
+            next_due TEXT NOT NULL -- YYYY-MM-DD
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loan_due_dates_due ON loan_due_dates (next_due)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS overdue_loans (
+            loan_id INTEGER PRIMARY KEY,
+            farmer_id INTEGER NOT NULL,
+            installments_overdue INTEGER NOT NULL,
+            amount_overdue REAL NOT NULL,
+            overdue_since TEXT NOT NULL, -- due date of the oldest unpaid installment
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_overdue_loans_farmer ON overdue_loans (farmer_id)")
+    # Precomputed notification lists (services/notifications.py); the state
+    # row records the loan_changes seq a farmer's list reflects
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS farmer_notifications (
+            farmer_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            notification_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            type TEXT NOT NULL,
+            link TEXT,
+            PRIMARY KEY (farmer_id, position)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS farmer_notification_state (
+            farmer_id INTEGER PRIMARY KEY,
+            change_seq INTEGER NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _farmer_scoped_idempotency(conn):
+    # Idempotency keys become per farmer (the loan's owner): the same key
+    # from two farmers is two payments, and neither learns of the other's
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(payment_idempotency)")]
+    if "farmer_id" in columns:
+        return
+    conn.execute("""
+        CREATE TABLE payment_idempotency_scoped (
+            farmer_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            loan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            outcome TEXT NOT NULL, -- applied, paid_off
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (farmer_id, key)
+        )
+    """)
+    # The owner of an archived loan is in loan_history; 0 if it is unknown
+    conn.execute("""
+        INSERT INTO payment_idempotency_scoped (farmer_id, key, loan_id, amount, outcome, created_at)
+        SELECT COALESCE(
+                   (SELECT fa.farmer_id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+                    WHERE lr.id = pi.loan_id),
+                   (SELECT h.farmer_id FROM loan_history h WHERE h.loan_id = pi.loan_id),
+                   0),
+               key, loan_id, amount, outcome, created_at
+        FROM payment_idempotency pi
+    """)
+    conn.execute("DROP TABLE payment_idempotency")
+    conn.execute("ALTER TABLE payment_idempotency_scoped RENAME TO payment_idempotency")
+
+
+MIGRATIONS = [
+    (1, "base_schema", [_base_schema]),
+    (2, "hot_path_indexes", [
+        # Status queue / dashboard: pending list ordered by created_at and
+        # SUM(amount) over active loans are both answered from this index
+        "CREATE INDEX IF NOT EXISTS idx_loan_requests_status ON loan_requests (status, created_at, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_loan_requests_farm_status ON loan_requests (farm_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_farms_farmer ON farms (farmer_id)",
+        # Covering index for SUM(amount) ... GROUP BY loan_id
+        "CREATE INDEX IF NOT EXISTS idx_payments_loan ON payments (loan_id, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_utility_readings_farm ON utility_readings (farm_id, utility_type, reading_date)",
+        # ORDER BY created_at DESC LIMIT 1 per farm
+        "CREATE INDEX IF NOT EXISTS idx_recommendations_farm_created ON recommendations (farm_id, created_at)",
+    ]),
+    (3, "portfolio_stats", [_portfolio_stats]),
+    (4, "application_queue_keyset", [
+        # Keyset pagination walks (created_at, id) / (amount, id) within a
+        # status; the id tiebreak has to be part of the index order
+        "DROP INDEX IF EXISTS idx_loan_requests_status",
+        "CREATE INDEX IF NOT EXISTS idx_loan_requests_status_created ON loan_requests (status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_loan_requests_status_amount ON loan_requests (status, amount, id)",
+    ]),
+    (5, "application_scores", [_application_scores]),
+    (6, "loan_risk_scores", [
+        # Output of the nightly batch re-score (services/batch_scoring.py)
+        """
+        CREATE TABLE IF NOT EXISTS loan_risk_scores (
+            loan_id INTEGER PRIMARY KEY,
+            score REAL NOT NULL,
+            risk_level TEXT NOT NULL, -- low, medium, high
+            risk_flags INTEGER NOT NULL DEFAULT 0,
+            on_time_ratio REAL,
+            arrears REAL,
+            payment_count INTEGER,
+            model_version TEXT NOT NULL,
+            scored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (loan_id) REFERENCES loan_requests(id)
+        )
+        """,
+    ]),
+    (7, "payment_idempotency", [
+        # Outcome per client idempotency key; kept when a paid-off loan's
+        # rows are removed so retries stay safe
+        """
+        CREATE TABLE IF NOT EXISTS payment_idempotency (
+            key TEXT PRIMARY KEY,
+            loan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            outcome TEXT NOT NULL, -- applied, paid_off
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (8, "utility_rollups", [_utility_rollups]),
+    (9, "loan_version", [
+        # Bumped on every lifecycle transition (services/loan_state.py)
+        "ALTER TABLE loan_requests ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (10, "loan_archive", [
+        # Cold storage for paid-off loans (services/archive.py). Same
+        # columns as the hot tables, without their indexes and triggers
+        """
+        CREATE TABLE IF NOT EXISTS loan_requests_archive (
+            id INTEGER PRIMARY KEY,
+            farm_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            term_months INTEGER NOT NULL,
+            purpose TEXT,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_loan_requests_archive_farm ON loan_requests_archive (farm_id)",
+        """
+        CREATE TABLE IF NOT EXISTS payments_archive (
+            id INTEGER PRIMARY KEY,
+            loan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            payment_date TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_payments_archive_loan ON payments_archive (loan_id)",
+        # One compact row per closed loan: what scoring and the farmer's
+        # history need without touching the archive tables
+        """
+        CREATE TABLE IF NOT EXISTS loan_history (
+            loan_id INTEGER PRIMARY KEY,
+            farmer_id INTEGER NOT NULL,
+            farm_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            term_months INTEGER NOT NULL,
+            payment_count INTEGER NOT NULL,
+            paid_total REAL NOT NULL,
+            opened_at TIMESTAMP,
+            closed_at TIMESTAMP,
+            on_time_ratio REAL NOT NULL -- 1.0 when repaid within the term
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_loan_history_farmer ON loan_history (farmer_id, on_time_ratio)",
+    ]),
+    (11, "installments", [_installments]),
+    (12, "farmer_search", [_farmer_search]),
+    (13, "background_jobs", [_background_jobs]),
+    (14, "archive_loan_terms", [
+        # Archived loans keep their terms and schedule total: installments
+        # are not archived
+        "ALTER TABLE loan_requests_archive ADD COLUMN annual_rate REAL",
+        "ALTER TABLE loan_requests_archive ADD COLUMN schedule_method TEXT",
+        "ALTER TABLE loan_requests_archive ADD COLUMN total_repayment REAL",
+        # Loans archived before this were paid off: what they paid is their total
+        """
+        UPDATE loan_requests_archive
+        SET total_repayment = (SELECT h.paid_total FROM loan_history h WHERE h.loan_id = loan_requests_archive.id)
+        WHERE total_repayment IS NULL
+        """,
+    ]),
+    (15, "farmer_scoped_idempotency", [_farmer_scoped_idempotency]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def current_version(conn):
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def recorded_version(conn):
+    """Like current_version, but read-only: 0 if schema_version doesn't exist."""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def run_migrations(conn, migrations=MIGRATIONS):
+    """Apply every migration newer than the recorded schema version, in order.
+
+    Each migration commits on its own so a failure leaves the schema at the
+    last good version. Returns the list of versions applied.
+    """
+    applied = []
+    version = current_version(conn)
+    conn.commit()
+    for number, name, steps in sorted(migrations, key=lambda m: m[0]):
+        if number <= version:
+            continue
+        started = time.perf_counter()
+        # sqlite3 doesn't open a transaction for DDL on its own. IMMEDIATE
+        # serializes workers starting on the same file: whoever loses the
+        # race finds the migration already recorded and skips it
+        conn.execute("BEGIN IMMEDIATE")
+        if recorded_version(conn) >= number:
+            conn.rollback()
+            continue
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {number:03d} {name} in {time.perf_counter() - started:.2f}s")
+        applied.append(number)
+    return applied
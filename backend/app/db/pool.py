@@ -0,0 +1,192 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from .timing import TimedConnection
+
+
+@dataclass
+class PoolSettings:
+    max_size: int = 8
+    checkout_timeout: float = 10.0  # seconds to wait for a free connection
+    # PRAGMAs applied once to every new connection
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 64 * 1024 * 1024
+    cache_size: int = -16000  # negative = KiB, i.e. ~16MB page cache
+    busy_timeout: int = 5000  # ms
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waits: int = 0
+    wait_time: float = 0.0
+    created: int = 0
+    closed: int = 0
+    in_use: int = 0
+    idle: int = 0
+
+    def as_dict(self):
+        return {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 6),
+            "created": self.created,
+            "closed": self.closed,
+            "in_use": self.in_use,
+            "idle": self.idle,
+        }
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections.
+
+    A connection is confined to the thread that checked it out until it is
+    released; nested checkouts on the same thread reuse that connection.
+    """
+
+    def __init__(self, db_path, settings=None, observer=None):
+        self.db_path = db_path
+        self.settings = settings or PoolSettings()
+        # observer(sql, seconds, executed) is called for every statement
+        # when set (see timing.py)
+        self.observer = observer
+        self._idle = []  # LIFO so the most recently used (warm) connection is reused first
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._stats = PoolStats()
+
+    def _connect(self):
+        s = self.settings
+        # Connections move between threads over their lifetime, but only one
+        # thread holds a given connection at a time (see connection()).
+        factory = TimedConnection if self.observer is not None else sqlite3.Connection
+        conn = sqlite3.connect(
+            self.db_path, timeout=s.busy_timeout / 1000, check_same_thread=False, factory=factory
+        )
+        if self.observer is not None:
+            conn.observer = self.observer
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode={s.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={s.synchronous}")
+        conn.execute(f"PRAGMA mmap_size={int(s.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(s.cache_size)}")
+        conn.execute(f"PRAGMA busy_timeout={int(s.busy_timeout)}")
+        return conn
+
+    def _acquire(self):
+        started = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.settings.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                # Pool exhausted - wait for a release
+                if started is None:
+                    started = time.perf_counter()
+                    self._stats.waits += 1
+                remaining = self.settings.checkout_timeout - (time.perf_counter() - started)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._size >= self.settings.max_size:
+                        self._stats.wait_time += time.perf_counter() - started
+                        raise PoolTimeout("Timed out waiting for a database connection")
+            if started is not None:
+                self._stats.wait_time += time.perf_counter() - started
+            self._stats.checkouts += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats.created += 1
+        return conn
+
+    def _release(self, conn, discard=False):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                self._stats.closed += 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the current thread.
+
+        Commits on success, rolls back on error and always hands the
+        connection back to the pool.
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            # Re-entrant use on the same thread - share the outer transaction
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        broken = False
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except sqlite3.DatabaseError:
+            broken = not _is_usable(conn)
+            raise
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._release(conn, discard=broken)
+
+    def stats(self):
+        with self._cond:
+            snapshot = PoolStats(**self._stats.__dict__)
+            snapshot.idle = len(self._idle)
+            snapshot.in_use = self._size - len(self._idle)
+        return snapshot
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                conn.close()
+            self._size -= len(idle)
+            self._stats.closed += len(idle)
+            self._cond.notify_all()
+
+
+def _is_usable(conn):
+    try:
+        conn.execute("SELECT 1")
+        return True
+    except sqlite3.Error:
+        return False
@@ -0,0 +1,97 @@
+"""Demo data for an empty database.
+
+Seeding is an explicit step, not something the app does on startup:
+
+    cd backend && python -m app.db.seed            # only if there are no farmers yet
+    cd backend && python -m app.db.seed --force    # add the demo farmer regardless
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from ..services import amortization, timeseries
+
+
+def seed_demo(conn):
+    """Insert the demo farmer with a farm, an active loan, payments,
+    utility readings and a recommendation. Returns the farmer id."""
+    print("Seeding database with initial data...")
+
+    # Create Farmer
+    cursor = conn.execute("INSERT INTO farmers (email, full_name, credit_score) VALUES (?, ?, ?)",
+                          ("demo@farmer.com", "Aziz Gofurov", 750))
+    farmer_id = cursor.lastrowid
+
+    # Create Farm
+    cursor = conn.execute("INSERT INTO farms (farmer_id, name, size_acres) VALUES (?, ?, ?)",
+                          (farmer_id, "Petrov Family Farm", 150.5))
+    farm_id = cursor.lastrowid
+
+    # Create Active Loan
+    cursor = conn.execute("""
+        INSERT INTO loan_requests (farm_id, amount, term_months, purpose, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (farm_id, 50000, 12, "Equipment Upgrade", "active", (datetime.now() - timedelta(days=90)).isoformat()))
+    loan_id = cursor.lastrowid
+
+    # Create Payments for Active Loan (3 months paid)
+    payment_amount = 4200 # Approx
+    for i in range(3):
+        date = datetime.now() - timedelta(days=90 - (i * 30))
+        conn.execute("INSERT INTO payments (loan_id, amount, payment_date) VALUES (?, ?, ?)",
+                     (loan_id, payment_amount, date.isoformat()))
+    amortization.create_schedules(conn, [loan_id], start=(datetime.now() - timedelta(days=90)).date())
+
+    # Create Utility Readings
+    readings = [
+        ("electricity", 12450, "kWh"),
+        ("gas", 8230, "m3"),
+        ("water", 3560, "m3")
+    ]
+    last_month = timeseries.normalize_timestamp(datetime.now() - timedelta(days=30))
+    now = timeseries.normalize_timestamp(datetime.now())
+    timeseries.ingest_readings(conn, [
+        row
+        for type_, val, unit in readings
+        for row in ((farm_id, type_, val - 100, unit, last_month), (farm_id, type_, val, unit, now))
+    ])
+
+    # Create Recommendation
+    conn.execute("""
+        INSERT INTO recommendations (farm_id, title, message, type)
+        VALUES (?, ?, ?, ?)
+    """, (farm_id, "Irrigation Recommendation", "Based on the weather forecast, we recommend irrigation in 2 days. Dry weather is expected throughout the week.", "irrigation"))
+
+    print("Seeding complete.")
+    return farmer_id
+
+
+def seed_if_empty(conn):
+    """Seed the demo data unless the database already has farmers; returns whether it did."""
+    if conn.execute("SELECT 1 FROM farmers LIMIT 1").fetchone():
+        return False
+    seed_demo(conn)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="database file (default: AGROCREDIT_DB_PATH or the bundled one)")
+    parser.add_argument("--force", action="store_true", help="seed even if farmers already exist")
+    args = parser.parse_args()
+
+    from .database import DatabaseManager, DB_PATH
+
+    db = DatabaseManager(args.db or DB_PATH)
+    applied = db.ensure_schema()
+    if applied:
+        print(f"Migrated {db.db_path} to version {applied[-1]}")
+    with db.get_connection() as conn:
+        if args.force:
+            seed_demo(conn)
+        elif not seed_if_empty(conn):
+            print("Database already has farmers; nothing to seed (use --force to add the demo farmer).")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+# sqlite3 connection/cursor subclasses that report every statement to an
+# observer(sql, seconds, executed). execute*/executescript report with
+# executed=True; fetch calls report the extra time spent stepping the same
+# statement with executed=False, so statement counts stay exact.
+# Iterating a cursor directly (`for row in cursor`) is not timed.
+
+
+class TimedCursor(sqlite3.Cursor):
+    def _timed(self, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._sql = sql
+            self.connection.observer(sql, time.perf_counter() - started, True)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._timed(super().executescript, sql_script)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.connection.observer(getattr(self, "_sql", ""), time.perf_counter() - started, False)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    # Set by the pool right after connecting
+    observer = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+# In-process event bus. Write endpoints publish after their transaction
+# commits; streaming endpoints subscribe per topic (e.g. "farmer:1") and
+# polling endpoints use the per-topic version as a cheap ETag.
+#
+# Versions live in this process only, so ETags carry a per-process boot id:
+# a tag issued by another worker never matches here.
+
+
+def farmer_topic(farmer_id):
+    return f"farmer:{farmer_id}"
+
+
+class EventBus:
+    def __init__(self, queue_size=100):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self._versions = defaultdict(int)
+        self._subscribers = defaultdict(set)  # topic -> {(loop, queue)}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def version(self, topic):
+        with self._lock:
+            return self._versions[topic]
+
+    def etag(self, topic):
+        return f'W/"{self.boot_id}-{self.version(topic)}"'
+
+    def add_listener(self, callback):
+        """Register a synchronous callback(topic, event) run on every publish."""
+        self._listeners.append(callback)
+
+    def publish(self, topic, event):
+        # Safe to call from any thread
+        with self._lock:
+            self._versions[topic] += 1
+            subscribers = list(self._subscribers.get(topic, ()))
+        for callback in self._listeners:
+            callback(topic, event)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    @asynccontextmanager
+    async def subscribe(self, topic):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers[topic].add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                self._subscribers[topic].discard(entry)
+                if not self._subscribers[topic]:
+                    del self._subscribers[topic]
+
+    def subscriber_count(self, topic=None):
+        with self._lock:
+            if topic is not None:
+                return len(self._subscribers.get(topic, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+
+def _offer(queue, event):
+    # A full queue means the subscriber already has work pending; consumers
+    # re-read current state on wake-up, so dropping the extra event is safe
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+bus = EventBus()
@@ -1,8 +1,40 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from .api import farmers, bank, documents
+from .auth import check_settings, farm_ids_cache, require_admin
+from .cache import response_cache
+from .coalesce import single_flight
+from .db.database import db, adb
+from .db.async_db import QueryTimeout
+from .db.pool import PoolTimeout
+from .serialization import FastJSONResponse
+from .metrics import metrics, render_gauges, InstrumentationMiddleware
+from .services import timeseries
+from .services.loan_state import TransitionError
+from .services.documents import renderer as document_renderer
+from .services.jobs import scheduler
 
-app = FastAPI(title="AgroCredit V2 API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # No JWT secret outside demo mode is a misconfiguration, not a default
+    check_settings()
+    # Schema check/migrations happen here, once per worker, rather than at
+    # import time; a current schema costs one SELECT
+    db.ensure_schema()
+    # Background jobs (services/jobs.py); AGROCREDIT_SCHEDULER=0 disables them
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    # Drain the DB executor, then close pooled connections so worker
+    # shutdown doesn't leak file handles
+    adb.close()
+    db.close()
+    document_renderer.close()
+
+app = FastAPI(title="AgroCredit V2 API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # CORS setup
 origins = [
@@ -18,6 +50,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it is outermost and times the whole stack
+app.add_middleware(InstrumentationMiddleware, metrics=metrics)
+
+@app.exception_handler(QueryTimeout)
+@app.exception_handler(PoolTimeout)
+async def database_busy_handler(request: Request, exc: Exception):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+# Lost or invalid loan lifecycle transitions (services/loan_state.py)
+TRANSITION_STATUS = {"not_found": 404, "invalid": 400, "conflict": 409}
+
+@app.exception_handler(TransitionError)
+async def loan_transition_handler(request: Request, exc: TransitionError):
+    return JSONResponse(
+        status_code=TRANSITION_STATUS[exc.reason],
+        content={"detail": str(exc), "status": exc.status, "version": exc.version},
+    )
 
 app.include_router(farmers.router)
 app.include_router(bank.router)
@@ -26,3 +75,63 @@ app.include_router(documents.router)
 @app.get("/")
 async def root():
     return {"message": "Welcome to AgroCredit V2 API"}
+
+@app.get("/api/system/db")
+async def db_pool_stats():
+    return db.pool_stats()
+
+@app.get("/api/system/cache")
+async def response_cache_stats():
+    return response_cache.stats()
+
+@app.get("/api/system/coalescing")
+async def coalescing_stats():
+    return single_flight.stats()
+
+@app.get("/api/system/identity")
+async def identity_cache_stats():
+    return farm_ids_cache.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body = (
+        metrics.render()
+        + render_gauges("agrocredit_db_pool", db.pool_stats())
+        + render_gauges("agrocredit_response_cache", response_cache.stats())
+        + render_gauges("agrocredit_coalescing", single_flight.stats())
+        + render_gauges("agrocredit_identity_cache", farm_ids_cache.stats())
+        + render_gauges("agrocredit_documents", document_renderer.stats())
+        + render_gauges("agrocredit_job", scheduler.gauges())
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/system/metrics")
+async def route_metrics():
+    # Human-readable per-route summary of the histograms behind /metrics
+    return metrics.snapshot()
+
+@app.get("/api/system/documents")
+async def document_render_stats():
+    return document_renderer.stats()
+
+@app.get("/api/system/jobs")
+async def background_job_stats():
+    return scheduler.stats()
+
+@app.post("/api/system/jobs/{name}/run", dependencies=[Depends(require_admin)])
+async def run_background_job(name: str):
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {name}")
+    summary = await scheduler.run_now(name)
+    return {"ran": summary is not None, **scheduler.stats()[name]}
+
+@app.post("/api/system/utilities/compact", dependencies=[Depends(require_admin)])
+async def compact_utility_readings(keep_months: int = Query(timeseries.RETENTION_MONTHS, ge=1)):
+    removed = await adb.run(timeseries.compact_raw, keep_months, timeout=600)
+    return {"removed": removed, "keep_months": keep_months}
+
+@app.post("/api/system/loans/archive", dependencies=[Depends(require_admin)])
+async def archive_paid_off_loans():
+    # The archive job, now: under its lease, so it never overlaps a scheduled run
+    summary = await scheduler.run_now("archive")
+    return {"ran": summary is not None, **(summary or {})}
@@ -0,0 +1,261 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+
+# Request and SQL instrumentation, exported in Prometheus text format at
+# /metrics. The ASGI middleware opens a RequestStats per request in a
+# contextvar; adb.run copies the context into its worker threads, so every
+# statement the request's SQL runs is counted against it by the pool's
+# timed connections (db/timing.py).
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+sql_log = logging.getLogger("agrocredit.sql")
+request_log = logging.getLogger("agrocredit.requests")
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "_lock")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        # Statements of one request can run on several executor threads
+        self._lock = threading.Lock()
+
+    def add(self, seconds, executed):
+        with self._lock:
+            self.queries += executed
+            self.query_seconds += seconds
+
+
+current_request = contextvars.ContextVar("agrocredit_request", default=None)
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _statement_kind(sql):
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else "EMPTY"
+
+
+class Metrics:
+    def __init__(self, slow_query=0.1, slow_request=1.0, query_budget=50):
+        self.slow_query = slow_query  # seconds
+        self.slow_request = slow_request  # seconds
+        self.query_budget = query_budget  # statements per request before warning
+        self._lock = threading.Lock()
+        self._requests = {}  # (method, route, status) -> count
+        self._request_latency = {}  # (method, route) -> Histogram
+        self._request_queries = {}  # (method, route) -> Histogram
+        self._query_latency = {}  # statement kind -> Histogram
+        self._fetch_seconds = 0.0
+        self._slow_queries = 0
+        self._slow_requests = 0
+        self._started = time.time()
+
+    # --- recording ---
+
+    def observe_query(self, sql, seconds, executed=True):
+        """Pool hook: one execute() (executed=True) or fetch call on a statement."""
+        stats = current_request.get()
+        if stats is not None:
+            stats.add(seconds, executed)
+        with self._lock:
+            if not executed:
+                self._fetch_seconds += seconds
+                return
+            kind = _statement_kind(sql)
+            histogram = self._query_latency.get(kind)
+            if histogram is None:
+                histogram = self._query_latency[kind] = Histogram(QUERY_BUCKETS)
+            histogram.observe(seconds)
+            slow = seconds >= self.slow_query
+            if slow:
+                self._slow_queries += 1
+        if slow:
+            sql_log.warning("slow query %.1fms: %s", seconds * 1000, " ".join(sql.split())[:500])
+
+    def observe_request(self, method, route, status, seconds, stats):
+        key = (method, route)
+        with self._lock:
+            self._requests[(method, route, status)] = self._requests.get((method, route, status), 0) + 1
+            latency = self._request_latency.get(key)
+            if latency is None:
+                latency = self._request_latency[key] = Histogram(LATENCY_BUCKETS)
+                self._request_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            latency.observe(seconds)
+            self._request_queries[key].observe(stats.queries)
+            slow = seconds >= self.slow_request
+            if slow:
+                self._slow_requests += 1
+        if slow or stats.queries > self.query_budget:
+            request_log.warning(
+                "%s %s took %.1fms with %d queries (%.1fms in SQL)",
+                method, route, seconds * 1000, stats.queries, stats.query_seconds * 1000,
+            )
+
+    # --- export ---
+
+    def snapshot(self):
+        """Per-route summary (count, p50/p95/p99 upper bounds, mean queries)."""
+        with self._lock:
+            return {
+                f"{method} {route}": {
+                    "count": latency.count,
+                    "p50": latency.quantile(0.5),
+                    "p95": latency.quantile(0.95),
+                    "p99": latency.quantile(0.99),
+                    "mean_queries": round(self._request_queries[(method, route)].sum / latency.count, 2),
+                }
+                for (method, route), latency in self._request_latency.items()
+            }
+
+    def render(self):
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series:
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {h.count}')
+                lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+                lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+        with self._lock:
+            lines.append("# HELP agrocredit_http_requests_total Requests by route and status")
+            lines.append("# TYPE agrocredit_http_requests_total counter")
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f"agrocredit_http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+            histogram("agrocredit_http_request_duration_seconds", "Request latency by route", [
+                (_labels(method=m, route=r), h) for (m, r), h in sorted(self._request_latency.items())
+            ])
+            histogram("agrocredit_http_request_queries", "SQL statements executed per request", [
+                (_labels(method=m, route=r), h) for (m, r), h in sorted(self._request_queries.items())
+            ])
+            histogram("agrocredit_sql_statement_duration_seconds", "SQL execute() time by statement kind", [
+                (_labels(kind=kind), h) for kind, h in sorted(self._query_latency.items())
+            ])
+            lines += [
+                "# HELP agrocredit_sql_fetch_seconds_total Time spent fetching result rows",
+                "# TYPE agrocredit_sql_fetch_seconds_total counter",
+                f"agrocredit_sql_fetch_seconds_total {self._fetch_seconds}",
+                "# HELP agrocredit_sql_slow_queries_total Statements slower than the slow-query threshold",
+                "# TYPE agrocredit_sql_slow_queries_total counter",
+                f"agrocredit_sql_slow_queries_total {self._slow_queries}",
+                "# HELP agrocredit_http_slow_requests_total Requests slower than the slow-request threshold",
+                "# TYPE agrocredit_http_slow_requests_total counter",
+                f"agrocredit_http_slow_requests_total {self._slow_requests}",
+                "# HELP agrocredit_process_start_time_seconds Start time of the process",
+                "# TYPE agrocredit_process_start_time_seconds gauge",
+                f"agrocredit_process_start_time_seconds {self._started}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def render_gauges(prefix, stats):
+    """Numeric entries of a stats dict (pool, cache, ...) as gauges."""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware: per-route latency, status and SQL statement counts.
+
+    Routes are labelled by their template (/api/bank/applications/{app_id}/review),
+    never the raw path, so label cardinality stays bounded. The response
+    carries X-Query-Count so N+1 regressions show up in any client.
+    """
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(stats.queries).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            self.metrics.observe_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - started,
+                stats,
+            )
+
+
+def metrics_from_env():
+    env = os.environ
+    return Metrics(
+        slow_query=float(env.get("AGROCREDIT_SLOW_QUERY_MS", "100")) / 1000,
+        slow_request=float(env.get("AGROCREDIT_SLOW_REQUEST_MS", "1000")) / 1000,
+        query_budget=int(env.get("AGROCREDIT_QUERY_BUDGET", "50")),
+    )
+
+
+metrics = metrics_from_env()
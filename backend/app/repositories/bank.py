@@ -0,0 +1,149 @@
+# Synchronous data access for the bank portal (see repositories/farmers.py).
+from ..services import export, loan_state, payments, portfolio, scoring, search
+from ..services.balances import IN_CHUNK
+
+def get_dashboard_totals(conn):
+    # Read from the trigger-maintained aggregates instead of scanning loans
+    stats = portfolio.read_stats(conn)
+    active_count, active_amount = stats.get('active', (0, 0.0))
+    pending_count, _ = stats.get('pending', (0, 0.0))
+    return {
+        "total_portfolio": active_amount or 0,
+        "active_loans": active_count or 0,
+        "pending_applications": pending_count or 0,
+    }
+
+def reconcile_portfolio(conn, repair=True):
+    return portfolio.reconcile(conn, repair=repair)
+
+# Sortable columns for the applications queue, each backed by a
+# (status, column, id) index
+APPLICATION_SORTS = {
+    "created_at": "lr.created_at",
+    "amount": "lr.amount",
+}
+
+def _application_filters(filters):
+    clauses, params = ["lr.status = 'pending'"], []
+    if filters.get("min_amount") is not None:
+        clauses.append("lr.amount >= ?")
+        params.append(filters["min_amount"])
+    if filters.get("max_amount") is not None:
+        clauses.append("lr.amount <= ?")
+        params.append(filters["max_amount"])
+    if filters.get("min_score") is not None:
+        clauses.append("f.credit_score >= ?")
+        params.append(filters["min_score"])
+    if filters.get("max_score") is not None:
+        clauses.append("f.credit_score <= ?")
+        params.append(filters["max_score"])
+    if filters.get("purpose"):
+        clauses.append("lr.purpose = ? COLLATE NOCASE")
+        params.append(filters["purpose"])
+    match = search.prefix_match(filters.get("farmer"))
+    if match is not None:
+        # Borrowers found by the directory index (name, email, farm names)
+        clauses.append("fa.farmer_id IN (SELECT rowid FROM farmer_search WHERE farmer_search MATCH ?)")
+        params.append(match)
+    return clauses, params
+
+def apply_payment_batch(conn, rows):
+    # One transaction per batch: validation, inserts and payoff in one pass
+    return payments.apply_payments(conn, rows)
+
+def rescore_portfolio(conn):
+    # Imported lazily: NumPy is only needed by the batch job
+    from ..services import batch_scoring
+    return batch_scoring.rescore_portfolio(conn)
+
+def get_export_chunk(conn, after_id, chunk_size, statuses, encode):
+    """Next export chunk after `after_id`, encoded on the worker thread.
+
+    Returns (last loan id, bytes), or (None, b"") when the walk is done.
+    """
+    rows = export.load_chunk(conn, after_id, chunk_size, statuses)
+    if not rows:
+        return None, b""
+    return rows[-1][0], encode(rows)
+
+def get_document_rows(conn, app_ids):
+    """Borrower name and amount per application id, for document rendering."""
+    rows = {}
+    app_ids = list(app_ids)
+    for start in range(0, len(app_ids), IN_CHUNK):
+        chunk = app_ids[start:start + IN_CHUNK]
+        for row in conn.execute(f"""
+            SELECT lr.id, lr.amount, f.full_name AS farmer_name
+            FROM loan_requests lr
+            JOIN farms fa ON lr.farm_id = fa.id
+            JOIN farmers f ON fa.farmer_id = f.id
+            WHERE lr.id IN ({",".join("?" * len(chunk))})
+        """, chunk):
+            rows[row['id']] = row
+    return rows
+
+def get_application_page(conn, filters, sort="created_at", descending=True, after=None, limit=50):
+    """One page of pending applications, keyset-paginated on (sort column, id).
+
+    Returns (rows, analyses, total, has_more). `after` is the (sort value,
+    id) of the last row of the previous page; `analyses` maps loan id to its
+    stored (or freshly computed) risk analysis.
+    """
+    column = APPLICATION_SORTS[sort]
+    direction = "DESC" if descending else "ASC"
+    clauses, params = _application_filters(filters)
+
+    page_clauses, page_params = list(clauses), list(params)
+    if after is not None:
+        page_clauses.append(f"({column}, lr.id) {'<' if descending else '>'} (?, ?)")
+        page_params.extend(after)
+
+    # Join with farmers and farms to get names, and the stored analysis
+    model = scoring.active_model()
+    rows = conn.execute(f"""
+        SELECT lr.*, f.full_name as farmer_name, f.credit_score, fa.name as farm_name,
+               fa.size_acres as farm_size, s.analysis, s.input_hash
+        FROM loan_requests lr
+        JOIN farms fa ON lr.farm_id = fa.id
+        JOIN farmers f ON fa.farmer_id = f.id
+        LEFT JOIN application_scores s ON s.loan_id = lr.id AND s.model_version = ?
+        WHERE {' AND '.join(page_clauses)}
+        ORDER BY {column} {direction}, lr.id {direction}
+        LIMIT ?
+    """, (model.version, *page_params, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    analyses = scoring.analyses_for(conn, rows, model)
+
+    if len(clauses) == 1:
+        # Unfiltered queue - the size is already maintained in portfolio_stats
+        total = portfolio.read_stats(conn).get('pending', (0, 0.0))[0]
+    else:
+        total = conn.execute(f"""
+            SELECT COUNT(*) FROM loan_requests lr
+            JOIN farms fa ON lr.farm_id = fa.id
+            JOIN farmers f ON fa.farmer_id = f.id
+            WHERE {' AND '.join(clauses)}
+        """, params).fetchone()[0]
+
+    return rows, analyses, total, has_more
+
+def search_farmers(conn, query, after=None, limit=20):
+    """Farmer directory page; see services/search.search_farmers."""
+    return search.search_farmers(conn, query, after=after, limit=limit)
+
+def review_application(conn, app_id, approved, expected_version=None, annual_rate=None, schedule_method=None):
+    """Approve or reject a pending application, optionally setting its terms.
+
+    Returns {id, status, version, farmer_id}; raises loan_state.TransitionError.
+    """
+    target = 'waiting_signature' if approved else 'rejected'
+    loan = loan_state.transition(conn, app_id, target, expected_version)
+    if approved and (annual_rate is not None or schedule_method is not None):
+        # Same transaction: the terms the farmer signs are the ones approved
+        conn.execute("""
+            UPDATE loan_requests SET annual_rate = COALESCE(?, annual_rate),
+                                     schedule_method = COALESCE(?, schedule_method)
+            WHERE id = ?
+        """, (annual_rate, schedule_method, app_id))
+    return loan
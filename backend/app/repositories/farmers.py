@@ -0,0 +1,153 @@
+# Synchronous data access for the farmer portal.
+# Every function takes an open connection; callers run them through
+# `adb.run(...)` so the SQL executes on a worker thread, not the event loop.
+# Farmer-scoped functions take the request's auth.Identity: its farm ids
+# are bound directly as `farm_id IN (...)` parameters.
+from ..services.balances import balance_for, compute_balances
+from ..services import amortization, loan_state, notifications, payments, scoring, timeseries
+
+def _in(ids):
+    return f"({','.join('?' * len(ids))})"
+
+def get_farmer(conn, farmer_id):
+    return conn.execute("SELECT * FROM farmers WHERE id = ?", (farmer_id,)).fetchone()
+
+def get_farm_ids(conn, farmer_id):
+    return tuple(row[0] for row in conn.execute("SELECT id FROM farms WHERE farmer_id = ? ORDER BY id", (farmer_id,)))
+
+def get_profile(conn, identity):
+    farmer = get_farmer(conn, identity.farmer_id)
+    if not farmer:
+        return None, None
+    farm = None
+    if identity.farm_ids:
+        farm = conn.execute("SELECT * FROM farms WHERE id = ?", (identity.farm_ids[0],)).fetchone()
+    return farmer, farm
+
+def get_summary_rows(conn, identity):
+    farmer = get_farmer(conn, identity.farmer_id)
+    if not farmer:
+        return None, []
+    farm_ids = identity.farm_ids
+    active_loans = conn.execute(
+        f"SELECT * FROM loan_requests WHERE status = 'active' AND farm_id IN {_in(farm_ids)}",
+        farm_ids,
+    ).fetchall()
+    return farmer, compute_balances(conn, active_loans)
+
+def get_open_loans(conn, identity, include_history=False):
+    statuses = "'active', 'pending', 'waiting_signature'" + (", 'paid_off'" if include_history else "")
+    loans = conn.execute(f"""
+        SELECT * FROM loan_requests
+        WHERE farm_id IN {_in(identity.farm_ids)} AND status IN ({statuses})
+    """, identity.farm_ids).fetchall()
+    balances = compute_balances(conn, loans)
+    if include_history:
+        # Archived loans, with their paid total from the compact summary
+        balances.extend(balance_for(row, row['paid_total']) for row in conn.execute("""
+            SELECT a.*, h.paid_total
+            FROM loan_history h
+            JOIN loan_requests_archive a ON a.id = h.loan_id
+            WHERE h.farmer_id = ?
+            ORDER BY a.id
+        """, (identity.farmer_id,)))
+    return balances
+
+def create_loan(conn, identity, amount, term_months, purpose):
+    if not identity.farm_ids:
+        return None
+    cursor = conn.execute("""
+        INSERT INTO loan_requests (farm_id, amount, term_months, purpose, status)
+        VALUES (?, ?, ?, ?, 'pending')
+    """, (identity.farm_ids[0], amount, term_months, purpose))
+    # Score now so the bank queue reads a precomputed analysis
+    scoring.score_loans(conn, [cursor.lastrowid])
+    return cursor.lastrowid
+
+def get_utility_readings(conn, identity):
+    # Latest value and month-over-month diff per utility, from the rollups
+    return timeseries.latest_with_diff(conn, identity.farm_ids)
+
+def get_utility_history(conn, identity, utility_type, start, end, max_points, bucket=None):
+    return timeseries.range_query(conn, identity.farm_ids, utility_type, start, end, max_points, bucket)
+
+def add_utility_readings(conn, identity, readings):
+    """Ingest (farm_id or None, utility_type, value, unit, timestamp) rows.
+
+    A missing farm_id means the farmer's first farm. Returns the number of
+    rows stored, or None if a farm doesn't belong to the farmer.
+    """
+    farm_ids = identity.farm_ids
+    if not farm_ids:
+        return None
+    rows = []
+    for farm_id, utility_type, value, unit, ts in readings:
+        farm_id = farm_ids[0] if farm_id is None else farm_id
+        if farm_id not in farm_ids:
+            return None
+        rows.append((farm_id, utility_type, value, unit, ts))
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    return timeseries.ingest_readings(conn, rows)
+
+def get_latest_recommendation(conn, identity):
+    return conn.execute(f"""
+        SELECT * FROM recommendations
+        WHERE farm_id IN {_in(identity.farm_ids)}
+        ORDER BY created_at DESC LIMIT 1
+    """, identity.farm_ids).fetchone()
+
+def get_loan(conn, loan_id):
+    # farmer_id is carried along so callers can notify the owner
+    return conn.execute("""
+        SELECT lr.*, fa.farmer_id
+        FROM loan_requests lr
+        JOIN farms fa ON lr.farm_id = fa.id
+        WHERE lr.id = ?
+    """, (loan_id,)).fetchone()
+
+def _owns(conn, identity, loan_id):
+    row = conn.execute("SELECT farm_id FROM loan_requests WHERE id = ?", (loan_id,)).fetchone()
+    return row is not None and row[0] in identity.farm_ids
+
+def sign_loan(conn, loan_id, expected_version=None, identity=None):
+    """Move a loan from waiting_signature to active.
+
+    Returns {id, status, version, farmer_id}; raises loan_state.TransitionError.
+    With an `identity`, loans of other farmers are reported as not found.
+    The installment schedule is generated here, once, on activation.
+    """
+    if identity is not None and not _owns(conn, identity, loan_id):
+        raise loan_state.TransitionError(loan_id, 'active', 'not_found')
+    loan = loan_state.transition(conn, loan_id, 'active', expected_version)
+    amortization.create_schedules(conn, [loan_id])
+    return loan
+
+def get_schedule(conn, identity, loan_id):
+    """Stored installments of one of the farmer's loans, or None if not theirs."""
+    if not _owns(conn, identity, loan_id):
+        return None
+    return conn.execute("""
+        SELECT seq, due_date, principal, interest, amount, cumulative
+        FROM installments WHERE loan_id = ? ORDER BY seq
+    """, (loan_id,)).fetchall()
+
+def get_notifications(conn, identity):
+    """The farmer's notification list (precomputed by the notifications job)."""
+    return notifications.for_farmer(conn, identity.farmer_id)
+
+def record_payment(conn, loan_id, amount, idempotency_key=None, identity=None):
+    """Apply one payment through the shared payment engine.
+
+    Returns (loan row, result dict) where result['status'] is applied,
+    paid_off, duplicate or rejected; the loan row is None if not found
+    (or, with an `identity`, not one of theirs).
+    """
+    # Lock first so the loan read here is the one the payment is applied to
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    loan = get_loan(conn, loan_id)
+    if identity is not None and (loan is None or loan['farm_id'] not in identity.farm_ids):
+        return None, {"index": 0, "loan_id": loan_id, "status": "rejected", "error": "Loan not active or found"}
+    result = payments.apply_payments(conn, [payments.PaymentRow(loan_id, amount, idempotency_key)])[0]
+    return loan, result
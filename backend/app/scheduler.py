@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from .serialization import dumps, loads
+
+# In-process background jobs.
+#
+# Periodic work (overdue detection, notification rows, recommendations -
+# services/jobs.py) runs here, so request handlers only read the rows it
+# leaves behind. A job is fn(conn, state, now) -> (state, summary): `state`
+# is a JSON dict persisted in `scheduled_jobs` between runs (typically a
+# watermark into loan_changes), `now` comes from the scheduler's clock.
+#
+# Overlap protection is two-level: a job still running in this process is
+# skipped (and counted) when it comes due again, and every run first takes
+# a lease on its `scheduled_jobs` row, so with several workers each job
+# runs in one of them at a time. A lease left by a dead worker expires
+# after the job's timeout. Jobs must be idempotent: a run whose lease was
+# lost, or that failed after writing, is simply repeated.
+#
+# Jobs marked `process` run on a process pool when the scheduler has
+# processes (AGROCREDIT_SCHEDULER_PROCESSES > 0) and on the DB executor
+# otherwise.
+
+logger = logging.getLogger("agrocredit.jobs")
+
+
+class SystemClock:
+    def now(self):
+        return time.time()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class ManualClock:
+    """Test clock: time only moves on `advance`, which wakes due sleepers.
+
+        clock = ManualClock(start)
+        scheduler = Scheduler(adb, clock)
+        scheduler.start()
+        await clock.advance(300)
+        await scheduler.idle()  # the jobs due at start + 300 have run
+    """
+
+    def __init__(self, start=0.0):
+        self._now = float(start)
+        self._sleepers = []  # (deadline, future)
+
+    def now(self):
+        return self._now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self._sleepers.append((self._now + seconds, future))
+        await future
+
+    async def advance(self, seconds):
+        self._now += seconds
+        due = [entry for entry in self._sleepers if entry[0] <= self._now]
+        self._sleepers = [entry for entry in self._sleepers if entry[0] > self._now]
+        for _, future in due:
+            if not future.done():
+                future.set_result(None)
+        # Let the woken sleepers run up to their next await
+        await asyncio.sleep(0)
+
+
+@dataclass
+class Job:
+    name: str
+    fn: Callable  # fn(conn, state, now) -> (state, summary dict)
+    interval: float  # seconds between runs; the first is one interval after start
+    timeout: float = 600.0  # also the lease length
+    process: bool = False  # CPU-heavy: use the process pool when there is one
+    after: Optional[Callable] = None  # after(summary), on the event loop
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0  # came due while still running here
+    lease_busy: int = 0  # another worker held the lease
+    total_seconds: float = 0.0
+    last_seconds: float = 0.0
+    last_started_at: Optional[float] = None
+    last_error: Optional[str] = None
+    last_result: dict = field(default_factory=dict)
+
+    def as_dict(self):
+        data = dict(self.__dict__)
+        data["total_seconds"] = round(self.total_seconds, 6)
+        data["last_seconds"] = round(self.last_seconds, 6)
+        return data
+
+
+def acquire_lease(conn, name, owner, now, seconds):
+    """Take the job's lease if it is free or expired; returns (taken, state)."""
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("INSERT OR IGNORE INTO scheduled_jobs (name) VALUES (?)", (name,))
+    taken = conn.execute("""
+        UPDATE scheduled_jobs SET lease_owner = ?, lease_until = ?, last_started_at = ?
+        WHERE name = ? AND (lease_owner IS NULL OR lease_until < ?)
+    """, (owner, now + seconds, now, name, now)).rowcount == 1
+    state = conn.execute("SELECT state FROM scheduled_jobs WHERE name = ?", (name,)).fetchone()[0]
+    conn.commit()
+    return taken, loads(state) if state else {}
+
+
+def release_lease(conn, name, owner, state, now):
+    """Give the lease back, saving `state` (None keeps the previous one)."""
+    # A run that outlived its lease finds another owner here and saves nothing
+    conn.execute("""
+        UPDATE scheduled_jobs SET lease_owner = NULL, lease_until = NULL, last_finished_at = ?,
+               state = COALESCE(?, state)
+        WHERE name = ? AND lease_owner = ?
+    """, (now, None if state is None else dumps(state).decode(), name, owner))
+    conn.commit()
+
+
+def job_state(conn, name):
+    row = conn.execute("SELECT state FROM scheduled_jobs WHERE name = ?", (name,)).fetchone()
+    return loads(row[0]) if row and row[0] else {}
+
+
+def run_job(conn, name, fn, owner, now, lease_seconds):
+    """One run of a job under its lease. Returns its summary, or None if
+    another worker holds the lease."""
+    taken, state = acquire_lease(conn, name, owner, now, lease_seconds)
+    if not taken:
+        return None
+    try:
+        state, summary = fn(conn, state, now)
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        release_lease(conn, name, owner, None, now)
+        raise
+    release_lease(conn, name, owner, state, now)
+    return summary
+
+
+def _run_in_process(db_path, name, fn, owner, now, lease_seconds):
+    # Process-pool entry point: a connection of its own, same PRAGMAs
+    from .db.database import pool_settings_from_env
+    from .db.pool import ConnectionPool
+
+    pool = ConnectionPool(db_path, pool_settings_from_env())
+    try:
+        with pool.connection() as conn:
+            return run_job(conn, name, fn, owner, now, lease_seconds)
+    finally:
+        pool.close()
+
+
+def _summarize(summary):
+    # Stats keep counts, not the id lists a summary may carry for `after`
+    return {key: len(value) if isinstance(value, (list, tuple, set)) else value
+            for key, value in summary.items()}
+
+
+class Scheduler:
+    def __init__(self, adb, clock=None, processes=0, enabled=True):
+        self.adb = adb
+        self.clock = clock or SystemClock()
+        self.processes = processes
+        self.enabled = enabled
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.jobs = {}
+        self._stats = {}
+        self._next_run = {}
+        self._running = set()
+        self._tasks = set()
+        self._loop_task = None
+        self._executor = None
+
+    def add(self, job):
+        self.jobs[job.name] = job
+        self._stats[job.name] = JobStats()
+        return job
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: forking a threaded server process is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def start(self):
+        """Start the timer loop on the running event loop (a no-op when disabled)."""
+        if not self.enabled or self._loop_task is not None:
+            return
+        now = self.clock.now()
+        for job in self.jobs.values():
+            self._next_run[job.name] = now + job.interval
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the timer loop and wait for running jobs to finish."""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        await self.idle()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def idle(self):
+        """Wait until no job started by the timer loop is running."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _loop(self):
+        while True:
+            now = self.clock.now()
+            for name, job in self.jobs.items():
+                if self._next_run[name] <= now:
+                    # Runs missed while the process was busy collapse into one
+                    self._next_run[name] = now + job.interval
+                    task = asyncio.create_task(self._run(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            await self.clock.sleep(max(min(self._next_run.values()) - self.clock.now(), 0))
+
+    async def run_now(self, name):
+        """Run one job immediately; returns its summary or None (skipped, lease busy, failed)."""
+        return await self._run(self.jobs[name])
+
+    async def _run(self, job):
+        stats = self._stats[job.name]
+        if job.name in self._running:
+            stats.skipped += 1
+            return None
+        self._running.add(job.name)
+        now = self.clock.now()
+        stats.last_started_at = now
+        started = time.perf_counter()
+        try:
+            if job.process and self.processes > 0:
+                loop = asyncio.get_running_loop()
+                summary = await loop.run_in_executor(
+                    self._pool(), _run_in_process, self.adb.manager.db_path,
+                    job.name, job.fn, self.owner, now, job.timeout,
+                )
+            else:
+                summary = await self.adb.run(run_job, job.name, job.fn, self.owner, now, job.timeout,
+                                             timeout=job.timeout)
+        except Exception as exc:
+            stats.failures += 1
+            stats.last_error = f"{type(exc).__name__}: {exc}"
+            logger.exception("job %s failed", job.name)
+            return None
+        finally:
+            self._running.discard(job.name)
+            elapsed = time.perf_counter() - started
+            stats.last_seconds = elapsed
+            stats.total_seconds += elapsed
+
+        if summary is None:
+            stats.lease_busy += 1
+            return None
+        stats.runs += 1
+        stats.last_error = None
+        stats.last_result = _summarize(summary)
+        if job.after is not None:
+            job.after(summary)
+        return summary
+
+    def stats(self):
+        now = self.clock.now()
+        data = {}
+        for name, job in self.jobs.items():
+            entry = self._stats[name].as_dict()
+            entry.update(
+                interval=job.interval,
+                running=name in self._running,
+                next_run_in=round(self._next_run[name] - now, 3) if name in self._next_run else None,
+            )
+            data[name] = entry
+        return data
+
+    def gauges(self):
+        """Flat numeric stats for render_gauges: <job>_<stat>."""
+        return {
+            f"{name}_{key}": value
+            for name, entry in self.stats().items()
+            for key, value in entry.items()
+            if key in ("runs", "failures", "skipped", "lease_busy", "total_seconds", "last_seconds")
+        }
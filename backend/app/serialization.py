@@ -0,0 +1,96 @@
+import datetime
+import json
+import operator
+import sqlite3
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# JSON encoding for API responses. orjson when it is installed (it is in
+# requirements.txt); the stdlib json module otherwise, with the same
+# compact output.
+#
+# List endpoints build plain dicts straight from DB rows (map_rows) and
+# return FastJSONResponse themselves. FastAPI skips response_model
+# validation for a returned Response, so those rows are encoded once
+# instead of being built into models, re-validated and then encoded. The
+# response_model stays on the route for the OpenAPI schema. Only do this
+# for data that came from our own tables.
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+
+def _default(obj):
+    # Types orjson doesn't encode natively (the stdlib path goes through
+    # jsonable_encoder instead)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "keys"):  # sqlite3.Row
+        return dict(zip(obj.keys(), obj))
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content):
+        """Compact JSON bytes."""
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+    loads = orjson.loads
+else:  # pragma: no cover - depends on the environment
+    def dumps(content):
+        """Compact JSON bytes."""
+        return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode()
+
+    loads = json.loads
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps`; the app's default response class."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _getter(make, keys):
+    get = make(*keys)
+    if len(keys) == 1:
+        return lambda row: (get(row),)
+    return get
+
+
+def map_rows(rows, fields, columns=None):
+    """Response dicts for rows of one query (sqlite3.Row or dicts).
+
+    `fields` are the output keys and `columns` the row columns they come
+    from, by position (defaulting to the same names). For sqlite3.Row the
+    column positions are resolved once from the first row, so each row
+    costs one C-level itemgetter call and a dict(zip()).
+    """
+    if not rows:
+        return []
+    fields = tuple(fields)
+    columns = fields if columns is None else tuple(columns)
+    if isinstance(rows[0], sqlite3.Row):
+        keys = rows[0].keys()
+        columns = [keys.index(c) for c in columns]
+    get = _getter(operator.itemgetter, columns)
+    return [dict(zip(fields, get(row))) for row in rows]
+
+
+def map_objects(objects, fields, attributes=None):
+    """map_rows for objects (dataclasses such as LoanBalance): reads attributes."""
+    fields = tuple(fields)
+    get = _getter(operator.attrgetter, fields if attributes is None else tuple(attributes))
+    return [dict(zip(fields, get(obj))) for obj in objects]
@@ -0,0 +1,259 @@
+# Amortization schedules.
+#
+# A loan's installment schedule is generated once, when it becomes active,
+# and stored in `installments` (one row per month, with the cumulative
+# amount due through that installment). Balances, next due dates and
+# arrears are then read from the stored schedule instead of re-deriving
+# interest on every request.
+#
+# Two methods:
+#   flat    - interest on the original principal every month (the
+#             historical 12% simple-interest product)
+#   annuity - equal monthly payments, interest on the outstanding balance
+#
+# `schedule_many` generates schedules for many loans at once, vectorized
+# across loans (one NumPy step per installment number); `schedule` is the
+# single-loan view of it. Amounts are in cents-rounded currency units and
+# the last installment absorbs the rounding, so a schedule always sums to
+# exactly principal + interest.
+import datetime
+from dataclasses import dataclass
+
+import numpy as np
+
+# SQLite's default host-parameter limit is 999 on older builds
+IN_CHUNK = 900
+PAYOFF_EPSILON = 0.01  # Small epsilon for float comparison
+
+DEFAULT_ANNUAL_RATE = 0.12
+DEFAULT_METHOD = "flat"
+METHODS = ("flat", "annuity")
+
+
+@dataclass
+class Installment:
+    seq: int  # 1-based
+    due_date: str  # YYYY-MM-DD
+    principal: float
+    interest: float
+    amount: float
+    cumulative: float  # total due through this installment
+
+
+def loan_terms(loan):
+    """(annual rate, method) of a loan row, with the defaults filled in."""
+    keys = loan.keys()
+    rate = loan['annual_rate'] if 'annual_rate' in keys else None
+    method = loan['schedule_method'] if 'schedule_method' in keys else None
+    return (DEFAULT_ANNUAL_RATE if rate is None else rate), (method or DEFAULT_METHOD)
+
+
+def total_repayment(amount, term_months, annual_rate=DEFAULT_ANNUAL_RATE, method=DEFAULT_METHOD):
+    """Principal plus interest over the life of a loan (what its schedule sums to)."""
+    return float(schedule_many([amount], [term_months], [annual_rate], [method], [datetime.date.today()])["total"][0])
+
+
+def _due_dates(starts, terms):
+    # Same day of month as the start date, clamped to the month's length
+    start = np.asarray(starts, dtype="datetime64[D]")
+    first_of_month = start.astype("datetime64[M]")
+    day = (start - first_of_month.astype("datetime64[D]")).astype(np.int64)
+    max_term = int(terms.max())
+    months = first_of_month[:, None] + np.arange(1, max_term + 1)
+    month_days = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(np.int64)
+    return months.astype("datetime64[D]") + np.minimum(day[:, None], month_days - 1)
+
+
+def schedule_many(amounts, terms, rates, methods, starts):
+    """Schedules for many loans as (n loans x max term) arrays.
+
+    Returns a dict of `due` (datetime64[D]), `principal`, `interest`,
+    `amount` and `cumulative` arrays, a boolean `valid` mask (installment
+    number <= the loan's term) and the per-loan `total`.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    terms = np.maximum(np.asarray(terms, dtype=np.int64), 1)
+    monthly_rate = np.asarray(rates, dtype=np.float64) / 12
+    annuity = np.asarray(methods) == "annuity"
+    n, max_term = len(amounts), int(terms.max())
+
+    # Flat: equal principal, interest on the original amount
+    flat_principal = np.round(amounts / terms, 2)
+    flat_interest = np.round(amounts * monthly_rate, 2)
+    # Annuity: level payment, interest on the outstanding balance
+    with np.errstate(divide="ignore", invalid="ignore"):
+        level = np.where(
+            monthly_rate > 0,
+            amounts * monthly_rate / (1 - (1 + monthly_rate) ** -terms.astype(np.float64)),
+            amounts / terms,
+        )
+    level = np.round(level, 2)
+
+    principal = np.zeros((n, max_term))
+    interest = np.zeros((n, max_term))
+    outstanding = amounts.copy()
+    for k in range(max_term):
+        live = k < terms
+        last = k == terms - 1
+        month_interest = np.where(annuity, np.round(outstanding * monthly_rate, 2), flat_interest)
+        month_principal = np.where(annuity, level - month_interest, flat_principal)
+        # The last installment settles whatever principal is left
+        month_principal = np.where(last, outstanding, np.minimum(month_principal, outstanding))
+        principal[:, k] = np.where(live, month_principal, 0.0)
+        interest[:, k] = np.where(live, month_interest, 0.0)
+        outstanding = np.round(outstanding - principal[:, k], 2)
+
+    amount = np.round(principal + interest, 2)
+    cumulative = np.round(np.cumsum(amount, axis=1), 2)
+    return {
+        "due": _due_dates(starts, terms),
+        "principal": principal,
+        "interest": interest,
+        "amount": amount,
+        "cumulative": cumulative,
+        "valid": np.arange(max_term) < terms[:, None],
+        "total": cumulative[np.arange(n), terms - 1],
+    }
+
+
+def schedule(amount, term_months, annual_rate=DEFAULT_ANNUAL_RATE, method=DEFAULT_METHOD, start=None):
+    """Installments of one loan starting the month after `start` (default today)."""
+    s = schedule_many([amount], [term_months], [annual_rate], [method], [start or datetime.date.today()])
+    return [
+        Installment(k + 1, str(s["due"][0, k]), float(s["principal"][0, k]), float(s["interest"][0, k]),
+                    float(s["amount"][0, k]), float(s["cumulative"][0, k]))
+        for k in range(max(int(term_months), 1))
+    ]
+
+
+def installment_rows(loan_ids, generated):
+    """(loan_id, seq, due_date, principal, interest, amount, cumulative) rows for executemany."""
+    rows_idx, cols_idx = np.nonzero(generated["valid"])
+    ids = np.asarray(loan_ids, dtype=np.int64)[rows_idx]
+    due = np.datetime_as_string(generated["due"][rows_idx, cols_idx], unit="D")
+    return zip(
+        ids.tolist(),
+        (cols_idx + 1).tolist(),
+        due.tolist(),
+        generated["principal"][rows_idx, cols_idx].tolist(),
+        generated["interest"][rows_idx, cols_idx].tolist(),
+        generated["amount"][rows_idx, cols_idx].tolist(),
+        generated["cumulative"][rows_idx, cols_idx].tolist(),
+    )
+
+
+def insert_schedules(conn, loan_ids, amounts, terms, rates, methods, starts):
+    """Generate and store schedules for a batch of loans (replacing any existing)."""
+    if not len(loan_ids):
+        return 0
+    generated = schedule_many(amounts, terms, rates, methods, starts)
+    for start in range(0, len(loan_ids), IN_CHUNK):
+        chunk = list(loan_ids[start:start + IN_CHUNK])
+        conn.execute(f"DELETE FROM installments WHERE loan_id IN ({','.join('?' * len(chunk))})", chunk)
+    conn.executemany("""
+        INSERT INTO installments (loan_id, seq, due_date, principal, interest, amount, cumulative)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, installment_rows(loan_ids, generated))
+    return int(generated["valid"].sum())
+
+
+def create_schedules(conn, loan_ids, start=None):
+    """Schedule loans from their stored terms, first installment a month after `start`."""
+    start = start or datetime.date.today()
+    loans = []
+    loan_ids = list(loan_ids)
+    for offset in range(0, len(loan_ids), IN_CHUNK):
+        chunk = loan_ids[offset:offset + IN_CHUNK]
+        loans.extend(conn.execute(f"""
+            SELECT id, amount, term_months, annual_rate, schedule_method FROM loan_requests
+            WHERE id IN ({','.join('?' * len(chunk))})
+        """, chunk).fetchall())
+    return insert_schedules(
+        conn,
+        [loan[0] for loan in loans],
+        [loan[1] for loan in loans],
+        [loan[2] for loan in loans],
+        [DEFAULT_ANNUAL_RATE if loan[3] is None else loan[3] for loan in loans],
+        [loan[4] or DEFAULT_METHOD for loan in loans],
+        [start] * len(loans),
+    )
+
+
+def backfill_schedules(conn, status="active", batch=50_000):
+    """Schedule every `status` loan without one, starting from its creation date."""
+    scheduled, after_id = 0, 0
+    while True:
+        loans = conn.execute("""
+            SELECT id, amount, term_months, annual_rate, schedule_method, created_at FROM loan_requests lr
+            WHERE id > ? AND status = ? AND NOT EXISTS (SELECT 1 FROM installments i WHERE i.loan_id = lr.id)
+            ORDER BY id LIMIT ?
+        """, (after_id, status, batch)).fetchall()
+        if not loans:
+            return scheduled
+        scheduled += insert_schedules(
+            conn,
+            [loan[0] for loan in loans],
+            [loan[1] for loan in loans],
+            [loan[2] for loan in loans],
+            [DEFAULT_ANNUAL_RATE if loan[3] is None else loan[3] for loan in loans],
+            [loan[4] or DEFAULT_METHOD for loan in loans],
+            [str(loan[5])[:10] for loan in loans],
+        )
+        after_id = loans[-1][0]
+
+
+def load_schedules(conn, loan_ids):
+    """Map loan id -> [(seq, due_date, amount, cumulative)] from `installments`."""
+    schedules = {}
+    loan_ids = list(loan_ids)
+    for offset in range(0, len(loan_ids), IN_CHUNK):
+        chunk = loan_ids[offset:offset + IN_CHUNK]
+        for loan_id, seq, due_date, amount, cumulative in conn.execute(f"""
+            SELECT loan_id, seq, due_date, amount, cumulative FROM installments
+            WHERE loan_id IN ({','.join('?' * len(chunk))})
+            ORDER BY loan_id, seq
+        """, chunk):
+            schedules.setdefault(loan_id, []).append((seq, due_date, amount, cumulative))
+    return schedules
+
+
+def schedule_totals(conn, loan_ids):
+    """Map loan id -> total due per its stored schedule (loans without one are absent)."""
+    totals = {}
+    loan_ids = list(loan_ids)
+    for offset in range(0, len(loan_ids), IN_CHUNK):
+        chunk = loan_ids[offset:offset + IN_CHUNK]
+        # The last installment's cumulative is the schedule total
+        totals.update(conn.execute(f"""
+            SELECT loan_id, MAX(cumulative) FROM installments
+            WHERE loan_id IN ({','.join('?' * len(chunk))})
+            GROUP BY loan_id
+        """, chunk).fetchall())
+    return totals
+
+
+def amount_due(installments, today):
+    """Cumulative amount of a schedule's installments past due on `today`.
+
+    An installment due today is not past due yet: it is the next payment.
+    """
+    due = 0.0
+    for seq, due_date, amount, cumulative in installments:
+        if due_date >= today:
+            break
+        due = cumulative
+    return due
+
+
+def position(installments, paid, today):
+    """(next installment or None, amount overdue) for a schedule and a paid total.
+
+    Payments settle installments in order, so the next one is the first
+    whose cumulative amount exceeds what has been paid.
+    """
+    next_due = None
+    for installment in installments:
+        if installment[3] > paid + PAYOFF_EPSILON:
+            next_due = installment
+            break
+    return next_due, round(max(amount_due(installments, today) - paid, 0.0), 2)
@@ -0,0 +1,82 @@
+# Hot/cold split for closed loans.
+#
+# Paying a loan off only moves it to `paid_off` (services/loan_state.py);
+# this batch job later moves paid-off loans and their payments out of the
+# hot tables into loan_requests_archive / payments_archive and leaves one
+# compact loan_history row per loan for scoring and the farmer's history.
+# The hot tables - and every status filter over them - then only ever hold
+# open loans plus whatever was paid off since the last run.
+import time
+
+from .balances import DAYS_PER_MONTH, IN_CHUNK
+
+# Loans moved per transaction; one IN list per statement
+ARCHIVE_BATCH = IN_CHUNK
+
+
+def archive_batch(conn, batch_size=ARCHIVE_BATCH):
+    """Archive up to `batch_size` paid-off loans in the current transaction.
+
+    Returns the number of loans moved.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    ids = [row[0] for row in conn.execute(
+        "SELECT id FROM loan_requests WHERE status = 'paid_off' LIMIT ?", (min(batch_size, IN_CHUNK),)
+    )]
+    if not ids:
+        return 0
+    in_ids = f"({','.join('?' * len(ids))})"
+
+    conn.execute(f"""
+        INSERT INTO loan_history (loan_id, farmer_id, farm_id, amount, term_months, payment_count,
+                                  paid_total, opened_at, closed_at, on_time_ratio)
+        SELECT id, farmer_id, farm_id, amount, term_months, payment_count, paid_total, created_at, closed_at,
+               MIN(1.0, term_months * {DAYS_PER_MONTH} / MAX(julianday(closed_at) - julianday(created_at), 1))
+        FROM (
+            SELECT lr.id, fa.farmer_id, lr.farm_id, lr.amount, lr.term_months, lr.created_at,
+                   COUNT(p.id) AS payment_count, COALESCE(SUM(p.amount), 0) AS paid_total,
+                   COALESCE(MAX(p.payment_date), CURRENT_TIMESTAMP) AS closed_at
+            FROM loan_requests lr
+            JOIN farms fa ON lr.farm_id = fa.id
+            LEFT JOIN payments p ON p.loan_id = lr.id
+            WHERE lr.id IN {in_ids}
+            GROUP BY lr.id
+        )
+    """, ids)
+    conn.execute(f"""
+        INSERT INTO payments_archive (id, loan_id, amount, payment_date)
+        SELECT id, loan_id, amount, payment_date FROM payments WHERE loan_id IN {in_ids}
+    """, ids)
+    conn.execute(f"""
+        INSERT INTO loan_requests_archive (id, farm_id, amount, term_months, purpose, status, created_at, version,
+                                           annual_rate, schedule_method, total_repayment)
+        SELECT id, farm_id, amount, term_months, purpose, status, created_at, version,
+               annual_rate, schedule_method,
+               (SELECT MAX(i.cumulative) FROM installments i WHERE i.loan_id = lr.id)
+        FROM loan_requests lr WHERE id IN {in_ids}
+    """, ids)
+    conn.execute(f"DELETE FROM payments WHERE loan_id IN {in_ids}", ids)
+    conn.execute(f"DELETE FROM loan_risk_scores WHERE loan_id IN {in_ids}", ids)
+    conn.execute(f"DELETE FROM installments WHERE loan_id IN {in_ids}", ids)
+    # Triggers drop the application score and the paid_off portfolio_stats share
+    conn.execute(f"DELETE FROM loan_requests WHERE id IN {in_ids}", ids)
+    return len(ids)
+
+
+def archive_paid_off(conn, batch_size=ARCHIVE_BATCH):
+    """Archive every paid-off loan, committing after each batch.
+
+    Short transactions keep the write lock free for request handlers
+    between batches. Returns counts and timings for the run.
+    """
+    started = time.perf_counter()
+    archived, batches = 0, 0
+    while True:
+        moved = archive_batch(conn, batch_size)
+        conn.commit()
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+    return {"archived": archived, "batches": batches, "seconds": round(time.perf_counter() - started, 3)}
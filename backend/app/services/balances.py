@@ -0,0 +1,118 @@
+# Loan balance engine: paid / remaining / progress / next payment for a
+# whole set of loans, with payments aggregated in one grouped query
+# instead of one SUM per loan. Totals, next due dates and arrears come
+# from the stored amortization schedules (services/amortization.py).
+import datetime
+from dataclasses import dataclass
+
+from . import amortization
+from .amortization import IN_CHUNK, PAYOFF_EPSILON
+
+DAYS_PER_MONTH = 30.4375
+CLOSED_STATUSES = ("paid_off",)
+
+
+@dataclass
+class LoanBalance:
+    loan_id: int
+    amount: float
+    term_months: int
+    status: str
+    total_repayment: float
+    paid: float
+    remaining: float
+    progress: int
+    monthly: float
+    due_date: str
+    annual_rate: float = amortization.DEFAULT_ANNUAL_RATE
+    arrears: float = 0.0
+
+    @property
+    def rate(self):
+        return round(self.annual_rate * 100, 4)
+
+    @property
+    def is_paid_off(self):
+        return self.paid >= self.total_repayment - PAYOFF_EPSILON
+
+
+def paid_totals(conn, loan_ids):
+    """Map loan id -> sum of its payments, one GROUP BY query per 900 ids."""
+    loan_ids = list(loan_ids)
+    totals = dict.fromkeys(loan_ids, 0)
+    for start in range(0, len(loan_ids), IN_CHUNK):
+        chunk = loan_ids[start:start + IN_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT loan_id, SUM(amount) AS total FROM payments WHERE loan_id IN ({placeholders}) GROUP BY loan_id",
+            chunk,
+        ).fetchall()
+        for row in rows:
+            totals[row['loan_id']] = row['total'] or 0
+    return totals
+
+
+def _display_date(iso_date):
+    return datetime.date.fromisoformat(iso_date).strftime("%d.%m.%Y")
+
+
+def balance_for(loan, paid, installments=None, today=None):
+    """Build a LoanBalance from a loan_requests row (or mapping) and its paid total.
+
+    `installments` is the loan's stored schedule (amortization.load_schedules);
+    without one (not yet active) the terms are derived on the fly.
+    """
+    rate, method = amortization.loan_terms(loan)
+    if installments:
+        total = installments[-1][3]
+        next_due, arrears = amortization.position(installments, paid, today or datetime.date.today().isoformat())
+        monthly = next_due[2] if next_due else 0.0
+        due_date = _display_date(next_due[1]) if next_due else "-"
+    else:
+        # Archived loans carry their schedule total; otherwise from the terms
+        stored = loan['total_repayment'] if 'total_repayment' in loan.keys() else None
+        total = stored if stored is not None else amortization.total_repayment(
+            loan['amount'], loan['term_months'], rate, method)
+        monthly = total / max(loan['term_months'], 1)
+        arrears = 0.0
+        due_date = "-"
+    paid = round(paid, 2)
+    remaining = total - paid
+    progress = int((paid / total) * 100) if total > 0 else 0
+
+    # For pending loans, everything is 0/mock
+    if loan['status'] == 'pending':
+        remaining = total
+        paid = 0
+        progress = 0
+    # Closed loans owe nothing, whatever rounding the payments left
+    elif loan['status'] in CLOSED_STATUSES:
+        remaining = 0.0
+        progress = 100
+        monthly = 0.0
+        due_date = "-"
+        arrears = 0.0
+
+    return LoanBalance(
+        loan_id=loan['id'],
+        amount=loan['amount'],
+        term_months=loan['term_months'],
+        status=loan['status'],
+        total_repayment=total,
+        paid=paid,
+        remaining=round(remaining, 2),
+        progress=min(progress, 100),
+        monthly=round(monthly, 2),
+        due_date=due_date,
+        annual_rate=rate,
+        arrears=arrears,
+    )
+
+
+def compute_balances(conn, loans, today=None):
+    """Balances for a list of loan rows, in the same order."""
+    loan_ids = [loan['id'] for loan in loans]
+    paid = paid_totals(conn, loan_ids)
+    schedules = amortization.load_schedules(conn, loan_ids)
+    today = today or datetime.date.today().isoformat()
+    return [balance_for(loan, paid[loan['id']], schedules.get(loan['id']), today) for loan in loans]
@@ -0,0 +1,247 @@
+# Batch credit scoring over the whole loan book.
+#
+# Loans are read in id-ordered chunks into columnar NumPy arrays together
+# with their payment aggregates, scored in vectorized form and written
+# back to `loan_risk_scores` with one executemany per chunk. The
+# row-at-a-time `score_loan` is the reference implementation;
+# `score_columns` must agree with it up to float rounding.
+#
+# Totals and amounts due come from the same place as balances: the stored
+# installments of scheduled loans (services/amortization.py), and the
+# loan's own rate and method for loans not yet scheduled, on which
+# nothing is due.
+import datetime
+import time
+import numpy as np
+
+from . import amortization
+
+MODEL_VERSION = "batch-v2"
+
+# Risk flag bits
+FLAG_LOW_CREDIT = 1
+FLAG_HIGH_EXPOSURE = 2
+FLAG_ARREARS = 4
+FLAG_HIGH_LEVERAGE = 8
+
+LOW_CREDIT_SCORE = 650
+HIGH_EXPOSURE_AMOUNT = 5000
+# Loan amount per acre above which the farm is considered over-leveraged
+LEVERAGE_LIMIT_PER_ACRE = 1000.0
+
+SCORED_STATUSES = ('active', 'pending', 'waiting_signature')
+
+_LOAN_COLUMNS = ("id", "amount", "term_months", "annual_rate", "annuity", "credit_score", "size_acres",
+                 "history_on_time", "total_repayment", "amount_due")
+
+# Farmer's mean on-time ratio over closed loans (loan_history), NULL without
+# history; stands in for on-time behaviour on loans with nothing due yet
+HISTORY_ON_TIME_SQL = (
+    "(SELECT AVG(h.on_time_ratio) FROM loan_history h WHERE h.farmer_id = fa.farmer_id)"
+)
+
+# Cumulative amounts grow with seq, so the last installment holds the
+# schedule total and the last one due before today holds
+# amortization.amount_due. Both are a seek on the primary key from the
+# end of the loan's schedule; 0 for loans without one.
+SCHEDULE_TOTAL_SQL = (
+    "(SELECT i.cumulative FROM installments i WHERE i.loan_id = lr.id ORDER BY i.seq DESC LIMIT 1)"
+)
+AMOUNT_DUE_SQL = (
+    "(SELECT i.cumulative FROM installments i WHERE i.loan_id = lr.id AND i.due_date < ?"
+    " ORDER BY i.seq DESC LIMIT 1)"
+)
+
+
+def _risk_level(score):
+    return np.where(score >= 700, "low", np.where(score >= 500, "medium", "high"))
+
+
+def score_columns(cols, paid, payment_count):
+    """Vectorized scoring. `cols` maps _LOAN_COLUMNS names to 1-d arrays,
+    plus `total_repayment` and `amount_due` (what the schedule asks for
+    before today) from _load_chunk."""
+    amount = cols["amount"]
+    term = np.maximum(cols["term_months"], 1)
+    credit = cols["credit_score"]
+    acres = cols["size_acres"]
+
+    monthly = cols["total_repayment"] / term
+    expected = cols["amount_due"]
+    arrears = np.maximum(expected - paid, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        history = np.where(np.isnan(cols["history_on_time"]), 1.0, cols["history_on_time"])
+        on_time = np.where(expected > 0, np.minimum(paid / expected, 1.0), history)
+        leverage = np.where(acres > 0, amount / (acres * LEVERAGE_LIMIT_PER_ACRE), 1.0)
+
+    credit_norm = np.clip((credit - 300) / 550, 0.0, 1.0)
+    score = np.round(1000 * (0.5 * credit_norm + 0.3 * on_time + 0.2 * (1 - np.clip(leverage, 0.0, 1.0))), 1)
+
+    flags = (
+        np.where(credit < LOW_CREDIT_SCORE, FLAG_LOW_CREDIT, 0)
+        | np.where(amount > HIGH_EXPOSURE_AMOUNT, FLAG_HIGH_EXPOSURE, 0)
+        | np.where(arrears > monthly, FLAG_ARREARS, 0)
+        | np.where(leverage > 1.0, FLAG_HIGH_LEVERAGE, 0)
+    )
+    return {
+        "score": score,
+        "risk_level": _risk_level(score),
+        "risk_flags": flags.astype(np.int64),
+        "on_time_ratio": np.round(on_time, 4),
+        "arrears": np.round(arrears, 2),
+        "payment_count": payment_count.astype(np.int64),
+    }
+
+
+def score_loan(row, paid, payment_count, installments=None, today=None):
+    """Row-at-a-time (plain Python) equivalent of score_columns for one loan.
+
+    `installments` is its stored schedule (amortization.load_schedules).
+    """
+    amount = row['amount']
+    term = max(row['term_months'], 1)
+    credit = row['credit_score'] or 0
+    acres = row['size_acres'] or 0
+
+    if installments:
+        total_repayment = installments[-1][3]
+    else:
+        rate, method = amortization.loan_terms(row)
+        total_repayment = amortization.total_repayment(amount, term, rate, method)
+    monthly = total_repayment / term
+    expected = amortization.amount_due(installments or (), today or datetime.date.today().isoformat())
+    arrears = max(expected - paid, 0.0)
+    history = row['history_on_time']
+    on_time = min(paid / expected, 1.0) if expected > 0 else (1.0 if history is None else history)
+    leverage = amount / (acres * LEVERAGE_LIMIT_PER_ACRE) if acres > 0 else 1.0
+
+    credit_norm = min(max((credit - 300) / 550, 0.0), 1.0)
+    score = round(1000 * (0.5 * credit_norm + 0.3 * on_time + 0.2 * (1 - min(max(leverage, 0.0), 1.0))), 1)
+
+    flags = 0
+    if credit < LOW_CREDIT_SCORE:
+        flags |= FLAG_LOW_CREDIT
+    if amount > HIGH_EXPOSURE_AMOUNT:
+        flags |= FLAG_HIGH_EXPOSURE
+    if arrears > monthly:
+        flags |= FLAG_ARREARS
+    if leverage > 1.0:
+        flags |= FLAG_HIGH_LEVERAGE
+
+    return {
+        "score": score,
+        "risk_level": "low" if score >= 700 else "medium" if score >= 500 else "high",
+        "risk_flags": flags,
+        "on_time_ratio": round(on_time, 4),
+        "arrears": round(arrears, 2),
+        "payment_count": payment_count,
+    }
+
+
+def _load_chunk(conn, after_id, chunk_size, statuses, today=None):
+    today = today or datetime.date.today().isoformat()
+    placeholders = ",".join("?" * len(statuses))
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples are much cheaper to convert
+    rows = cursor.execute(f"""
+        SELECT lr.id, lr.amount, lr.term_months,
+               COALESCE(lr.annual_rate, ?), COALESCE(lr.schedule_method = 'annuity', 0),
+               COALESCE(f.credit_score, 0), COALESCE(fa.size_acres, 0), {HISTORY_ON_TIME_SQL},
+               COALESCE({SCHEDULE_TOTAL_SQL}, 0), COALESCE({AMOUNT_DUE_SQL}, 0)
+        FROM loan_requests lr
+        JOIN farms fa ON lr.farm_id = fa.id
+        JOIN farmers f ON fa.farmer_id = f.id
+        WHERE lr.id > ? AND lr.status IN ({placeholders})
+        ORDER BY lr.id
+        LIMIT ?
+    """, (amortization.DEFAULT_ANNUAL_RATE, today, after_id, *statuses, chunk_size)).fetchall()
+    if not rows:
+        return None
+    data = np.array(rows, dtype=np.float64)
+    cols = {name: data[:, i] for i, name in enumerate(_LOAN_COLUMNS)}
+    cols["id"] = data[:, 0].astype(np.int64)
+
+    # Payment aggregates for the chunk's id range in one indexed range scan
+    lo, hi = int(cols["id"][0]), int(cols["id"][-1])
+    paid, count = _by_loan(cols["id"], cursor.execute("""
+        SELECT loan_id, SUM(amount), COUNT(*) FROM payments
+        WHERE loan_id BETWEEN ? AND ? GROUP BY loan_id
+    """, (lo, hi)).fetchall())
+
+    # Loans without a schedule: total from their terms, nothing due yet
+    total = cols["total_repayment"]
+    unscheduled = total == 0
+    if unscheduled.any():
+        methods = np.where(cols["annuity"][unscheduled] > 0, "annuity", "flat")
+        total[unscheduled] = amortization.schedule_many(
+            cols["amount"][unscheduled], cols["term_months"][unscheduled], cols["annual_rate"][unscheduled],
+            methods, [today] * int(unscheduled.sum()),
+        )["total"]
+    return cols, paid, count.astype(np.int64)
+
+
+def _by_loan(ids, agg):
+    # Two per-loan aggregate columns aligned with `ids`; 0 for loans absent
+    # from `agg`, and rows of loans outside the chunk's statuses dropped
+    first = np.zeros(len(ids))
+    second = np.zeros(len(ids))
+    if agg:
+        agg = np.array(agg, dtype=np.float64)
+        agg_ids = agg[:, 0].astype(np.int64)
+        pos = np.minimum(np.searchsorted(ids, agg_ids), len(ids) - 1)
+        hit = ids[pos] == agg_ids
+        first[pos[hit]] = agg[hit, 1]
+        second[pos[hit]] = agg[hit, 2]
+    return first, second
+
+
+def _write_chunk(conn, ids, result):
+    conn.executemany("""
+        INSERT INTO loan_risk_scores
+            (loan_id, score, risk_level, risk_flags, on_time_ratio, arrears, payment_count, model_version, scored_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(loan_id) DO UPDATE SET
+            score = excluded.score,
+            risk_level = excluded.risk_level,
+            risk_flags = excluded.risk_flags,
+            on_time_ratio = excluded.on_time_ratio,
+            arrears = excluded.arrears,
+            payment_count = excluded.payment_count,
+            model_version = excluded.model_version,
+            scored_at = excluded.scored_at
+    """, zip(
+        ids.tolist(),
+        result["score"].tolist(),
+        result["risk_level"].tolist(),
+        result["risk_flags"].tolist(),
+        result["on_time_ratio"].tolist(),
+        result["arrears"].tolist(),
+        result["payment_count"].tolist(),
+        [MODEL_VERSION] * len(ids),
+    ))
+
+
+def rescore_portfolio(conn, chunk_size=50_000, statuses=SCORED_STATUSES):
+    """Re-score every loan in `statuses`, committing after each chunk.
+
+    Returns counts and timings for the run.
+    """
+    started = time.perf_counter()
+    after_id, scored, chunks = 0, 0, 0
+    while True:
+        loaded = _load_chunk(conn, after_id, chunk_size, statuses)
+        if loaded is None:
+            break
+        cols, paid, count = loaded
+        result = score_columns(cols, paid, count)
+        _write_chunk(conn, cols["id"], result)
+        conn.commit()
+        after_id = int(cols["id"][-1])
+        scored += len(cols["id"])
+        chunks += 1
+    return {
+        "scored": scored,
+        "chunks": chunks,
+        "model_version": MODEL_VERSION,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
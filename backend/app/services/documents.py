@@ -0,0 +1,210 @@
+# Document rendering: precompiled templates, a content-addressed render
+# cache and batch rendering on a worker pool.
+#
+# Templates live in app/templates/<name>.txt and use str.format fields
+# ({farmer_name}, {amount:,.2f}); the first line is the document title.
+# Each is parsed once into literal/field operations when this module is
+# imported. A rendered document is cached under a hash of the template
+# version and the canonical JSON of its data, so identical requests never
+# render twice and a template edit can never serve a stale document.
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import string
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..cache import MemoryCache
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "..", "templates")
+# Documents rendered per worker task
+RENDER_CHUNK = 100
+# Rendered documents are immutable for a given key; the TTL only bounds memory
+DOCUMENT_TTL = 24 * 3600
+
+
+class Template:
+    """A template parsed into (literal, field, format spec) operations."""
+
+    def __init__(self, name, source):
+        self.name = name
+        self.title = source.strip().splitlines()[0].strip() if source.strip() else name
+        self.version = hashlib.sha256(source.encode()).hexdigest()[:16]
+        self.fields = []
+        self._ops = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if conversion:
+                raise ValueError(f"{name}: conversions are not supported ({field}!{conversion})")
+            self._ops.append((literal, field, spec))
+            if field is not None and field not in self.fields:
+                self.fields.append(field)
+
+    def render(self, data):
+        parts = []
+        for literal, field, spec in self._ops:
+            parts.append(literal)
+            if field is not None:
+                try:
+                    parts.append(format(data[field], spec))
+                except KeyError:
+                    raise ValueError(f"{self.name}: missing field {field}")
+        return "".join(parts)
+
+
+def load_templates(directory=TEMPLATE_DIR):
+    templates = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension == ".txt":
+            with open(os.path.join(directory, filename), encoding="utf-8") as fp:
+                templates[name] = Template(name, fp.read())
+    return templates
+
+
+TEMPLATES = load_templates()
+
+
+def document_key(template, data):
+    canonical = json.dumps({field: data[field] for field in template.fields if field in data},
+                           sort_keys=True, separators=(",", ":"))
+    return f"{template.name}:{template.version}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+def render_many(items):
+    """Render [(template name, data)] -> [(title, content)].
+
+    Top-level so it can run in a worker process; children compile the
+    templates once when they import this module.
+    """
+    rendered = []
+    for name, data in items:
+        template = TEMPLATES[name]
+        rendered.append((template.title, template.render(data)))
+    return rendered
+
+
+class DocumentRenderer:
+    """Cache-fronted renderer with a pool for batch work.
+
+    `workers` > 0 renders batches on that many processes; 0 uses a single
+    thread, which keeps large batches off the event loop without the
+    process start-up and pickling cost.
+    """
+
+    def __init__(self, templates=None, workers=0, cache=None):
+        self.templates = TEMPLATES if templates is None else templates
+        self.workers = workers
+        self.cache = cache or MemoryCache(max_entries=50_000, max_bytes=64 * 1024 * 1024)
+        self._executor = None
+        self.rendered = 0
+
+    def _pool(self):
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn: forking a threaded server process is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="documents")
+        return self._executor
+
+    def template(self, name):
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise ValueError(f"unknown template {name}")
+
+    def render(self, name, data):
+        """Render one document inline, through the cache. Returns (title, content)."""
+        template = self.template(name)
+        key = document_key(template, data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return template.title, cached.decode()
+        content = template.render(data)
+        self.rendered += 1
+        self.cache.set(key, content.encode(), DOCUMENT_TTL)
+        return template.title, content
+
+    async def render_batch(self, items):
+        """Render [(template name, data)] in order; misses go to the pool in chunks."""
+        results = [None] * len(items)
+        misses = []
+        for index, (name, data) in enumerate(items):
+            template = self.template(name)
+            key = document_key(template, data)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[index] = (template.title, cached.decode())
+            else:
+                misses.append((index, key, name, data))
+
+        loop = asyncio.get_running_loop()
+        chunks = [misses[start:start + RENDER_CHUNK] for start in range(0, len(misses), RENDER_CHUNK)]
+        rendered = await asyncio.gather(*(
+            loop.run_in_executor(self._pool(), render_many, [(name, data) for _, _, name, data in chunk])
+            for chunk in chunks
+        ))
+        for chunk, documents in zip(chunks, rendered):
+            for (index, key, _, _), document in zip(chunk, documents):
+                results[index] = document
+                self.cache.set(key, document[1].encode(), DOCUMENT_TTL)
+        self.rendered += len(misses)
+        return results
+
+    def stats(self):
+        data = self.cache.stats()
+        data.update(rendered=self.rendered, workers=self.workers,
+                    templates={name: t.version for name, t in self.templates.items()})
+        return data
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _ZipSink:
+    # Write-only file object: zipfile sees it as unseekable and streams
+    # entries with data descriptors; bytes are collected until drained
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+class ZipStream:
+    """Incrementally built zip archive; `add` then `drain` the bytes so far."""
+
+    def __init__(self):
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, filename, content):
+        self._zip.writestr(filename, content)
+
+    def drain(self):
+        return self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        return self._sink.drain()
+
+
+def renderer_from_env():
+    return DocumentRenderer(workers=int(os.environ.get("AGROCREDIT_DOCUMENT_WORKERS", "0")))
+
+
+renderer = renderer_from_env()
@@ -0,0 +1,217 @@
+# Streaming export of the loan book.
+#
+# Loans are walked in id order in fixed-size chunks (keyset on id), each
+# joined with its farm, farmer and payment aggregate, and encoded chunk by
+# chunk as CSV or as a compact columnar binary format. Only one chunk is
+# ever in memory, whatever the size of the portfolio.
+import csv
+import io
+import json
+import struct
+
+import numpy as np
+
+EXPORT_CHUNK_SIZE = 10_000
+
+# (name, kind) where kind is "int", "float" or "str"
+COLUMNS = (
+    ("loan_id", "int"),
+    ("farm_id", "int"),
+    ("farmer_id", "int"),
+    ("farmer_name", "str"),
+    ("email", "str"),
+    ("farm_name", "str"),
+    ("size_acres", "float"),
+    ("credit_score", "int"),
+    ("amount", "float"),
+    ("term_months", "int"),
+    ("purpose", "str"),
+    ("status", "str"),
+    ("created_at", "str"),
+    ("paid_total", "float"),
+    ("payment_count", "int"),
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+
+def load_chunk(conn, after_id, chunk_size=EXPORT_CHUNK_SIZE, statuses=None):
+    """Up to `chunk_size` export rows (plain tuples) with loan id > after_id."""
+    status_sql = ""
+    params = [after_id]
+    if statuses:
+        status_sql = f"AND lr.status IN ({','.join('?' * len(statuses))})"
+        params.extend(statuses)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    # CROSS JOIN keeps loan_requests as the outer loop, so the chunk is a
+    # walk along lr.id that stops after LIMIT rows. With a single status
+    # the planner would otherwise start from farms and sort every matching
+    # loan per chunk.
+    rows = cursor.execute(f"""
+        SELECT lr.id, lr.farm_id, fa.farmer_id, f.full_name, f.email, fa.name,
+               COALESCE(fa.size_acres, 0), COALESCE(f.credit_score, 0),
+               lr.amount, lr.term_months, COALESCE(lr.purpose, ''), lr.status, lr.created_at
+        FROM loan_requests lr
+        CROSS JOIN farms fa ON lr.farm_id = fa.id
+        JOIN farmers f ON fa.farmer_id = f.id
+        WHERE lr.id > ? {status_sql}
+        ORDER BY lr.id
+        LIMIT ?
+    """, (*params, chunk_size)).fetchall()
+    if not rows:
+        return rows
+
+    # Payment aggregates for the chunk's id range in one indexed range scan
+    totals = {
+        loan_id: (paid, count)
+        for loan_id, paid, count in cursor.execute("""
+            SELECT loan_id, SUM(amount), COUNT(*) FROM payments
+            WHERE loan_id BETWEEN ? AND ? GROUP BY loan_id
+        """, (rows[0][0], rows[-1][0]))
+    }
+    empty = (0.0, 0)
+    return [row + totals.get(row[0], empty) for row in rows]
+
+
+def iter_chunks(conn, chunk_size=EXPORT_CHUNK_SIZE, statuses=None):
+    """Synchronous chunk walk over the whole export (benchmarks, scripts)."""
+    after_id = 0
+    while True:
+        rows = load_chunk(conn, after_id, chunk_size, statuses)
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+# --- CSV ---
+
+def csv_header():
+    return encode_csv([COLUMN_NAMES])
+
+
+def encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
+
+
+# --- Columnar binary ---
+#
+# Layout (little-endian):
+#   magic b"AGCX1\n", u32 schema length, schema JSON [[name, kind], ...]
+#   row groups: u32 row count, then per column u32 byte length + data
+#       int   -> u8 width (1, 2, 4 or 8), then int<width>[n]
+#       float -> float64[n]
+#       str   -> u8 encoding, then
+#                0 (plain): string block of n values
+#                1 (dictionary): u32 d, string block of d values, int32 codes[n]
+#   string block of k values: int32 offsets[k + 1] followed by the UTF-8 bytes
+#   terminator: u32 0
+#
+# Status, purpose and the farmer/farm columns repeat heavily across loans,
+# so they are dictionary-encoded per row group when that pays off.
+
+COLUMNAR_MAGIC = b"AGCX1\n"
+COLUMNAR_MEDIA_TYPE = "application/x-agrocredit-columnar"
+_U32 = struct.Struct("<I")
+_PLAIN, _DICTIONARY = b"\x00", b"\x01"
+_INT_TYPES = (np.dtype("<i1"), np.dtype("<i2"), np.dtype("<i4"), np.dtype("<i8"))
+
+
+def columnar_header():
+    schema = json.dumps(COLUMNS).encode()
+    return COLUMNAR_MAGIC + _U32.pack(len(schema)) + schema
+
+
+def columnar_footer():
+    return _U32.pack(0)
+
+
+def _encode_ints(values):
+    # Narrowest integer width that holds the row group's range
+    array = np.asarray(values, dtype="<i8")
+    low, high = (int(array.min()), int(array.max())) if len(array) else (0, 0)
+    for dtype in _INT_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return bytes([dtype.itemsize]) + array.astype(dtype).tobytes()
+
+
+def _string_block(values):
+    encoded = [value.encode() if value is not None else b"" for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i4")
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def _encode_strings(values):
+    codes = {}
+    indices = [codes.setdefault(value, len(codes)) for value in values]
+    # Dictionary-encode when at most half the values are distinct
+    if len(codes) * 2 <= len(values):
+        return (_DICTIONARY + _U32.pack(len(codes)) + _string_block(codes)
+                + np.asarray(indices, dtype="<i4").tobytes())
+    return _PLAIN + _string_block(values)
+
+
+def encode_columnar(rows):
+    """One row group for `rows` (tuples in COLUMNS order)."""
+    parts = [_U32.pack(len(rows))]
+    for index, (_, kind) in enumerate(COLUMNS):
+        values = [row[index] for row in rows]
+        if kind == "int":
+            data = _encode_ints(values)
+        elif kind == "float":
+            data = np.asarray(values, dtype="<f8").tobytes()
+        else:
+            data = _encode_strings(values)
+        parts.append(_U32.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def _read_string_block(data, count):
+    split = (count + 1) * 4
+    offsets = np.frombuffer(data[:split], dtype="<i4")
+    text = data[split:]
+    return [text[offsets[i]:offsets[i + 1]].decode() for i in range(count)], split + int(offsets[-1])
+
+
+def _decode_strings(data, count):
+    if data[:1] == _PLAIN:
+        return _read_string_block(data[1:], count)[0]
+    (size,) = _U32.unpack(data[1:5])
+    dictionary, used = _read_string_block(data[5:], size)
+    codes = np.frombuffer(data[5 + used:], dtype="<i4")
+    return [dictionary[code] for code in codes]
+
+
+def read_columnar(stream):
+    """Yield row groups ({column: array or list}) from a columnar export."""
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("not a columnar export")
+    (schema_len,) = _U32.unpack(stream.read(4))
+    schema = json.loads(stream.read(schema_len))
+    while True:
+        (count,) = _U32.unpack(stream.read(4))
+        if count == 0:
+            return
+        group = {}
+        for name, kind in schema:
+            (length,) = _U32.unpack(stream.read(4))
+            data = stream.read(length)
+            if kind == "int":
+                group[name] = np.frombuffer(data[1:], dtype=f"<i{data[0]}").astype(np.int64)
+            elif kind == "float":
+                group[name] = np.frombuffer(data, dtype="<f8")
+            else:
+                group[name] = _decode_strings(data, count)
+        yield group
+
+
+FORMATS = {
+    # format -> (media type, file extension, header, encode chunk, footer)
+    "csv": ("text/csv", "csv", csv_header, encode_csv, lambda: b""),
+    "columnar": (COLUMNAR_MEDIA_TYPE, "agcx", columnar_header, encode_columnar, columnar_footer),
+}
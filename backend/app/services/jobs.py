@@ -0,0 +1,320 @@
+# Background jobs run by the scheduler (app/scheduler.py).
+#
+#   overdue          loans changed since the last run, plus loans with an
+#                    installment that fell due since then (`loan_due_dates`),
+#                    are checked against their schedule; `overdue_loans`
+#                    holds the ones with unpaid installments past due
+#   notifications    farmers with loan changes since the last run get their
+#                    notification list rebuilt (services/notifications.py);
+#                    farmers never computed are backfilled a batch per run
+#   recommendations  a rolling batch of farms gets a recommendation from
+#                    its utility trend and overdue status, when it differs
+#                    from the farm's latest one
+#   archive          paid-off loans move to the archive tables
+#                    (services/archive.py), keeping the hot tables small
+#   utilities        raw utility readings past the retention window are
+#                    deleted; the rollups keep their history
+#
+# Change tracking is the `loan_changes` table, appended by triggers on
+# loans and payments; each job keeps the last seq it consumed in its
+# state, so a run costs in proportion to what changed, not to the loan
+# book. `python -m app.services.jobs [name ...]` runs jobs once, e.g. from
+# cron with AGROCREDIT_SCHEDULER=0.
+import asyncio
+import datetime
+import os
+import sys
+
+from . import amortization, archive, notifications, timeseries
+from .balances import IN_CHUNK, PAYOFF_EPSILON, paid_totals
+from ..db.database import adb
+from ..events import bus, farmer_topic
+from ..scheduler import Job, Scheduler, job_state
+
+# Farmers backfilled per notifications run
+NOTIFICATION_BATCH = int(os.environ.get("AGROCREDIT_NOTIFICATION_BATCH", "5000"))
+# Farms looked at per recommendations run
+RECOMMENDATION_BATCH = int(os.environ.get("AGROCREDIT_RECOMMENDATION_BATCH", "1000"))
+# Month-over-month rise in daily utility use worth a recommendation
+USAGE_RISE = 0.25
+
+
+def _in(ids):
+    return f"({','.join('?' * len(ids))})"
+
+
+def _chunks(ids, size=IN_CHUNK):
+    ids = list(ids)
+    return [ids[offset:offset + size] for offset in range(0, len(ids), size)]
+
+
+def _today(now):
+    return datetime.date.fromtimestamp(now).isoformat()
+
+
+def _overdue(installments, paid, today):
+    # (installments past due and unpaid, amount, oldest unpaid due date,
+    # next due date not yet past - today or later - or None). An installment
+    # due today is the next payment, not overdue
+    count, since, next_due = 0, None, None
+    for _, due_date, _, cumulative in installments:
+        if due_date >= today:
+            next_due = due_date
+            break
+        if cumulative > paid + PAYOFF_EPSILON:
+            count += 1
+            since = since or due_date
+    return count, amortization.position(installments, paid, today)[1], since, next_due
+
+
+def check_overdue(conn, loan_ids, today):
+    """Update overdue_loans for `loan_ids` (IN_CHUNK at most) in the current
+    transaction. Returns (loans now overdue, farmers whose overdue state changed).
+
+    A change is also appended to loan_changes, so the farmer's notifications
+    are rebuilt.
+    """
+    loans = conn.execute(f"""
+        SELECT lr.id, fa.farmer_id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+        WHERE lr.id IN {_in(loan_ids)} AND lr.status = 'active'
+    """, loan_ids).fetchall()
+    previous = {row[0]: tuple(row[1:]) for row in conn.execute(f"""
+        SELECT loan_id, farmer_id, installments_overdue, amount_overdue FROM overdue_loans
+        WHERE loan_id IN {_in(loan_ids)}
+    """, loan_ids)}
+    active = [loan_id for loan_id, _ in loans]
+    paid = paid_totals(conn, active)
+    schedules = amortization.load_schedules(conn, active)
+
+    overdue, changed, due_dates = [], [], []
+    for loan_id, farmer_id in loans:
+        count, amount, since, next_due = _overdue(schedules.get(loan_id, ()), paid[loan_id], today)
+        if next_due is not None:
+            due_dates.append((loan_id, next_due))
+        if count:
+            overdue.append((loan_id, farmer_id, count, amount, since))
+            if previous.pop(loan_id, None) != (farmer_id, count, amount):
+                changed.append((loan_id, farmer_id))
+    # What is left in `previous` is no longer overdue (paid, closed or archived)
+    changed.extend((loan_id, farmer_id) for loan_id, (farmer_id, _, _) in previous.items())
+
+    conn.executemany("""
+        INSERT INTO overdue_loans (loan_id, farmer_id, installments_overdue, amount_overdue, overdue_since)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(loan_id) DO UPDATE SET
+            farmer_id = excluded.farmer_id,
+            installments_overdue = excluded.installments_overdue,
+            amount_overdue = excluded.amount_overdue,
+            overdue_since = excluded.overdue_since,
+            updated_at = CURRENT_TIMESTAMP
+    """, overdue)
+    conn.executemany("DELETE FROM overdue_loans WHERE loan_id = ?", ((loan_id,) for loan_id in previous))
+    # Checked again the day after their next installment falls due
+    conn.execute(f"DELETE FROM loan_due_dates WHERE loan_id IN {_in(loan_ids)}", loan_ids)
+    conn.executemany("INSERT INTO loan_due_dates (loan_id, next_due) VALUES (?, ?)", due_dates)
+    conn.executemany("INSERT INTO loan_changes (loan_id, farmer_id, origin) VALUES (?, ?, 'overdue')", changed)
+    return len(overdue), {farmer_id for _, farmer_id in changed}
+
+
+def detect_overdue(conn, state, now):
+    """Job: check the loans that changed or had an installment fall due since the last run."""
+    today = _today(now)
+    seq, day = state.get("seq", 0), state.get("day", "")
+    top = notifications.current_seq(conn)
+    candidates = {row[0] for row in conn.execute(
+        "SELECT loan_id FROM loan_changes WHERE seq > ? AND seq <= ? AND origin = 'write'", (seq, top)
+    )}
+    if not day:
+        # First run: every active loan
+        candidates.update(row[0] for row in conn.execute("SELECT id FROM loan_requests WHERE status = 'active'"))
+    elif day < today:
+        candidates.update(row[0] for row in conn.execute(
+            "SELECT loan_id FROM loan_due_dates WHERE next_due < ?", (today,)
+        ))
+
+    overdue, farmers = 0, set()
+    # One short write transaction per chunk keeps the lock free for requests
+    for chunk in _chunks(sorted(candidates)):
+        conn.execute("BEGIN IMMEDIATE")
+        found, changed = check_overdue(conn, chunk, today)
+        conn.commit()
+        overdue += found
+        farmers |= changed
+    return {"seq": top, "day": today}, {"checked": len(candidates), "overdue": overdue, "farmers": sorted(farmers)}
+
+
+def refresh_notifications(conn, state, now, batch=NOTIFICATION_BATCH):
+    """Job: rebuild the notification lists of farmers with loan changes since the last run."""
+    today = _today(now)
+    seq, backfill = state.get("seq", 0), state.get("backfill", 0)
+    top = notifications.current_seq(conn)
+    farmers = {row[0] for row in conn.execute(
+        "SELECT DISTINCT farmer_id FROM loan_changes WHERE seq > ? AND seq <= ? AND farmer_id IS NOT NULL", (seq, top)
+    )}
+    changed = len(farmers)
+    if backfill is not None:
+        # Farmers never computed (existing data); None once all are done
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM farmers WHERE id > ? ORDER BY id LIMIT ?", (backfill, batch)
+        )]
+        farmers.update(ids)
+        backfill = ids[-1] if len(ids) == batch else None
+
+    for chunk in _chunks(sorted(farmers)):
+        conn.execute("BEGIN IMMEDIATE")
+        notifications.refresh(conn, chunk, today)
+        conn.commit()
+
+    # Changes both consumers have seen are no longer needed
+    consumed = min(top, job_state(conn, "overdue").get("seq", 0))
+    conn.execute("DELETE FROM loan_changes WHERE seq <= ?", (consumed,))
+    conn.commit()
+    return {"seq": top, "backfill": backfill}, {"changed": changed, "refreshed": len(farmers),
+                                                 "backfill_done": backfill is None}
+
+
+def _usage_trends(conn, farm_ids):
+    # farm id -> {utility: rise in daily use, current month vs the previous}.
+    # Readings are cumulative meter values, so a month's use is last - first
+    rows = conn.execute(f"""
+        SELECT farm_id, utility_type, (last_value - first_value) / MAX(julianday(last_at) - julianday(first_at), 1)
+        FROM (
+            SELECT farm_id, utility_type, last_value, first_value, last_at, first_at,
+                   ROW_NUMBER() OVER (PARTITION BY farm_id, utility_type ORDER BY period_start DESC) AS rn
+            FROM utility_rollups
+            WHERE period = 'month' AND farm_id IN {_in(farm_ids)}
+        )
+        WHERE rn <= 2
+        ORDER BY farm_id, utility_type, rn
+    """, farm_ids).fetchall()
+    trends, months = {}, {}
+    for farm_id, utility, daily in rows:
+        months.setdefault((farm_id, utility), []).append(daily)
+    for (farm_id, utility), (current, *previous) in months.items():
+        if previous and previous[0] > 0:
+            trends.setdefault(farm_id, {})[utility] = current / previous[0] - 1
+    return trends
+
+
+def recommend(trends, overdue_amount):
+    """(title, message, type) for one farm, or None when nothing stands out."""
+    if overdue_amount:
+        return ("Overdue Installments",
+                f"${overdue_amount:,.2f} of your loan installments is overdue. "
+                "Paying it soon protects your credit score.", "general")
+    water = trends.get("water", 0)
+    if water >= USAGE_RISE:
+        return ("Water Use Rising",
+                f"Daily water use is up {water:.0%} on last month. Check irrigation lines for leaks "
+                "and water in the early morning to cut evaporation.", "irrigation")
+    electricity = trends.get("electricity", 0)
+    if electricity >= USAGE_RISE:
+        return ("Energy Use Rising",
+                f"Daily electricity use is up {electricity:.0%} on last month. Check pumps and cold "
+                "storage for faults.", "general")
+    return None
+
+
+def refresh_recommendations(conn, state, now, batch=RECOMMENDATION_BATCH):
+    """Job: recommendations for the next `batch` farms, wrapping around at the end."""
+    after = state.get("after", 0)
+    farms = conn.execute("SELECT id, farmer_id FROM farms WHERE id > ? ORDER BY id LIMIT ?", (after, batch)).fetchall()
+    created_at = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    created, farmers = 0, set()
+    for chunk in _chunks(farms):
+        farm_ids = [farm_id for farm_id, _ in chunk]
+        trends = _usage_trends(conn, farm_ids)
+        overdue = dict(conn.execute(f"""
+            SELECT lr.farm_id, SUM(o.amount_overdue) FROM overdue_loans o
+            JOIN loan_requests lr ON lr.id = o.loan_id
+            WHERE lr.farm_id IN {_in(farm_ids)}
+            GROUP BY lr.farm_id
+        """, farm_ids).fetchall())
+        latest = dict(conn.execute(f"""
+            SELECT farm_id, title FROM (
+                SELECT farm_id, title,
+                       ROW_NUMBER() OVER (PARTITION BY farm_id ORDER BY created_at DESC, id DESC) AS rn
+                FROM recommendations WHERE farm_id IN {_in(farm_ids)}
+            ) WHERE rn = 1
+        """, farm_ids).fetchall())
+        rows = []
+        for farm_id, farmer_id in chunk:
+            recommendation = recommend(trends.get(farm_id, {}), overdue.get(farm_id))
+            if recommendation is not None and recommendation[0] != latest.get(farm_id):
+                rows.append((farm_id, *recommendation, created_at))
+                farmers.add(farmer_id)
+        if rows:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO recommendations (farm_id, title, message, type, created_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.commit()
+            created += len(rows)
+
+    wrapped = len(farms) < batch
+    state = {"after": 0 if wrapped else farms[-1][0], "passes": state.get("passes", 0) + wrapped}
+    return state, {"farms": len(farms), "created": created, "farmers": sorted(farmers), "passes": state["passes"]}
+
+
+def archive_loans(conn, state, now):
+    """Move every paid-off loan to the archive tables, a batch per transaction."""
+    summary = archive.archive_paid_off(conn)
+    return {"archived": state.get("archived", 0) + summary["archived"]}, summary
+
+
+def compact_utilities(conn, state, now):
+    """Apply the raw utility reading retention policy."""
+    conn.execute("BEGIN IMMEDIATE")
+    removed = timeseries.compact_raw(conn, timeseries.RETENTION_MONTHS, datetime.date.fromtimestamp(now))
+    conn.commit()
+    return state, {"removed": removed, "keep_months": timeseries.RETENTION_MONTHS}
+
+
+def _publish(event_type):
+    # Per-farmer events: drop cached responses, move ETags, wake streams
+    def after(summary):
+        for farmer_id in summary["farmers"]:
+            bus.publish(farmer_topic(farmer_id), {"type": event_type})
+    return after
+
+
+def _interval(name, default):
+    return float(os.environ.get(f"AGROCREDIT_{name.upper()}_INTERVAL", default))
+
+
+JOBS = [
+    Job("overdue", detect_overdue, _interval("overdue", 300), after=_publish("loan.overdue")),
+    Job("notifications", refresh_notifications, _interval("notifications", 60)),
+    Job("recommendations", refresh_recommendations, _interval("recommendations", 3600), process=True,
+        after=_publish("recommendation.created")),
+    Job("archive", archive_loans, _interval("archive", 3600)),
+    Job("utilities", compact_utilities, _interval("utilities", 86400)),
+]
+
+
+def scheduler_from_env(clock=None):
+    scheduler = Scheduler(
+        adb,
+        clock=clock,
+        processes=int(os.environ.get("AGROCREDIT_SCHEDULER_PROCESSES", "0")),
+        enabled=os.environ.get("AGROCREDIT_SCHEDULER", "1") != "0",
+    )
+    for job in JOBS:
+        scheduler.add(job)
+    return scheduler
+
+
+scheduler = scheduler_from_env()
+
+
+async def _run_once(names):
+    for name in names:
+        summary = await scheduler.run_now(name)
+        stats = scheduler.stats()[name]
+        print(name, stats["last_result"] if summary is not None else stats["last_error"] or "lease held elsewhere")
+    await scheduler.stop()
+    adb.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_run_once(sys.argv[1:] or [job.name for job in JOBS]))
@@ -0,0 +1,97 @@
+# Loan lifecycle state machine.
+#
+#   pending -> waiting_signature -> active -> paid_off
+#          \-> rejected
+#
+# Every transition is one conditional UPDATE (status and, when the caller
+# supplies it, version in the WHERE clause) inside a short BEGIN IMMEDIATE
+# transaction, so two officers reviewing the same application or a
+# signature racing a rejection cannot both win: the loser's UPDATE matches
+# no row. `version` is bumped on every transition and lets clients do
+# optimistic concurrency on top (If-Match style). The current row is only
+# read again when a transition fails, to say why.
+from .balances import IN_CHUNK
+
+TRANSITIONS = {
+    "pending": ("waiting_signature", "rejected"),
+    "waiting_signature": ("active",),
+    "active": ("paid_off",),
+}
+# Reverse map: target status -> statuses it may be entered from
+SOURCES = {}
+for _source, _targets in TRANSITIONS.items():
+    for _target in _targets:
+        SOURCES.setdefault(_target, []).append(_source)
+
+
+class TransitionError(Exception):
+    """A transition that did not apply: `reason` is not_found, invalid or conflict."""
+
+    def __init__(self, loan_id, target, reason, status=None, version=None):
+        self.loan_id = loan_id
+        self.target = target
+        self.reason = reason
+        self.status = status  # current status, if the loan exists
+        self.version = version  # current version, if the loan exists
+        if reason == "not_found":
+            message = f"Loan {loan_id} not found"
+        elif reason == "conflict":
+            message = f"Loan {loan_id} has been modified (now at version {version})"
+        else:
+            message = f"Loan {loan_id} cannot move from {status} to {target}"
+        super().__init__(message)
+
+
+def _begin(conn):
+    if not conn.in_transaction:
+        # Take the write lock up front so a busy writer waits here
+        # (busy_timeout) instead of failing mid-transaction
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def transition(conn, loan_id, target, expected_version=None):
+    """Move one loan to `target`; returns {id, status, version, farmer_id}.
+
+    Raises TransitionError when the loan is missing, not in a status
+    `target` can be entered from, or no longer at `expected_version`.
+    """
+    sources = SOURCES.get(target)
+    if sources is None:
+        raise ValueError(f"unknown target status {target}")
+    _begin(conn)
+    version_sql = "" if expected_version is None else "AND version = ?"
+    params = [target, loan_id, *sources] + ([] if expected_version is None else [expected_version])
+    row = conn.execute(f"""
+        UPDATE loan_requests SET status = ?, version = version + 1
+        WHERE id = ? AND status IN ({','.join('?' * len(sources))}) {version_sql}
+        RETURNING id, status, version, (SELECT farmer_id FROM farms WHERE id = farm_id) AS farmer_id
+    """, params).fetchall()
+    if row:
+        return dict(row[0])
+
+    current = conn.execute("SELECT status, version FROM loan_requests WHERE id = ?", (loan_id,)).fetchone()
+    if current is None:
+        raise TransitionError(loan_id, target, "not_found")
+    if current['status'] in sources:
+        raise TransitionError(loan_id, target, "conflict", current['status'], current['version'])
+    raise TransitionError(loan_id, target, "invalid", current['status'], current['version'])
+
+
+def transition_many(conn, loan_ids, source, target):
+    """Move every loan of `loan_ids` still in `source` to `target`.
+
+    For internal batch transitions (payoff); returns the ids that moved.
+    """
+    if target not in TRANSITIONS.get(source, ()):
+        raise ValueError(f"{source} -> {target} is not a loan transition")
+    _begin(conn)
+    loan_ids = list(loan_ids)
+    moved = []
+    for start in range(0, len(loan_ids), IN_CHUNK):
+        chunk = loan_ids[start:start + IN_CHUNK]
+        moved.extend(row[0] for row in conn.execute(f"""
+            UPDATE loan_requests SET status = ?, version = version + 1
+            WHERE id IN ({','.join('?' * len(chunk))}) AND status = ?
+            RETURNING id
+        """, (target, *chunk, source)).fetchall())
+    return moved
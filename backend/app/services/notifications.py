@@ -0,0 +1,144 @@
+# Farmer notifications, precomputed.
+#
+# The notifications job (services/jobs.py) writes each farmer's list to
+# `farmer_notifications` and records in `farmer_notification_state` the
+# loan_changes seq the list reflects. Reading is then two primary-key
+# lookups. A farmer with a newer loan change (their own signature or
+# payment, an installment the overdue job just found unpaid) is built
+# inline from the loan tables until the job catches up, so a list is never
+# older than the farmer's last write.
+import datetime
+
+from . import amortization
+from .balances import IN_CHUNK, paid_totals
+
+
+def current_seq(conn):
+    """Latest loan_changes seq handed out (0 before the first change)."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'loan_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def _display_date(iso_date):
+    return datetime.date.fromisoformat(iso_date).strftime("%d.%m.%Y")
+
+
+def build(conn, farmer_ids, today=None):
+    """Map farmer id -> notification dicts, from the loan tables (IN_CHUNK farmers at most)."""
+    farmer_ids = list(farmer_ids)
+    today = today or datetime.date.today().isoformat()
+    in_farmers = f"({','.join('?' * len(farmer_ids))})"
+    # Loans are looked up through the (farm_id, status) index whether or
+    # not the database has been ANALYZEd
+    farms = f"SELECT id FROM farms WHERE farmer_id IN {in_farmers}"
+    lists = {farmer_id: [] for farmer_id in farmer_ids}
+
+    # Loans waiting signature (sorted here: ORDER BY id would make SQLite
+    # walk loan_requests by rowid instead of the farm/status index)
+    for loan_id, amount, farmer_id in sorted(conn.execute(f"""
+        SELECT lr.id, lr.amount, fa.farmer_id
+        FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+        WHERE lr.farm_id IN ({farms}) AND lr.status = 'waiting_signature'
+    """, farmer_ids).fetchall(), key=lambda row: row[0]):
+        lists[farmer_id].append({
+            "id": f"sign_{loan_id}",
+            "title": "Action Required",
+            "message": f"Loan application for ${amount:,.0f} approved! Please sign the contract.",
+            "type": "alert",
+            "link": "/farmer/loans",
+        })
+
+    # Overdue installments, as found by the overdue job
+    for farmer_id, installments, amount, since in conn.execute(f"""
+        SELECT farmer_id, SUM(installments_overdue), SUM(amount_overdue), MIN(overdue_since)
+        FROM overdue_loans WHERE farmer_id IN {in_farmers}
+        GROUP BY farmer_id
+    """, farmer_ids):
+        plural = "s" if installments != 1 else ""
+        lists[farmer_id].append({
+            "id": "overdue",
+            "title": "Payment Overdue",
+            "message": f"{installments} installment{plural} totalling ${amount:,.2f} "
+                       f"unpaid since {_display_date(since)}. Please pay to avoid penalties.",
+            "type": "alert",
+            "link": "/farmer/loans",
+        })
+
+    # Active loans, with the earliest installment not yet covered by payments
+    active = conn.execute(f"""
+        SELECT lr.id, fa.farmer_id
+        FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+        WHERE lr.farm_id IN ({farms}) AND lr.status = 'active'
+    """, farmer_ids).fetchall()
+    if active:
+        loan_ids = [loan_id for loan_id, _ in active]
+        paid = paid_totals(conn, loan_ids)
+        schedules = amortization.load_schedules(conn, loan_ids)
+        counts, next_due = {}, {}
+        for loan_id, farmer_id in active:
+            counts[farmer_id] = counts.get(farmer_id, 0) + 1
+            installment = amortization.position(schedules.get(loan_id, ()), paid[loan_id], today)[0]
+            if installment is not None and (farmer_id not in next_due or installment[1] < next_due[farmer_id][1]):
+                next_due[farmer_id] = installment
+        for farmer_id, count in counts.items():
+            upcoming = ""
+            if farmer_id in next_due:
+                _, due_date, amount, _ = next_due[farmer_id]
+                upcoming = f" Next payment of ${amount:,.2f} is due on {_display_date(due_date)}."
+            lists[farmer_id].append({
+                "id": "active_summary",
+                "title": "Monthly Update",
+                "message": f"You have {count} active credits.{upcoming}",
+                "type": "info",
+                "link": "/farmer/loans",
+            })
+    return lists
+
+
+def refresh(conn, farmer_ids, today=None):
+    """Rebuild and store the lists of `farmer_ids` in the current transaction."""
+    seq = current_seq(conn)
+    farmer_ids = list(farmer_ids)
+    for offset in range(0, len(farmer_ids), IN_CHUNK):
+        chunk = farmer_ids[offset:offset + IN_CHUNK]
+        lists = build(conn, chunk, today)
+        conn.execute(f"DELETE FROM farmer_notifications WHERE farmer_id IN ({','.join('?' * len(chunk))})", chunk)
+        conn.executemany("""
+            INSERT INTO farmer_notifications (farmer_id, position, notification_id, title, message, type, link)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, ((farmer_id, position, n["id"], n["title"], n["message"], n["type"], n["link"])
+              for farmer_id, items in lists.items() for position, n in enumerate(items)))
+        conn.executemany("""
+            INSERT INTO farmer_notification_state (farmer_id, change_seq, computed_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(farmer_id) DO UPDATE SET change_seq = excluded.change_seq, computed_at = excluded.computed_at
+        """, ((farmer_id, seq) for farmer_id in chunk))
+    return len(farmer_ids)
+
+
+def rebuild(conn, min_farmer_id=1, today=None):
+    """Refresh every farmer with id >= min_farmer_id (after a bulk load)."""
+    after = min_farmer_id - 1
+    while True:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM farmers WHERE id > ? ORDER BY id LIMIT ?", (after, IN_CHUNK)
+        )]
+        if not ids:
+            return
+        refresh(conn, ids, today)
+        after = ids[-1]
+
+
+def for_farmer(conn, farmer_id, today=None):
+    """The farmer's notifications: stored, or built inline when stale."""
+    computed, changed = conn.execute("""
+        SELECT (SELECT change_seq FROM farmer_notification_state WHERE farmer_id = ?),
+               (SELECT MAX(seq) FROM loan_changes WHERE farmer_id = ?)
+    """, (farmer_id, farmer_id)).fetchone()
+    if computed is None or (changed is not None and changed > computed):
+        return build(conn, [farmer_id], today)[farmer_id]
+    return [dict(row) for row in conn.execute("""
+        SELECT notification_id AS id, title, message, type, link
+        FROM farmer_notifications WHERE farmer_id = ?
+        ORDER BY position
+    """, (farmer_id,))]
@@ -0,0 +1,170 @@
+# Payment application engine shared by the single-payment endpoint and
+# bulk ingestion. A batch is validated, de-duplicated by idempotency key,
+# applied with executemany and checked for payoff in one pass, all inside
+# one transaction.
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+from . import loan_state
+from . import amortization
+from .balances import paid_totals, IN_CHUNK, PAYOFF_EPSILON
+
+
+@dataclass
+class PaymentRow:
+    loan_id: int
+    amount: float
+    idempotency_key: Optional[str] = None
+    payment_date: Optional[str] = None  # ISO date; defaults to today
+
+
+def parse_payment(data):
+    """Build a PaymentRow from a loosely-typed mapping (JSON object or CSV row).
+
+    Raises ValueError with a message suitable for per-row reporting.
+    """
+    try:
+        loan_id = int(data['loan_id'])
+        amount = float(data['amount'])
+    except KeyError as exc:
+        raise ValueError(f"missing field {exc.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("loan_id and amount must be numbers")
+    key = data.get('idempotency_key') or None
+    payment_date = data.get('payment_date') or None
+    if payment_date is not None:
+        try:
+            payment_date = datetime.date.fromisoformat(str(payment_date)[:10]).isoformat()
+        except ValueError:
+            raise ValueError("payment_date must be an ISO date")
+    return PaymentRow(loan_id, amount, str(key) if key is not None else None, payment_date)
+
+
+def _fetch_in(conn, sql, ids):
+    """Run `sql` (containing one `{ids}` placeholder list) over ids in chunks."""
+    ids = list(ids)
+    rows = []
+    for start in range(0, len(ids), IN_CHUNK):
+        chunk = ids[start:start + IN_CHUNK]
+        rows.extend(conn.execute(sql.format(ids=",".join("?" * len(chunk))), chunk).fetchall())
+    return rows
+
+
+def _recorded_keys(conn, scoped_keys):
+    """Map (farmer_id, key) -> recorded outcome row, for the pairs that exist."""
+    scoped_keys = list(scoped_keys)
+    seen = {}
+    # Two parameters per pair
+    for start in range(0, len(scoped_keys), IN_CHUNK // 2):
+        chunk = scoped_keys[start:start + IN_CHUNK // 2]
+        # Joined rather than `(farmer_id, key) IN (VALUES ...)`, which SQLite
+        # answers with a table scan
+        for row in conn.execute(f"""
+            SELECT pi.farmer_id, pi.key, pi.loan_id, pi.amount, pi.outcome
+            FROM (VALUES {','.join(['(?, ?)'] * len(chunk))}) AS wanted
+            JOIN payment_idempotency pi ON pi.farmer_id = wanted.column1 AND pi.key = wanted.column2
+        """, [value for pair in chunk for value in pair]):
+            seen[row['farmer_id'], row['key']] = row
+    return seen
+
+
+def apply_payments(conn, rows):
+    """Apply a batch of payments; returns one result dict per input row.
+
+    Each result has `index`, `loan_id` and `status`: applied, paid_off,
+    duplicate (idempotency key seen before, original outcome echoed) or
+    rejected (with `error`). Applied and paid-off results also carry the
+    loan's `farmer_id`, so the caller can publish events after commit;
+    duplicate and rejected results do not.
+    """
+    if not conn.in_transaction:
+        # Take the write lock up front: the batch reads balances it then updates
+        conn.execute("BEGIN IMMEDIATE")
+    today = datetime.date.today().isoformat()
+    results = [None] * len(rows)
+
+    loan_ids = {r.loan_id for r in rows if isinstance(r, PaymentRow)}
+    loans = {
+        row['id']: row
+        for row in _fetch_in(conn, """
+            SELECT lr.id, lr.amount, lr.term_months, lr.annual_rate, lr.schedule_method, lr.status, fa.farmer_id
+            FROM loan_requests lr
+            JOIN farms fa ON lr.farm_id = fa.id
+            WHERE lr.id IN ({ids})
+        """, loan_ids)
+    }
+
+    # Idempotency keys are scoped to the loan's farmer, so one farmer's key
+    # never matches (or reveals) another's. An archived loan's farmer is in
+    # loan_history: a retry of the payment that closed it is still a duplicate
+    owners = {loan_id: loan['farmer_id'] for loan_id, loan in loans.items()}
+    keyed = {r.loan_id for r in rows if isinstance(r, PaymentRow) and r.idempotency_key}
+    for row in _fetch_in(conn, "SELECT loan_id, farmer_id FROM loan_history WHERE loan_id IN ({ids})",
+                         keyed - owners.keys()):
+        owners[row['loan_id']] = row['farmer_id']
+    seen = _recorded_keys(conn, {
+        (owners[r.loan_id], r.idempotency_key)
+        for r in rows if isinstance(r, PaymentRow) and r.idempotency_key and r.loan_id in owners
+    })
+    paid = paid_totals(conn, loans.keys())
+    # Amount owed per loan from its stored schedule, looked up once per loan
+    # rather than per payment; derived from the terms if it has none
+    owed = amortization.schedule_totals(conn, loans.keys())
+    for loan_id, loan in loans.items():
+        if loan_id not in owed:
+            owed[loan_id] = amortization.total_repayment(loan['amount'], loan['term_months'],
+                                                         *amortization.loan_terms(loan))
+
+    inserts, key_records, paid_off = [], [], []
+    for index, row in enumerate(rows):
+        if isinstance(row, Exception):
+            results[index] = {"index": index, "loan_id": None, "status": "rejected", "error": str(row)}
+            continue
+        result = {"index": index, "loan_id": row.loan_id}
+        results[index] = result
+
+        scoped_key = (owners.get(row.loan_id), row.idempotency_key)
+        if row.idempotency_key and scoped_key in seen:
+            previous = seen[scoped_key]
+            if previous['loan_id'] != row.loan_id or abs(previous['amount'] - row.amount) > 0.005:
+                result.update(status="rejected", error="idempotency key reused with different payment")
+            else:
+                result.update(status="duplicate", original_status=previous['outcome'])
+            continue
+        if row.amount <= 0:
+            result.update(status="rejected", error="Invalid payment amount")
+            continue
+        loan = loans.get(row.loan_id)
+        if not loan or loan['status'] != 'active' or loan['id'] in paid_off:
+            result.update(status="rejected", error="Loan not active or found")
+            continue
+
+        paid[loan['id']] += row.amount
+        remaining = owed[loan['id']] - paid[loan['id']]
+        inserts.append((loan['id'], row.amount, row.payment_date or today))
+        result.update(status="applied", remaining=round(remaining, 2), farmer_id=loan['farmer_id'])
+        if remaining <= PAYOFF_EPSILON:
+            paid_off.append(loan['id'])
+            result['status'] = "paid_off"
+        if row.idempotency_key:
+            record = {'loan_id': loan['id'], 'amount': row.amount, 'outcome': result['status']}
+            seen[scoped_key] = record
+            key_records.append((loan['farmer_id'], row.idempotency_key, loan['id'], row.amount, result['status']))
+
+    if inserts:
+        conn.executemany("INSERT INTO payments (loan_id, amount, payment_date) VALUES (?, ?, ?)", inserts)
+    if key_records:
+        conn.executemany(
+            "INSERT INTO payment_idempotency (farmer_id, key, loan_id, amount, outcome) VALUES (?, ?, ?, ?, ?)",
+            key_records,
+        )
+    if paid_off:
+        settle_paid_off(conn, paid_off)
+    return results
+
+
+def settle_paid_off(conn, loan_ids):
+    # Fully paid - close the loans through the state machine. They stay in
+    # the hot tables until the archive job (services/archive.py) moves them
+    return loan_state.transition_many(conn, loan_ids, 'active', 'paid_off')
@@ -0,0 +1,52 @@
+# Bank portfolio aggregates. `portfolio_stats` is maintained by triggers on
+# loan_requests (see migration 003); this module reads it and reconciles
+# it against a full recompute.
+
+# Float sums drift a little over many +/- updates
+AMOUNT_TOLERANCE = 0.005
+
+
+def read_stats(conn):
+    """Map status -> (loan_count, total_amount) from the aggregate table."""
+    rows = conn.execute("SELECT status, loan_count, total_amount FROM portfolio_stats").fetchall()
+    return {row['status']: (row['loan_count'], row['total_amount']) for row in rows}
+
+
+def recompute_stats(conn):
+    rows = conn.execute("""
+        SELECT status, COUNT(*) AS loan_count, COALESCE(SUM(amount), 0) AS total_amount
+        FROM loan_requests GROUP BY status
+    """).fetchall()
+    return {row['status']: (row['loan_count'], row['total_amount']) for row in rows}
+
+
+def reconcile(conn, repair=True):
+    """Compare the maintained aggregates with a full recompute.
+
+    Returns a list of mismatches (status, stored, actual). With repair, the
+    table is rewritten from the recompute in the same transaction.
+    """
+    if repair and not conn.in_transaction:
+        # Take the write lock up front so no loan write lands between
+        # the recompute and the rewrite
+        conn.execute("BEGIN IMMEDIATE")
+    stored = read_stats(conn)
+    actual = recompute_stats(conn)
+    mismatches = []
+    for status in sorted(set(stored) | set(actual)):
+        s_count, s_amount = stored.get(status, (0, 0.0))
+        a_count, a_amount = actual.get(status, (0, 0.0))
+        if s_count != a_count or abs(s_amount - a_amount) > AMOUNT_TOLERANCE:
+            mismatches.append({
+                "status": status,
+                "stored": {"loan_count": s_count, "total_amount": s_amount},
+                "actual": {"loan_count": a_count, "total_amount": a_amount},
+            })
+
+    if repair and (mismatches or set(stored) != set(actual)):
+        conn.execute("DELETE FROM portfolio_stats")
+        conn.executemany(
+            "INSERT INTO portfolio_stats (status, loan_count, total_amount) VALUES (?, ?, ?)",
+            [(status, count, amount) for status, (count, amount) in actual.items()],
+        )
+    return mismatches
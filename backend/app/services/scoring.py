@@ -0,0 +1,148 @@
+# Risk-analysis engine for loan applications.
+#
+# Analyses are a pure function of the application's inputs and the model
+# version, so they are computed once and stored in `application_scores`,
+# keyed by loan id, model version and a hash of the inputs. Triggers
+# (migration 005) drop a stored analysis when the loan or the farmer's
+# credit score changes; listings also re-hash each row's inputs and
+# re-score when the stored hash differs, so a write the triggers miss (or
+# a new model input) cannot leave a stale analysis behind.
+import hashlib
+import json
+
+from ..serialization import loads
+
+
+class RiskModel:
+    """Base class for pluggable scoring models.
+
+    Subclasses set `version` and implement `analyze(inputs)` returning
+    yield_potential, risk_factors and ai_score_breakdown. Bump `version`
+    whenever the output for the same inputs changes.
+    """
+    version = "base"
+
+    def inputs(self, row):
+        # Everything the analysis may depend on; also what input_hash covers
+        return {
+            "amount": row['amount'],
+            "term_months": row['term_months'],
+            "purpose": row['purpose'],
+            "credit_score": row['credit_score'],
+            "farm_size": row['farm_size'],
+        }
+
+    def analyze(self, inputs):
+        raise NotImplementedError
+
+
+class RuleBasedRiskModel(RiskModel):
+    version = "rules-v1"
+
+    def analyze(self, inputs):
+        credit_score = inputs['credit_score'] or 0
+        amount = inputs['amount'] or 0
+
+        risk_factors = []
+        if credit_score < 650:
+            risk_factors.append("Recent late payments")
+            risk_factors.append("Low equity")
+        else:
+            risk_factors.append("Stable market demand")
+
+        if amount > 5000:
+            risk_factors.append("High capital exposure")
+
+        # Yield estimate scales with the farmer's track record (4-8 t/ha)
+        score_band = min(max(credit_score - 550, 0), 270) / 270
+        yield_tons = 4 + round(score_band * 4)
+
+        return {
+            "yield_potential": f"{yield_tons} tons/ha",
+            "risk_factors": risk_factors,
+            "ai_score_breakdown": {
+                "Collateral": 85,
+                "History": credit_score // 10,
+                "Market": 90,
+            },
+        }
+
+
+_active_model = RuleBasedRiskModel()
+
+
+def active_model():
+    return _active_model
+
+
+def use_model(model):
+    """Swap the scoring model. Stored analyses from other versions are ignored."""
+    global _active_model
+    _active_model = model
+
+
+def input_hash(model, inputs):
+    payload = json.dumps([model.version, inputs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def score_rows(conn, rows, model=None):
+    """Score application rows and persist the results.
+
+    Rows need the columns used by `model.inputs` plus `id`. Returns a map
+    of loan id -> analysis dict.
+    """
+    model = model or _active_model
+    results, records = {}, []
+    for row in rows:
+        inputs = model.inputs(row)
+        analysis = model.analyze(inputs)
+        results[row['id']] = analysis
+        records.append((row['id'], model.version, input_hash(model, inputs), json.dumps(analysis)))
+    if records:
+        conn.executemany("""
+            INSERT INTO application_scores (loan_id, model_version, input_hash, analysis)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(loan_id) DO UPDATE SET
+                model_version = excluded.model_version,
+                input_hash = excluded.input_hash,
+                analysis = excluded.analysis,
+                computed_at = CURRENT_TIMESTAMP
+        """, records)
+    return results
+
+
+def score_loans(conn, loan_ids, model=None):
+    """Load and score the given loans (e.g. right after they are created)."""
+    loan_ids = list(loan_ids)
+    if not loan_ids:
+        return {}
+    placeholders = ",".join("?" * len(loan_ids))
+    rows = conn.execute(f"""
+        SELECT lr.id, lr.amount, lr.term_months, lr.purpose, f.credit_score, fa.size_acres as farm_size
+        FROM loan_requests lr
+        JOIN farms fa ON lr.farm_id = fa.id
+        JOIN farmers f ON fa.farmer_id = f.id
+        WHERE lr.id IN ({placeholders})
+    """, loan_ids).fetchall()
+    return score_rows(conn, rows, model)
+
+
+def analyses_for(conn, rows, model=None):
+    """Analyses for listed rows, reading the stored `analysis` column when it
+    was computed from the row's current inputs.
+
+    Rows are expected to come from a query that LEFT JOINs
+    application_scores for the active model version as `analysis` and
+    `input_hash`.
+    """
+    model = model or _active_model
+    results, missing = {}, []
+    for row in rows:
+        if row['analysis'] is not None and row['input_hash'] == input_hash(model, model.inputs(row)):
+            results[row['id']] = loads(row['analysis'])
+        else:
+            missing.append(row)
+    if missing:
+        results.update(score_rows(conn, missing, model))
+    return results
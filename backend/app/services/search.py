@@ -0,0 +1,271 @@
+# Bank directory search.
+#
+# `farmer_search` is an FTS5 table with one document per farmer (rowid =
+# farmer id): name, email, farm names and the purposes of their loans.
+# `farmer_stats` holds the per-farmer aggregates the directory shows
+# (loan count, active loans, active debt). Both are kept current by
+# triggers (migration 012), so a search is one FTS query for a page of
+# ids plus primary-key lookups for those rows.
+#
+# Queries match the words typed so far, the last one as a prefix; if
+# that finds nothing, every word as a prefix ("gof kar" finds "Gofurov
+# Karimov"). A full email address is looked up exactly. When prefixes
+# find nothing either, words are widened to indexed terms within a small
+# edit distance ("gofurvo" -> "gofurov"). Candidates come from the FTS
+# vocabulary and share the word's first two letters, so a typo there is
+# not corrected.
+import re
+
+# bm25 weights: full_name, email, farms, purposes. Stored as the table's
+# rank function by the migration.
+RANK_WEIGHTS = (10.0, 4.0, 3.0, 1.0)
+RANK = f"bm25({', '.join(str(w) for w in RANK_WEIGHTS)})"
+
+# Prefix lengths the FTS index keeps pre-merged doclists for
+INDEXED_PREFIX = 3
+
+# Tried in order until one finds something; the next page reuses the mode
+MATCH_MODES = ("typeahead", "prefix", "fuzzy")
+
+# Fuzzy widening: words at least this long, at most this many terms each
+FUZZY_MIN_LENGTH = 4
+FUZZY_TERMS = 8
+FUZZY_CANDIDATES = 20_000  # vocabulary rows scanned per word at most
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+
+def _without_digits(column):
+    # Emails are indexed without their digits: "aziz.karimov1984@..." would
+    # otherwise add a unique "karimov1984" term per farmer, and every
+    # prefix query on a surname would have to merge all of them. Full
+    # addresses are looked up through the farmers.email index instead.
+    for digit in "0123456789":
+        column = f"replace({column}, '{digit}', ' ')"
+    return column
+
+
+# Body of the triggers that re-index one farmer; {farmer} is an SQL
+# expression for the farmer id
+REFRESH_DOCUMENT = f"""
+    DELETE FROM farmer_search WHERE rowid = {{farmer}};
+    INSERT INTO farmer_search (rowid, full_name, email, farms, purposes)
+    SELECT f.id, f.full_name, {_without_digits("f.email")},
+           (SELECT group_concat(name, ' ') FROM farms WHERE farmer_id = f.id),
+           (SELECT group_concat(DISTINCT lr.purpose) FROM loan_requests lr
+            JOIN farms fa ON lr.farm_id = fa.id WHERE fa.farmer_id = f.id)
+    FROM farmers f WHERE f.id = {{farmer}};
+"""
+
+
+def rebuild(conn, min_farmer_id=1):
+    """Re-index farmers with id >= min_farmer_id (documents and stats).
+
+    For bulk loads that run with the triggers dropped; one grouped pass
+    instead of a per-row refresh.
+    """
+    conn.execute("DELETE FROM farmer_search WHERE rowid >= ?", (min_farmer_id,))
+    conn.execute("DELETE FROM farmer_stats WHERE farmer_id >= ?", (min_farmer_id,))
+    conn.execute(f"""
+        INSERT INTO farmer_search (rowid, full_name, email, farms, purposes)
+        SELECT f.id, f.full_name, {_without_digits("f.email")}, fm.names, lp.purposes
+        FROM farmers f
+        LEFT JOIN (
+            SELECT farmer_id, group_concat(name, ' ') AS names FROM farms
+            WHERE farmer_id >= ? GROUP BY farmer_id
+        ) fm ON fm.farmer_id = f.id
+        LEFT JOIN (
+            SELECT fa.farmer_id, group_concat(DISTINCT lr.purpose) AS purposes
+            FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+            WHERE fa.farmer_id >= ? GROUP BY fa.farmer_id
+        ) lp ON lp.farmer_id = f.id
+        WHERE f.id >= ?
+    """, (min_farmer_id, min_farmer_id, min_farmer_id))
+    conn.execute("""
+        INSERT INTO farmer_stats (farmer_id, loan_count, active_loans, active_debt)
+        SELECT f.id, COALESCE(l.loan_count, 0), COALESCE(l.active_loans, 0), COALESCE(l.active_debt, 0)
+        FROM farmers f
+        LEFT JOIN (
+            SELECT fa.farmer_id, COUNT(*) AS loan_count,
+                   SUM(lr.status = 'active') AS active_loans,
+                   SUM(CASE WHEN lr.status = 'active' THEN lr.amount ELSE 0 END) AS active_debt
+            FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id
+            WHERE fa.farmer_id >= ? GROUP BY fa.farmer_id
+        ) l ON l.farmer_id = f.id
+        WHERE f.id >= ?
+    """, (min_farmer_id, min_farmer_id))
+
+
+def words(query):
+    return [w.lower() for w in _WORD.findall(query or "")]
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def prefix_match(query):
+    """FTS5 expression matching every word as a prefix, or None if there are no words."""
+    terms = words(query)
+    if not terms:
+        return None
+    return " AND ".join(_quote(t) + "*" for t in terms)
+
+
+def typeahead_match(query):
+    """Like prefix_match, but only the last word (the one being typed) is a prefix.
+
+    A whole word reads one doclist. A prefix longer than the indexed
+    prefix lengths has to merge the doclists of every term it covers, and
+    at a million farmers that is most of a query's cost.
+    """
+    terms = words(query)
+    if not terms:
+        return None
+    return " AND ".join(
+        [_quote(t) + ("*" if len(t) <= INDEXED_PREFIX else "") for t in terms[:-1]] + [_quote(terms[-1]) + "*"]
+    )
+
+
+def edit_distance(a, b, limit):
+    """Edit distance counting an adjacent swap as one edit, or limit + 1
+    once it is certain to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit and (before is None or min(previous) > limit):
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def fuzzy_terms(conn, word):
+    """Indexed terms within 1 (2 for long words) edits of `word`, closest first."""
+    limit = 1 if len(word) <= 6 else 2
+    start = word[:2]
+    rows = conn.execute("""
+        SELECT term, doc FROM farmer_search_vocab
+        WHERE term >= ? AND term < ?
+        LIMIT ?
+    """, (start, start + "\U0010ffff", FUZZY_CANDIDATES)).fetchall()
+    scored = []
+    for term, docs in rows:
+        if term.startswith(word):
+            continue  # already matched as a prefix
+        distance = edit_distance(word, term, limit)
+        if distance <= limit:
+            scored.append((distance, -docs, term))
+    return [term for _, _, term in sorted(scored)[:FUZZY_TERMS]]
+
+
+def fuzzy_match(conn, query):
+    """Like prefix_match, with each long alphabetic word widened to nearby terms.
+
+    Returns None when no word has a near match (nothing to retry).
+    """
+    parts, widened = [], False
+    for word in words(query):
+        near = fuzzy_terms(conn, word) if len(word) >= FUZZY_MIN_LENGTH and word.isalpha() else []
+        if near:
+            widened = True
+            parts.append("(" + " OR ".join([_quote(word) + "*"] + [_quote(t) for t in near]) + ")")
+        else:
+            parts.append(_quote(word) + "*")
+    return " AND ".join(parts) if widened else None
+
+
+def _page(conn, match, after, limit):
+    keyset, params = "", [match]
+    if after is not None:
+        keyset = "AND (rank, rowid) > (?, ?)"
+        params.extend(after)
+    # Page through the FTS index first, then look up only that page's rows
+    return conn.execute(f"""
+        SELECT m.id, m.full_name, f.email, m.farms, m.rank, f.credit_score,
+               st.loan_count, st.active_loans, st.active_debt
+        FROM (
+            SELECT rowid AS id, full_name, farms, rank FROM farmer_search
+            WHERE farmer_search MATCH ? {keyset}
+            ORDER BY rank, rowid
+            LIMIT ?
+        ) m
+        JOIN farmers f ON f.id = m.id
+        JOIN farmer_stats st ON st.farmer_id = m.id
+        ORDER BY m.rank, m.id
+    """, (*params, limit + 1)).fetchall()
+
+
+def _listing(conn, where, params, limit):
+    return conn.execute(f"""
+        SELECT s.rowid AS id, s.full_name, f.email, s.farms, NULL AS rank, f.credit_score,
+               st.loan_count, st.active_loans, st.active_debt
+        FROM (SELECT rowid, full_name, farms FROM farmer_search WHERE {where} ORDER BY rowid LIMIT ?) s
+        JOIN farmers f ON f.id = s.rowid
+        JOIN farmer_stats st ON st.farmer_id = s.rowid
+        ORDER BY s.rowid
+    """, (*params, limit + 1)).fetchall()
+
+
+def match_expression(conn, query, mode):
+    if mode == "typeahead":
+        return typeahead_match(query)
+    if mode == "fuzzy":
+        return fuzzy_match(conn, query)
+    return prefix_match(query)
+
+
+def _check_after(query, after):
+    # A key from another kind of page (or edited by hand) would bind the
+    # wrong number of values in the keyset, or echo an unknown mode back
+    number = (int, float)
+    if words(query):
+        valid = (len(after) == 3 and after[0] in MATCH_MODES
+                 and isinstance(after[1], number) and isinstance(after[2], int))
+    else:
+        valid = len(after) == 2 and after[0] == "list" and isinstance(after[1], int)
+    if not valid:
+        raise ValueError("cursor does not fit the query")
+
+
+def search_farmers(conn, query, after=None, limit=20):
+    """Ranked page of farmers matching `query`, or all farmers by id when it is empty.
+
+    `after` is the previous page's last (mode, rank, id) (or (mode, id)
+    for a listing). Returns (rows, mode, has_more) where mode is "list",
+    "email" or one of MATCH_MODES; pass it back with the next page's `after`.
+    Raises ValueError if `after` does not fit the query.
+    """
+    query = (query or "").strip()
+    if after is not None:
+        _check_after(query, after)
+    if "@" in query and not any(c.isspace() for c in query):
+        # A full address: the farmers.email unique index, not the FTS index
+        rows = _listing(conn, "rowid = (SELECT id FROM farmers WHERE email = ?)", (query,), limit)
+        return rows[:limit], "email", False
+    if not words(query):
+        rows = _listing(conn, "rowid > ?", (after[-1] if after is not None else 0,), limit)
+        return rows[:limit], "list", len(rows) > limit
+
+    if after is not None:
+        mode = after[0]
+        rows = _page(conn, match_expression(conn, query, mode) or prefix_match(query), tuple(after[1:]), limit)
+        return rows[:limit], mode, len(rows) > limit
+
+    tried = set()
+    for mode in MATCH_MODES:
+        match = match_expression(conn, query, mode)
+        if match is None or match in tried:
+            continue
+        tried.add(match)
+        rows = _page(conn, match, None, limit)
+        if rows:
+            return rows[:limit], mode, len(rows) > limit
+    return [], "prefix", False
@@ -0,0 +1,230 @@
+# Time-series storage for utility meter readings.
+#
+# Raw rows stay in `utility_readings`; every ingest also folds the readings
+# into per-farm, per-utility daily and monthly rollups (`utility_rollups`,
+# migration 008) in the same transaction. Reads (latest value, month-over-
+# month diff, range queries) come from the rollups, so raw rows older than
+# the retention window can be compacted away.
+import datetime
+import os
+
+PERIODS = ("day", "month")
+# Raw readings older than this many months are compacted away (the
+# utilities job, services/jobs.py); daily/monthly rollups are kept
+RETENTION_MONTHS = int(os.environ.get("AGROCREDIT_UTILITY_RETENTION_MONTHS", "12"))
+UTILITY_UNITS = {"electricity": "kWh", "gas": "m3", "water": "m3"}
+DEFAULT_MAX_POINTS = 200
+
+
+def normalize_timestamp(value):
+    """ISO date/datetime (or datetime) -> 'YYYY-MM-DD HH:MM:SS', the format SQLite's CURRENT_TIMESTAMP uses."""
+    if value is None:
+        return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime.datetime):
+        ts = value
+    else:
+        ts = datetime.datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def period_start(timestamp, period):
+    return timestamp[:10] if period == "day" else timestamp[:7] + "-01"
+
+
+def _merge(bucket, value, ts):
+    count, vmin, vmax, vsum, first_value, last_value, first_at, last_at = bucket
+    return (
+        count + 1, min(vmin, value), max(vmax, value), vsum + value,
+        value if ts < first_at else first_value,
+        value if ts >= last_at else last_value,
+        min(first_at, ts), max(last_at, ts),
+    )
+
+
+def _fold_rollups(conn, readings):
+    # Pre-aggregate the batch per bucket so each rollup row is upserted once
+    buckets, units = {}, {}
+    for farm_id, utility_type, value, unit, ts in readings:
+        units[(farm_id, utility_type)] = unit
+        for period in PERIODS:
+            key = (farm_id, utility_type, period, period_start(ts, period))
+            bucket = buckets.get(key)
+            buckets[key] = _merge(bucket, value, ts) if bucket else (1, value, value, value, value, value, ts, ts)
+
+    conn.executemany("""
+        INSERT INTO utility_rollups (
+            farm_id, utility_type, period, period_start, unit, reading_count,
+            value_min, value_max, value_sum, first_value, last_value, first_at, last_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(farm_id, utility_type, period, period_start) DO UPDATE SET
+            unit = excluded.unit,
+            reading_count = reading_count + excluded.reading_count,
+            value_min = MIN(value_min, excluded.value_min),
+            value_max = MAX(value_max, excluded.value_max),
+            value_sum = value_sum + excluded.value_sum,
+            first_value = CASE WHEN excluded.first_at < first_at THEN excluded.first_value ELSE first_value END,
+            first_at = MIN(first_at, excluded.first_at),
+            last_value = CASE WHEN excluded.last_at >= last_at THEN excluded.last_value ELSE last_value END,
+            last_at = MAX(last_at, excluded.last_at)
+    """, [
+        (farm_id, utility_type, period, start, units[(farm_id, utility_type)], *bucket)
+        for (farm_id, utility_type, period, start), bucket in buckets.items()
+    ])
+
+
+def ingest_readings(conn, readings):
+    """Insert raw readings and fold them into the rollups.
+
+    `readings` are (farm_id, utility_type, value, unit, timestamp) tuples with
+    normalized timestamps. Runs in the caller's transaction.
+    """
+    if not readings:
+        return 0
+    conn.executemany(
+        "INSERT INTO utility_readings (farm_id, utility_type, reading_value, unit, reading_date) VALUES (?, ?, ?, ?, ?)",
+        readings,
+    )
+    _fold_rollups(conn, readings)
+    return len(readings)
+
+
+def rebuild_rollups(conn, min_farm_id=0):
+    """Recompute rollups from the raw readings still on disk.
+
+    Only days and months that still have raw readings are rewritten; the
+    rollups of compacted ones are the only history left and are kept.
+    compact_raw cuts at a month boundary, so a period either has all its
+    raw readings or none. Limited to farms with id >= `min_farm_id` (bulk
+    loads of new farms). Ties on reading_date resolve by insertion order,
+    as in ingest.
+    """
+    for period in PERIODS:
+        start = "substr(reading_date, 1, 10)" if period == "day" else "substr(reading_date, 1, 7) || '-01'"
+        conn.execute(f"""
+            INSERT INTO utility_rollups (
+                farm_id, utility_type, period, period_start, unit, reading_count,
+                value_min, value_max, value_sum, first_value, last_value, first_at, last_at
+            )
+            SELECT farm_id, utility_type, '{period}', period_start, MAX(unit), COUNT(*),
+                   MIN(reading_value), MAX(reading_value), SUM(reading_value),
+                   MAX(first_value), MAX(last_value), MIN(reading_date), MAX(reading_date)
+            FROM (
+                SELECT farm_id, utility_type, unit, reading_value, reading_date, {start} AS period_start,
+                       FIRST_VALUE(reading_value) OVER w AS first_value,
+                       LAST_VALUE(reading_value) OVER w AS last_value
+                FROM utility_readings
+                WHERE farm_id >= ?
+                WINDOW w AS (
+                    PARTITION BY farm_id, utility_type, {start} ORDER BY reading_date, id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                )
+            )
+            GROUP BY farm_id, utility_type, period_start
+            ON CONFLICT(farm_id, utility_type, period, period_start) DO UPDATE SET
+                unit = excluded.unit,
+                reading_count = excluded.reading_count,
+                value_min = excluded.value_min,
+                value_max = excluded.value_max,
+                value_sum = excluded.value_sum,
+                first_value = excluded.first_value,
+                last_value = excluded.last_value,
+                first_at = excluded.first_at,
+                last_at = excluded.last_at
+        """, (min_farm_id,))
+
+
+def latest_with_diff(conn, farm_ids):
+    """Latest reading per farm and utility with the month-over-month diff.
+
+    Reads the two most recent monthly rollups per series; diff is the
+    change in the month-end value (0 when there is no previous month).
+    """
+    rows = conn.execute(f"""
+        SELECT farm_id, utility_type, unit, last_value, period_start
+        FROM (
+            SELECT farm_id, utility_type, unit, last_value, period_start,
+                   ROW_NUMBER() OVER (PARTITION BY farm_id, utility_type ORDER BY period_start DESC) AS rn
+            FROM utility_rollups
+            WHERE period = 'month' AND farm_id IN ({','.join('?' * len(farm_ids))})
+        )
+        WHERE rn <= 2
+        ORDER BY farm_id, utility_type, period_start DESC
+    """, tuple(farm_ids)).fetchall()
+
+    series = {}
+    for row in rows:
+        series.setdefault((row['farm_id'], row['utility_type']), []).append(row)
+    latest = []
+    for months in series.values():
+        current = months[0]
+        diff = current['last_value'] - months[1]['last_value'] if len(months) > 1 else 0
+        latest.append({
+            "type": current['utility_type'],
+            "value": current['last_value'],
+            "unit": current['unit'],
+            "diff": round(diff, 3),
+        })
+    return latest
+
+
+def _downsample(points, max_points):
+    # Merge consecutive buckets so at most max_points remain
+    if len(points) <= max_points:
+        return points
+    stride = -(-len(points) // max_points)
+    merged = []
+    for start in range(0, len(points), stride):
+        group = points[start:start + stride]
+        count = sum(p["count"] for p in group)
+        merged.append({
+            "t": group[0]["t"],
+            "min": min(p["min"] for p in group),
+            "max": max(p["max"] for p in group),
+            "avg": sum(p["avg"] * p["count"] for p in group) / count,
+            "last": group[-1]["last"],
+            "count": count,
+        })
+    return merged
+
+
+def range_query(conn, farm_ids, utility_type, start, end, max_points=DEFAULT_MAX_POINTS, bucket=None):
+    """Points for one utility between two timestamps.
+
+    Picks monthly rollups for long ranges, daily rollups otherwise (or the
+    given `bucket`), then downsamples to at most `max_points`.
+    """
+    if bucket is None:
+        days = (datetime.datetime.fromisoformat(end) - datetime.datetime.fromisoformat(start)).days
+        bucket = "month" if days > max_points else "day"
+    rows = conn.execute(f"""
+        SELECT period_start, SUM(reading_count) AS count, MIN(value_min) AS vmin, MAX(value_max) AS vmax,
+               SUM(value_sum) AS vsum, SUM(last_value) AS last
+        FROM utility_rollups
+        WHERE farm_id IN ({','.join('?' * len(farm_ids))})
+          AND utility_type = ? AND period = ? AND period_start >= ? AND period_start <= ?
+        GROUP BY period_start
+        ORDER BY period_start
+    """, (*farm_ids, utility_type, bucket, period_start(start, bucket), end)).fetchall()
+    points = [
+        {"t": row['period_start'], "min": row['vmin'], "max": row['vmax'],
+         "avg": row['vsum'] / row['count'], "last": row['last'], "count": row['count']}
+        for row in rows
+    ]
+    return bucket, _downsample(points, max_points)
+
+
+def compact_raw(conn, keep_months, today=None):
+    """Delete raw readings older than `keep_months` whole months.
+
+    Rollups are kept, so history stays queryable at daily/monthly grain.
+    Returns the number of raw rows removed.
+    """
+    if keep_months < 1:
+        # 0 would put the cutoff at the start of this month: every raw row
+        raise ValueError("keep_months must be at least 1")
+    today = today or datetime.date.today()
+    month_index = today.year * 12 + (today.month - 1) - keep_months
+    cutoff = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01 00:00:00"
+    return conn.execute("DELETE FROM utility_readings WHERE reading_date < ?", (cutoff,)).rowcount
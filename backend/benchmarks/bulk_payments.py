@@ -0,0 +1,83 @@
+"""Bulk payment ingestion vs looping the single-payment endpoint.
+
+Posts the same number of small repayments (spread over active loans)
+once through POST /api/farmers/loans/{id}/pay one call at a time and
+once through POST /api/bank/payments/bulk, in-process over ASGI.
+
+    cd backend && python -m benchmarks.bulk_payments --payments 20000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+
+async def main(args):
+    import httpx
+    from app.auth import ADMIN_ROLE, create_token
+    from app.main import app
+    from app.db.database import db
+
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    populate(conn, farmers=1_000, loans=20_000)
+    owners = dict(conn.execute(
+        "SELECT lr.id, fa.farmer_id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id "
+        "WHERE lr.status = 'active'"))
+    loan_ids = list(owners)
+    conn.close()
+    payments = [(loan_ids[i % len(loan_ids)], 1.0) for i in range(args.payments)]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        single = payments[:args.single_sample]
+        # Each payment is made by the loan's owner
+        tokens = {farmer_id: f"Bearer {create_token(farmer_id)}"
+                  for farmer_id in {owners[loan_id] for loan_id, _ in single}}
+        started = time.perf_counter()
+        for i, (loan_id, amount) in enumerate(single):
+            r = await client.post(f"/api/farmers/loans/{loan_id}/pay", json={"amount": amount},
+                                  headers={"Idempotency-Key": f"single-{i}",
+                                           "Authorization": tokens[owners[loan_id]]})
+            r.raise_for_status()
+        single_rate = len(single) / (time.perf_counter() - started)
+
+        admin = {"Authorization": f"Bearer {create_token('bench', role=ADMIN_ROLE)}"}
+        body = {"payments": [
+            {"loan_id": loan_id, "amount": amount, "idempotency_key": f"bulk-{i}"}
+            for i, (loan_id, amount) in enumerate(payments)
+        ]}
+        started = time.perf_counter()
+        r = await client.post("/api/bank/payments/bulk", json=body, headers=admin)
+        r.raise_for_status()
+        bulk_rate = len(payments) / (time.perf_counter() - started)
+        print(r.json()["summary"])
+
+        ndjson = "\n".join(
+            f'{{"loan_id": {loan_id}, "amount": {amount}, "idempotency_key": "ndjson-{i}"}}'
+            for i, (loan_id, amount) in enumerate(payments)
+        )
+        started = time.perf_counter()
+        r = await client.post("/api/bank/payments/bulk/upload", content=ndjson,
+                              headers={"content-type": "application/x-ndjson", **admin})
+        r.raise_for_status()
+        upload_rate = len(payments) / (time.perf_counter() - started)
+
+    print(f"single endpoint: {single_rate:10,.0f} payments/s ({len(single):,} sampled)")
+    print(f"bulk endpoint:   {bulk_rate:10,.0f} payments/s ({len(payments):,} payments)")
+    print(f"NDJSON upload:   {upload_rate:10,.0f} payments/s ({len(payments):,} payments)")
+    print(f"speedup:         {bulk_rate / single_rate:10.1f}x (JSON)  {upload_rate / single_rate:.1f}x (NDJSON)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payments", type=int, default=20_000)
+    parser.add_argument("--single-sample", type=int, default=2_000)
+    args = parser.parse_args()
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "payments.db"))
+    os.environ.setdefault("AGROCREDIT_JWT_SECRET", "benchmark-secret")
+    asyncio.run(main(args))
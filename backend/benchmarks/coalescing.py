@@ -0,0 +1,115 @@
+"""Database statements per burst of identical bank reads, with and without
+request coalescing.
+
+Loads --farmers / --loans into a temporary database, then for each
+--clients level fires that many identical requests at once, --rounds
+times, at GET /api/bank/dashboard and GET /api/bank/applications. Every
+burst runs with the single-flight layer (app/coalesce.py) off, then on;
+reusable results are dropped between bursts, so each one starts cold.
+Statements are summed from X-Query-Count.
+
+Without coalescing the statement count grows with the clients; with it a
+burst costs about what one request costs. Exits non-zero if, with
+coalescing on, the largest level runs more than twice the statements per
+burst of a single client.
+
+    cd backend && python -m benchmarks.coalescing --clients 1 10 50 100 200
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+ENDPOINTS = [
+    ("dashboard", "/api/bank/dashboard", None),
+    ("applications", "/api/bank/applications", {"sort": "amount", "order": "desc", "limit": 50}),
+]
+
+
+async def burst(client, path, params, clients):
+    async def one():
+        started = time.perf_counter()
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        return time.perf_counter() - started, int(response.headers["x-query-count"])
+
+    results = await asyncio.gather(*(one() for _ in range(clients)))
+    return [latency for latency, _ in results], sum(queries for _, queries in results)
+
+
+async def main(args):
+    import httpx
+    from app.coalesce import single_flight
+    from app.db.database import db
+    from app.main import app
+
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    started = time.perf_counter()
+    populate(conn, farmers=args.farmers, loans=args.loans, seed=args.seed)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print(f"Loaded {args.farmers:,} farmers, {args.loans:,} loans in {time.perf_counter() - started:.1f}s\n")
+
+    failures = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for name, path, params in ENDPOINTS:
+            print(f"{name}")
+            print(f"{'clients':>8} {'mode':>5} {'queries/burst':>14} {'queries/req':>12} "
+                  f"{'p50 ms':>8} {'p95 ms':>8} {'coalesced':>10}")
+            per_burst = {}
+            for clients in args.clients:
+                for enabled in (False, True):
+                    single_flight.enabled = enabled
+                    coalesced = single_flight.totals.coalesced
+                    latencies, queries = [], 0
+                    for _ in range(args.rounds):
+                        single_flight.invalidate()
+                        burst_latencies, burst_queries = await burst(client, path, params, clients)
+                        latencies += burst_latencies
+                        queries += burst_queries
+                    latencies.sort()
+                    mode = "on" if enabled else "off"
+                    per_burst[clients, mode] = queries / args.rounds
+                    print(f"{clients:>8} {mode:>5} {queries / args.rounds:>14.1f} "
+                          f"{queries / (args.rounds * clients):>12.2f} "
+                          f"{statistics.median(latencies) * 1000:>8.1f} "
+                          f"{latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0] * 1000:>8.1f} "
+                          f"{single_flight.totals.coalesced - coalesced:>10}")
+            print()
+            single, largest = per_burst[args.clients[0], "on"], per_burst[args.clients[-1], "on"]
+            if largest > 2 * single:
+                failures.append(f"{name}: {largest:.0f} statements per burst of {args.clients[-1]} "
+                                f"clients vs {single:.0f} for {args.clients[0]}")
+    single_flight.enabled = True
+    db.close()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--farmers", type=int, default=5_000)
+    parser.add_argument("--loans", type=int, default=50_000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    args.clients.sort()
+
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "coalescing.db"))
+    # Per-request timing is what is measured here; the DB work is on the executor
+    os.environ.setdefault("AGROCREDIT_SCHEDULER", "0")
+    asyncio.run(main(args))
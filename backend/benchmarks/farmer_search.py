@@ -0,0 +1,127 @@
+"""Bank farmer search latency as the directory grows.
+
+Grows one database through --farmers levels (10k, 100k, 1M by default)
+and at each level runs a fixed mix of queries through GET
+/api/bank/farmers: a full name, a name and farm, the name part of an
+email, a full email address, a loan purpose plus a surname, a misspelled
+surname (fuzzy fallback), the unfiltered listing and a broad query.
+Reports p50/p95 per query and how many farmers it matches.
+
+Ranking scores every match before returning a page, so latency grows
+with the match count rather than the directory size. Queries matching at
+most --selective farmers should stay under --budget ms p50; the script
+exits non-zero if one does not. Broader ones ("aziz" matches 1 in 40
+farmers) are reported but not held to the budget.
+
+    cd backend && python -m benchmarks.farmer_search --farmers 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+# (label, q); q None is a farmer's email address, picked per level
+QUERIES = [
+    ("full name", "Rustam Karimov"),
+    ("name + farm", "sherzod orchards"),
+    ("email name", "dilnoza.yusupov"),
+    ("email address", None),
+    ("purpose + surname", "irrigation rakhimov"),
+    ("typo (fuzzy)", "khodjaeav madina"),
+    ("listing", ""),
+    ("listing page 2", ""),
+    ("broad", "aziz"),
+    ("broad page 2", "aziz"),
+]
+
+
+def matches(conn, q):
+    from app.services import search
+
+    if not search.words(q) or "@" in q:
+        return 1 if q else None
+    for mode in search.MATCH_MODES:
+        match = search.match_expression(conn, q, mode)
+        count = conn.execute("SELECT COUNT(*) FROM farmer_search WHERE farmer_search MATCH ?", (match,)).fetchone()[0]
+        if count:
+            return count
+    return 0
+
+
+async def measure(client, q, second_page, runs):
+    cursor = None
+    if second_page:
+        r = await client.get("/api/bank/farmers", params={"q": q})
+        cursor = r.json()["next_cursor"]
+    latencies = []
+    for _ in range(runs):
+        params = {"q": q}
+        if cursor:
+            params["cursor"] = cursor
+        started = time.perf_counter()
+        r = await client.get("/api/bank/farmers", params=params)
+        latencies.append(time.perf_counter() - started)
+        r.raise_for_status()
+    body = r.json()
+    latencies.sort()
+    return (statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            len(body["items"]), body["fuzzy"])
+
+
+async def main(args):
+    import httpx
+    from app.main import app
+    from app.db.database import db
+
+    db.ensure_schema()
+    transport = httpx.ASGITransport(app=app)
+    over_budget = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for level in args.farmers:
+            conn = sqlite3.connect(db.db_path)
+            current = conn.execute("SELECT COUNT(*) FROM farmers").fetchone()[0]
+            if level > current:
+                started = time.perf_counter()
+                populate(conn, farmers=level - current, loans=(level - current) * args.loans_per_farmer,
+                         payments_per_loan=0, seed=args.seed + level)
+                conn.execute("ANALYZE")
+                conn.commit()
+                print(f"\nLoaded {level:,} farmers in {time.perf_counter() - started:.1f}s")
+            email = conn.execute("SELECT email FROM farmers WHERE id = ?", (level // 2,)).fetchone()[0]
+
+            print(f"{'query':<20} {'q':<22} {'matches':>9} {'p50 ms':>8} {'p95 ms':>8} {'rows':>5} {'fuzzy':>6}")
+            for label, q in QUERIES:
+                q = email if q is None else q
+                count = matches(conn, q)
+                p50, p95, rows, fuzzy = await measure(client, q, label.endswith("page 2"), args.runs)
+                shown = "all" if count is None else f"{count:,}"
+                print(f"{label:<20} {q[:20]!r:<22} {shown:>9} {p50:>8.2f} {p95:>8.2f} {rows:>5} {str(fuzzy):>6}")
+                if (count is None or count <= args.selective) and p50 > args.budget:
+                    over_budget.append((level, label, p50))
+            conn.close()
+
+    if over_budget:
+        print(f"\nOver the {args.budget} ms budget:")
+        for level, label, p50 in over_budget:
+            print(f"  {level:,} farmers, {label}: {p50:.2f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--farmers", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--loans-per-farmer", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--budget", type=float, default=10.0, help="p50 ms allowed for selective queries")
+    parser.add_argument("--selective", type=int, default=1_000, help="most matches a selective query has")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "farmer_search.db"))
+    asyncio.run(main(args))
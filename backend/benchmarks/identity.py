@@ -0,0 +1,81 @@
+"""Per-request identity cost as the farmer count grows.
+
+Grows one database through --farmers levels (1k, 10k, 100k by default)
+and at each level resolves a random sample of farmers through
+auth.identity_for, cold (farm-id cache dropped) and warm, then serves
+GET /api/farmers/loans to the same sample with their own tokens. With the
+indexed farm-id lookup and the LRU in front of it, all three should stay
+flat as the farmer count grows.
+
+    cd backend && python -m benchmarks.identity --farmers 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+
+async def resolve_all(identity_for, farmer_ids):
+    latencies = []
+    for farmer_id in farmer_ids:
+        started = time.perf_counter()
+        await identity_for(farmer_id)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies) * 1e6
+
+
+async def main(args):
+    import httpx
+    from app.auth import create_token, farm_ids_cache, identity_for
+    from app.main import app
+    from app.db.database import db
+
+    db.ensure_schema()
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app)
+    print(f"{'farmers':>10} {'cold us':>9} {'warm us':>9} {'loans p50 ms':>13} {'queries':>8}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for level in args.farmers:
+            conn = sqlite3.connect(db.db_path)
+            current = conn.execute("SELECT COUNT(*) FROM farmers").fetchone()[0]
+            if level > current:
+                populate(conn, farmers=level - current, loans=(level - current) * args.loans_per_farmer,
+                         seed=args.seed + level)
+                conn.execute("ANALYZE")
+                conn.commit()
+            farmer_ids = rng.sample([r[0] for r in conn.execute("SELECT id FROM farmers")], args.sample)
+            conn.close()
+
+            farm_ids_cache.invalidate()
+            cold = await resolve_all(identity_for, farmer_ids)
+            warm = await resolve_all(identity_for, farmer_ids)
+
+            latencies, queries = [], []
+            for farmer_id in farmer_ids:
+                headers = {"Authorization": f"Bearer {create_token(farmer_id)}"}
+                started = time.perf_counter()
+                r = await client.get("/api/farmers/loans", headers=headers)
+                latencies.append(time.perf_counter() - started)
+                r.raise_for_status()
+                queries.append(int(r.headers["x-query-count"]))
+            print(f"{level:>10,} {cold:>9.1f} {warm:>9.1f} {statistics.median(latencies) * 1000:>13.2f} "
+                  f"{statistics.mean(queries):>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--farmers", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--loans-per-farmer", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "identity.db"))
+    os.environ.setdefault("AGROCREDIT_JWT_SECRET", "benchmark-secret")
+    asyncio.run(main(args))
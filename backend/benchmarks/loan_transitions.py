@@ -0,0 +1,135 @@
+"""Concurrency stress test for loan lifecycle transitions.
+
+Many threads, each on its own pooled connection, race on the same loans:
+
+  1. every thread tries to approve or reject every pending application;
+  2. every thread tries to sign every approved loan;
+  3. every thread pays each active loan's full balance at once.
+
+Exactly one attempt per loan may win each race; the others must fail with
+a TransitionError (or be rejected by the payment engine), never with
+`database is locked`, and portfolio_stats must still match a full
+recompute afterwards. Exits 1 on any violation.
+
+    cd backend && python -m benchmarks.loan_transitions --loans 2000 --threads 16
+"""
+import argparse
+import collections
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+
+def race(db, loans, threads, attempt):
+    """Run attempt(conn, loan_id, thread) for every loan on every thread at once.
+
+    Returns (Counter of outcomes, {loan_id: winning threads}, seconds).
+    """
+    outcomes = collections.Counter()
+    winners = collections.defaultdict(list)
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(thread):
+        barrier.wait()
+        # Threads walk the loans from different offsets so they collide
+        # throughout the run, not only on the first loans
+        offset = thread * len(loans) // threads
+        for loan_id in loans[offset:] + loans[:offset]:
+            try:
+                with db.get_connection() as conn:
+                    outcome = attempt(conn, loan_id, thread)
+            except sqlite3.OperationalError as exc:
+                outcome = f"error: {exc}"
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "won":
+                    winners[loan_id].append(thread)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return outcomes, winners, time.perf_counter() - started
+
+
+def main(args):
+    from app.db.database import DatabaseManager
+    from app.db.pool import PoolSettings
+    from app.repositories import bank, farmers
+    from app.services import portfolio
+    from app.services.amortization import schedule_totals
+    from app.services.loan_state import TransitionError
+    from benchmarks.synthetic import populate
+
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "transitions.db"),
+                         PoolSettings(max_size=args.threads))
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    populate(conn, farmers=max(args.loans // 10, 1), loans=args.loans, status_mix=[("pending", 1.0)])
+    pending = [r[0] for r in conn.execute("SELECT id FROM loan_requests WHERE status = 'pending' ORDER BY id")]
+    conn.close()
+    print(f"{len(pending):,} pending applications, {args.threads} threads")
+
+    def transition_attempt(action):
+        def attempt(conn, loan_id, thread):
+            try:
+                action(conn, loan_id, thread)
+                return "won"
+            except TransitionError as exc:
+                return exc.reason
+        return attempt
+
+    review = transition_attempt(lambda conn, loan_id, thread: bank.review_application(conn, loan_id, thread % 4 != 0))
+    sign = transition_attempt(lambda conn, loan_id, thread: farmers.sign_loan(conn, loan_id))
+
+    def pay_off(conn, loan_id, thread):
+        loan = farmers.get_loan(conn, loan_id)
+        if loan is None:
+            return "gone"
+        owed = schedule_totals(conn, [loan_id])[loan_id]
+        _, result = farmers.record_payment(conn, loan_id, owed)
+        return "won" if result['status'] == "paid_off" else result['status']
+
+    failed = False
+    for name, loans, attempt in (
+        ("review", pending, review),
+        ("sign", None, sign),
+        ("pay off", None, pay_off),
+    ):
+        if loans is None:
+            with db.get_connection() as conn:
+                status = "waiting_signature" if name == "sign" else "active"
+                loans = [r[0] for r in conn.execute(
+                    "SELECT id FROM loan_requests WHERE status = ? ORDER BY id", (status,))]
+        outcomes, winners, seconds = race(db, loans, args.threads, attempt)
+        attempts = sum(outcomes.values())
+        double = [loan_id for loan_id, threads in winners.items() if len(threads) > 1]
+        missing = len(loans) - len(winners)
+        errors = {k: v for k, v in outcomes.items() if k.startswith("error")}
+        print(f"{name:<8} {len(loans):>7,} loans {attempts:>9,} attempts in {seconds:6.2f}s "
+              f"({attempts / seconds:,.0f}/s)  {dict(outcomes)}")
+        if double or missing or errors:
+            failed = True
+            print(f"  FAIL: {len(double)} loans won twice, {missing} never won, errors {errors}")
+
+    with db.get_connection() as conn:
+        mismatches = portfolio.reconcile(conn, repair=False)
+    if mismatches:
+        failed = True
+        print(f"FAIL: portfolio_stats drifted: {mismatches}")
+    db.close()
+    print("FAILED" if failed else "OK: every loan transitioned exactly once")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=2_000)
+    parser.add_argument("--threads", type=int, default=16)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""Load test: /api/farmers/notifications polling next to a slow bank query.
+
+Runs the app in-process against a throwaway database holding a large
+pending-applications queue, then polls notifications at increasing
+concurrency while /api/bank/applications is being served. With the
+async data layer the poll p99 should stay roughly flat instead of growing
+with every concurrent request that blocks the loop.
+
+    cd backend && python -m benchmarks.notifications_load --pending 200000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+
+def seed_pending(db_path, count):
+    from app.db.seed import seed_demo
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        seed_demo(conn)
+        farm_id = conn.execute("SELECT id FROM farms LIMIT 1").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO loan_requests (farm_id, amount, term_months, purpose, status) VALUES (?, ?, ?, ?, 'pending')",
+            ((farm_id, 1000 + i % 9000, 12, "Seeds") for i in range(count)),
+        )
+    conn.close()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def poll(client, rounds, latencies):
+    for _ in range(rounds):
+        started = time.perf_counter()
+        r = await client.get("/api/farmers/notifications")
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_level(client, concurrency, rounds, with_slow_query):
+    latencies = []
+    slow = asyncio.create_task(client.get("/api/bank/applications")) if with_slow_query else None
+    await asyncio.gather(*(poll(client, rounds, latencies) for _ in range(concurrency)))
+    if slow is not None:
+        await slow
+    return latencies
+
+
+async def main(args):
+    import httpx
+    from app.auth import create_token
+    from app.db.database import db
+    from app.main import app
+
+    db.ensure_schema()
+    seed_pending(db.db_path, args.pending)
+    transport = httpx.ASGITransport(app=app)
+    # Polls as the seeded farmer, whose farm holds the pending queue
+    headers = {"Authorization": f"Bearer {create_token(1)}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        print(f"{'clients':>8} {'p50 ms':>10} {'p99 ms':>10} {'p99 w/ slow query':>18}")
+        for concurrency in args.levels:
+            idle = await run_level(client, concurrency, args.rounds, with_slow_query=False)
+            busy = await run_level(client, concurrency, args.rounds, with_slow_query=True)
+            print(
+                f"{concurrency:>8} {statistics.median(idle) * 1000:>10.2f} "
+                f"{percentile(idle, 99) * 1000:>10.2f} {percentile(busy, 99) * 1000:>18.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pending", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 64])
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tmp, "bench.db"))
+    os.environ.setdefault("AGROCREDIT_JWT_SECRET", "benchmark-secret")
+    asyncio.run(main(args))
@@ -0,0 +1,155 @@
+"""EXPLAIN QUERY PLAN regression check for the endpoints' SQL.
+
+Builds a throwaway database with --loans loan rows (1M by default),
+runs ANALYZE, then calls every repository function the routers use while
+capturing the statements it issues, and asserts none of them plans a
+full table scan. Exits non-zero on a regression.
+
+    cd backend && python -m benchmarks.query_plans
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+
+def endpoint_calls(farmer, loans):
+    """Repository calls behind the endpoints for `farmer` (an auth.Identity);
+    `loans` maps a status to a loan id in it."""
+    from app.repositories import farmers, bank
+    from app.services import archive, export, jobs, notifications, timeseries
+
+    now = time.time()
+    return [
+        ("farmers.get_profile", farmers.get_profile, (farmer,)),
+        ("farmers.get_summary_rows", farmers.get_summary_rows, (farmer,)),
+        ("farmers.get_open_loans", farmers.get_open_loans, (farmer,)),
+        ("farmers.get_open_loans[history]", farmers.get_open_loans, (farmer, True)),
+        ("farmers.get_utility_readings", farmers.get_utility_readings, (farmer,)),
+        ("farmers.get_utility_history", farmers.get_utility_history,
+         (farmer, "electricity", "2024-01-01 00:00:00", "2024-12-31 00:00:00", 200)),
+        ("farmers.add_utility_readings", farmers.add_utility_readings,
+         (farmer, [(None, "electricity", 1.0, "kWh", "2024-06-01 00:00:00")])),
+        ("timeseries.compact_raw", timeseries.compact_raw, (12,)),
+        ("farmers.get_latest_recommendation", farmers.get_latest_recommendation, (farmer,)),
+        ("farmers.get_notifications", farmers.get_notifications, (farmer,)),
+        ("notifications.build", notifications.build, ([farmer.farmer_id],)),
+        ("farmers.get_schedule", farmers.get_schedule, (farmer, loans["active"])),
+        ("farmers.create_loan", farmers.create_loan, (farmer, 1000.0, 12, "Seeds")),
+        ("farmers.sign_loan", farmers.sign_loan, (loans["waiting_signature"],)),
+        ("farmers.record_payment", farmers.record_payment, (loans["active"], 10.0)),
+        ("bank.get_dashboard_totals", bank.get_dashboard_totals, ()),
+        ("bank.get_application_page", bank.get_application_page, ({},)),
+        ("bank.get_application_page[amount]", bank.get_application_page, ({}, "amount", False, (1000.0, 1))),
+        ("bank.get_export_chunk", bank.get_export_chunk, (0, 1000, ["active"], export.encode_csv)),
+        ("bank.get_application_page[farmer]", bank.get_application_page, ({"farmer": "aziz"},)),
+        ("bank.search_farmers", bank.search_farmers, ("aziz kar",)),
+        ("bank.search_farmers[next]", bank.search_farmers, ("aziz", ("prefix", -5.0, 100))),
+        ("bank.search_farmers[fuzzy]", bank.search_farmers, ("gofurvo",)),
+        ("bank.search_farmers[list]", bank.search_farmers, ("", ("list", 100))),
+        ("bank.review_application", bank.review_application, (loans["pending"], True, None, 0.15, "annuity")),
+        ("archive.archive_batch", archive.archive_batch, ()),
+        # Background jobs commit their batches; they run last
+        ("jobs.detect_overdue", jobs.detect_overdue, ({}, now)),
+        ("jobs.refresh_notifications", jobs.refresh_notifications, ({}, now)),
+        ("jobs.refresh_recommendations", jobs.refresh_recommendations, ({}, now)),
+    ]
+
+
+# Tables bounded by a handful of rows regardless of portfolio size
+SMALL_TABLES = {"portfolio_stats", "sqlite_sequence"}
+
+
+def full_scans(conn, sql):
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    # Subqueries planned on their own lines; a scan of one reads its rows
+    subqueries = {row[3].split()[1] for row in plan if row[3].startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    scans = []
+    for row in plan:
+        detail = row[3]
+        if not detail.startswith("SCAN ") or detail == "SCAN CONSTANT ROW":
+            continue
+        target = detail.split()[1]
+        # Virtual tables (FTS5) report every plan as SCAN; only one with no
+        # constraint ("INDEX 0:" and nothing after) reads the whole table
+        if " VIRTUAL TABLE INDEX " in detail and not detail.endswith(" INDEX 0:"):
+            continue
+        # Scans over a materialized subquery read its (already planned) rows
+        if target in SMALL_TABLES or target in subqueries or target.startswith("(subquery-"):
+            continue
+        scans.append(detail)
+    return scans
+
+
+def all_calls(conn):
+    """endpoint_calls() for a farmer with an active loan in the populated
+    database behind `conn`, plus the identity lookup itself."""
+    from app.auth import Identity
+    from app.repositories.farmers import get_farm_ids
+
+    farmer_id, own_active = conn.execute("""
+        SELECT f.farmer_id, lr.id FROM loan_requests lr JOIN farms f ON f.id = lr.farm_id
+        WHERE lr.status = 'active' LIMIT 1
+    """).fetchone()
+    loans = {
+        status: conn.execute("SELECT id FROM loan_requests WHERE status = ? LIMIT 1", (status,)).fetchone()[0]
+        for status in ("pending", "waiting_signature")
+    }
+    loans["active"] = own_active  # the farmer's own, so ownership checks pass
+    farmer = Identity(farmer_id, get_farm_ids(conn, farmer_id))
+    return [("farmers.get_farm_ids", get_farm_ids, (farmer_id,))] + endpoint_calls(farmer, loans)
+
+
+def check(conn, calls):
+    failures = []
+    for name, fn, args in calls:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            fn(conn, *args)
+        finally:
+            conn.set_trace_callback(None)
+            conn.rollback()  # leave the dataset untouched for the next call
+        for sql in statements:
+            head = sql.lstrip().split(None, 1)[0].upper()
+            if head not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+                continue
+            for detail in full_scans(conn, sql):
+                failures.append((name, detail, " ".join(sql.split())))
+        print(f"  checked {name}: {len(statements)} statement(s)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=1_000_000)
+    parser.add_argument("--farmers", type=int, default=50_000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "plans.db"))
+    from app.db.database import db
+
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    conn.row_factory = sqlite3.Row
+    started = time.perf_counter()
+    populate(conn, farmers=args.farmers, loans=args.loans)
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"Loaded {args.loans:,} loans in {time.perf_counter() - started:.1f}s")
+
+    failures = check(conn, all_calls(conn))
+    if failures:
+        print("\nFull table scans found:")
+        for name, detail, sql in failures:
+            print(f"  {name}: {detail}\n    {sql}")
+        sys.exit(1)
+    print("No full table scans.")
+
+
+if __name__ == "__main__":
+    main()
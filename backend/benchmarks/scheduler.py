@@ -0,0 +1,144 @@
+"""Background job cost: the first full pass versus incremental runs.
+
+Loads --farmers / --loans into a temporary database and drives the
+scheduler (app/scheduler.py) with a ManualClock, so no run waits for real
+time:
+
+  1. the first pass of each job (overdue: every loan with an installment
+     due; notifications: the backfill; recommendations: one farm batch)
+  2. for each --changes level, that many payments, then the clock moved
+     one overdue interval: the run time should follow the change count,
+     not the loan book; then a day, which re-checks the loans with an
+     installment falling due
+  3. overlap: a job started while it is already running is skipped, and a
+     run finding another worker's lease does nothing
+
+It then checks that every farmer's stored notification list equals the
+inline build, and exits non-zero if one differs or step 3 misbehaves.
+
+    cd backend && python -m benchmarks.scheduler --farmers 20000 --loans 200000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+
+def stored_matches_build(conn, today):
+    from app.services import notifications
+
+    farmer_ids = [row[0] for row in conn.execute("SELECT id FROM farmers ORDER BY id")]
+    mismatched = []
+    for offset in range(0, len(farmer_ids), 900):
+        chunk = farmer_ids[offset:offset + 900]
+        built = notifications.build(conn, chunk, today)
+        for farmer_id in chunk:
+            if notifications.for_farmer(conn, farmer_id, today) != built[farmer_id]:
+                mismatched.append(farmer_id)
+    return len(farmer_ids), mismatched
+
+
+async def main(args):
+    from app.db.database import adb, db
+    from app.db.pool import ConnectionPool
+    from app.scheduler import ManualClock, acquire_lease, release_lease
+    from app.services import jobs, payments
+
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    conn.row_factory = sqlite3.Row
+    started = time.perf_counter()
+    populate(conn, farmers=args.farmers, loans=args.loans, payments_per_loan=None)
+    conn.execute("ANALYZE")
+    # Start from existing data with nothing precomputed, as after the migration
+    conn.execute("DELETE FROM farmer_notifications")
+    conn.execute("DELETE FROM farmer_notification_state")
+    conn.commit()
+    print(f"Loaded {args.farmers:,} farmers, {args.loans:,} loans in {time.perf_counter() - started:.1f}s\n")
+
+    clock = ManualClock(time.time())
+    scheduler = jobs.scheduler_from_env(clock)
+    stats = scheduler.stats
+
+    print(f"{'run':<34} {'seconds':>8}  result")
+    for name in ("overdue", "notifications", "recommendations"):
+        await scheduler.run_now(name)
+        print(f"{'first ' + name:<34} {stats()[name]['last_seconds']:>8.3f}  {stats()[name]['last_result']}")
+    while not stats()["notifications"]["last_result"]["backfill_done"]:
+        await scheduler.run_now("notifications")
+    print(f"{'notifications backfill':<34} {stats()['notifications']['total_seconds']:>8.3f}  "
+          f"{stats()['notifications']['runs']} runs")
+
+    # Steady state, on the timer: payments, then one overdue interval
+    active = [row[0] for row in conn.execute("SELECT id FROM loan_requests WHERE status = 'active'")]
+    rng = random.Random(args.seed)
+    scheduler.start()
+    for changes in args.changes:
+        loan_ids = rng.sample(active, min(changes, len(active)))
+        with db.get_connection() as pooled:
+            pooled.execute("BEGIN IMMEDIATE")
+            payments.apply_payments(pooled, [payments.PaymentRow(loan_id, 10.0, None) for loan_id in loan_ids])
+        runs = {name: stats()[name]["runs"] for name in scheduler.jobs}
+        await clock.advance(scheduler.jobs["overdue"].interval)
+        await scheduler.idle()
+        for name in ("overdue", "notifications"):
+            if stats()[name]["runs"] > runs[name]:
+                print(f"{f'{changes:,} payments, {name}':<34} {stats()[name]['last_seconds']:>8.3f}  "
+                      f"{stats()[name]['last_result']}")
+    # A day later: the loans whose next installment fell due in between
+    runs = stats()["overdue"]["runs"]
+    await clock.advance(86_400)
+    await scheduler.idle()
+    if stats()["overdue"]["runs"] > runs:
+        print(f"{'next day, overdue':<34} {stats()['overdue']['last_seconds']:>8.3f}  "
+              f"{stats()['overdue']['last_result']}")
+    await scheduler.stop()
+
+    failures = []
+    # Overlap inside this process: the second start is skipped
+    skipped = stats()["overdue"]["skipped"]
+    await asyncio.gather(scheduler.run_now("overdue"), scheduler.run_now("overdue"))
+    if stats()["overdue"]["skipped"] != skipped + 1:
+        failures.append("a concurrent second run of overdue was not skipped")
+    # Overlap across workers: another owner's live lease
+    pool = ConnectionPool(db.db_path)
+    with pool.connection() as other:
+        acquire_lease(other, "overdue", "other-worker", clock.now(), 60)
+        busy = stats()["overdue"]["lease_busy"]
+        if await scheduler.run_now("overdue") is not None or stats()["overdue"]["lease_busy"] != busy + 1:
+            failures.append("overdue ran while another worker held its lease")
+        release_lease(other, "overdue", "other-worker", None, clock.now())
+    pool.close()
+
+    await scheduler.run_now("notifications")
+    checked, mismatched = stored_matches_build(conn, time.strftime("%Y-%m-%d", time.localtime(clock.now())))
+    print(f"\n{checked:,} notification lists checked, {len(mismatched)} differ from the inline build")
+    if mismatched:
+        failures.append(f"stored notifications differ for farmers {mismatched[:10]}")
+    conn.close()
+    adb.close()
+    db.close()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--farmers", type=int, default=20_000)
+    parser.add_argument("--loans", type=int, default=200_000)
+    parser.add_argument("--changes", type=int, nargs="+", default=[10, 100, 1_000, 10_000])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "scheduler.db"))
+    asyncio.run(main(args))
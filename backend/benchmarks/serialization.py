@@ -0,0 +1,154 @@
+"""Per-row serialization cost of large list responses, before and after
+the direct row mapping path (app/serialization.py).
+
+Serves --rows rows (10k by default) of loans, applications and
+installments from an in-process app, three ways:
+
+  models    a Pydantic model per row, re-validated against response_model
+            and encoded with the stdlib json module (the previous code)
+  mapped    plain dicts from map_rows / map_objects, stdlib json
+  orjson    the same dicts encoded with orjson (what the endpoints do now)
+
+The rows are built once up front, so the numbers are framework,
+validation and encoding cost only, with no SQL.
+
+    cd backend && python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import statistics
+import time
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from app.api.bank import ANALYSIS_FIELDS, APPLICATION_COLUMNS, Application
+from app.api.farmers import LOAN_ATTRIBUTES, LOAN_FIELDS, Installment, Loan, _loan_from_balance
+from app.serialization import HAS_ORJSON, FastJSONResponse, map_objects, map_rows
+from app.services.balances import LoanBalance
+
+
+def loan_rows(n):
+    return [LoanBalance(i, 5000.0 + i, 12, "active", 5600.0 + i, 1400.0, 4200.0 + i, 25, 466.67,
+                        "2025-01-15", 0.12, 0.0) for i in range(1, n + 1)]
+
+
+def application_rows(n):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        SELECT i AS id, 1 AS farm_id, 'Aziz Gofurov' AS farmer_name, 'Gofurov Orchards' AS farm_name,
+               150.5 AS farm_size, 500.0 * i AS amount, 12 AS term_months, 'Irrigation' AS purpose,
+               700 AS credit_score, 'pending' AS status, '2024-05-01 10:00:00' AS created_at,
+               0 AS version, NULL AS analysis
+        FROM n
+    """, (n,)).fetchall()
+    analysis = {
+        "yield_potential": "4.2 tons/ha",
+        "risk_factors": ["Stable market demand"],
+        "ai_score_breakdown": {"credit_history": 85, "farm_productivity": 78, "market_conditions": 70},
+    }
+    return rows, {row['id']: analysis for row in rows}
+
+
+def installment_rows(n):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    return conn.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        SELECT i AS seq, '2025-01-15' AS due_date, 416.67 AS principal, 50.0 AS interest,
+               466.67 AS amount, 466.67 * i AS cumulative
+        FROM n
+    """, (n,)).fetchall()
+
+
+def build_app(n):
+    balances = loan_rows(n)
+    applications, analyses = application_rows(n)
+    installments = installment_rows(n)
+    app = FastAPI()
+
+    # --- models: the previous endpoint code ---
+    @app.get("/models/loans", response_model=List[Loan], response_class=JSONResponse)
+    async def loans_models():
+        return [_loan_from_balance(b) for b in balances]
+
+    @app.get("/models/applications", response_model=List[Application], response_class=JSONResponse)
+    async def applications_models():
+        apps = []
+        for row in applications:
+            analysis = analyses[row['id']]
+            apps.append(Application(
+                id=row['id'], farmer_name=row['farmer_name'], farm_name=row['farm_name'],
+                amount=row['amount'], term_months=row['term_months'], purpose=row['purpose'],
+                credit_score=row['credit_score'], status=row['status'], created_at=row['created_at'],
+                version=row['version'], yield_potential=analysis['yield_potential'],
+                risk_factors=analysis['risk_factors'], ai_score_breakdown=analysis['ai_score_breakdown'],
+            ))
+        return apps
+
+    @app.get("/models/installments", response_model=List[Installment], response_class=JSONResponse)
+    async def installments_models():
+        return [Installment(**dict(row)) for row in installments]
+
+    # --- mapped: row mappers, encoded by `response_class` ---
+    def mapped_applications():
+        items = map_rows(applications, APPLICATION_COLUMNS)
+        for item in items:
+            analysis = analyses[item['id']]
+            for field in ANALYSIS_FIELDS:
+                item[field] = analysis[field]
+        return items
+
+    bodies = {
+        "loans": lambda: map_objects(balances, LOAN_FIELDS, LOAN_ATTRIBUTES),
+        "applications": mapped_applications,
+        "installments": lambda: map_rows(installments, Installment.model_fields),
+    }
+    for name, body in bodies.items():
+        for prefix, response_class in (("mapped", JSONResponse), ("orjson", FastJSONResponse)):
+            async def endpoint(body=body, response_class=response_class):
+                return response_class(body())
+            app.add_api_route(f"/{prefix}/{name}", endpoint)
+    return app
+
+
+async def main(args):
+    import httpx
+
+    app = build_app(args.rows)
+    transport = httpx.ASGITransport(app=app)
+    print(f"{args.rows:,} rows per response, orjson {'installed' if HAS_ORJSON else 'NOT installed'}\n")
+    print(f"{'response':<14} {'path':<8} {'ms':>8} {'us/row':>8} {'KiB':>7} {'speedup':>8}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in ("loans", "applications", "installments"):
+            baseline, reference = None, None
+            for path in ("models", "mapped", "orjson"):
+                url = f"/{path}/{name}"
+                r = await client.get(url)
+                r.raise_for_status()
+                body = json.loads(r.content)
+                if reference is None:
+                    reference = body
+                elif body != reference:
+                    raise AssertionError(f"{url} differs from the models response")
+                timings = []
+                for _ in range(args.runs):
+                    started = time.perf_counter()
+                    r = await client.get(url)
+                    timings.append(time.perf_counter() - started)
+                ms = statistics.median(timings) * 1000
+                baseline = baseline or ms
+                print(f"{name:<14} {path:<8} {ms:>8.2f} {ms * 1000 / args.rows:>8.2f} "
+                      f"{len(r.content) / 1024:>7.0f} {baseline / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
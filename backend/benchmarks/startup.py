@@ -0,0 +1,115 @@
+"""Cold start: process launch to first served request, N workers at once.
+
+Launches --workers processes together, the way `uvicorn --workers N` or an
+autoscaler bringing up instances does. Each imports app.main, runs the
+lifespan startup and serves one GET /api/bank/dashboard in-process.
+Reports the median per phase and the slowest worker's total. Two databases
+are measured: a new file (first boot, migrations run) and an existing
+portfolio whose schema is already current (every later boot).
+
+    cd backend && python -m benchmarks.startup --workers 1 4 8
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ("spawn", "import", "startup", "request", "total")
+
+
+def child():
+    # Runs in each worker process; prints one JSON line of timestamps
+    started = time.time()
+    import asyncio
+    import httpx
+
+    before_import = time.time()
+    from app.main import app
+    imported = time.time()
+
+    async def serve_first_request():
+        async with app.router.lifespan_context(app):
+            ready = time.time()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                r = await client.get("/api/bank/dashboard")
+                r.raise_for_status()
+            return ready, time.time()
+
+    ready, served = asyncio.run(serve_first_request())
+    launched = float(os.environ["STARTUP_LAUNCHED"])
+    print(json.dumps({
+        "spawn": started - launched,
+        "import": imported - before_import,
+        "startup": ready - imported,
+        "request": served - ready,
+        "total": served - launched,
+    }))
+
+
+def launch(db_path, workers):
+    env = dict(os.environ, AGROCREDIT_DB_PATH=db_path, PYTHONPATH=os.getcwd(), STARTUP_LAUNCHED=repr(time.time()))
+    env.setdefault("AGROCREDIT_JWT_SECRET", "benchmark-secret")
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.startup", "--child"], env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    results = []
+    for proc in procs:
+        out, _ = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"worker exited with {proc.returncode}")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def existing_database(path, farmers, loans):
+    from app.db.database import DatabaseManager
+    from app.db.seed import seed_demo
+    from benchmarks.synthetic import populate
+
+    db = DatabaseManager(path)
+    db.ensure_schema()
+    db.close()
+    conn = sqlite3.connect(path)
+    seed_demo(conn)
+    populate(conn, farmers=farmers, loans=loans)
+    conn.close()
+
+
+def main(args):
+    tmp = tempfile.mkdtemp()
+    existing = os.path.join(tmp, "existing.db")
+    existing_database(existing, args.farmers, args.loans)
+    print(f"existing database: {args.farmers:,} farmers, {args.loans:,} loans\n")
+
+    print(f"{'database':<9} {'workers':>7} " + " ".join(f"{p + ' ms':>11}" for p in PHASES) + f" {'max total':>10}")
+    for workers in args.workers:
+        for label in ("new", "existing"):
+            samples = []
+            for run in range(args.runs):
+                path = os.path.join(tmp, f"new_{workers}_{run}.db") if label == "new" else existing
+                samples.extend(launch(path, workers))
+            medians = [statistics.median(s[p] for s in samples) * 1000 for p in PHASES]
+            slowest = max(s["total"] for s in samples) * 1000
+            print(f"{label:<9} {workers:>7} " + " ".join(f"{m:>11.1f}" for m in medians) + f" {slowest:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--farmers", type=int, default=10_000)
+    parser.add_argument("--loans", type=int, default=100_000)
+    args = parser.parse_args()
+    if args.child:
+        child()
+    else:
+        main(args)
@@ -0,0 +1,281 @@
+"""Endpoint benchmark suite with saved baselines.
+
+Generates a synthetic portfolio (benchmarks/synthetic.py) in a throwaway
+database, then drives every router endpoint in-process over ASGI at a
+fixed concurrency and reports per-endpoint throughput, p50/p95/p99 latency
+and the mean number of SQL statements per request (X-Query-Count).
+
+    cd backend && python -m benchmarks.suite                  # compare
+    cd backend && python -m benchmarks.suite --save-baseline  # record
+
+Results are compared with benchmarks/baselines.json: the run fails (exit
+status 1) when an endpoint's median latency or throughput is worse than
+its baseline by more than --tolerance, or when it issues more queries per
+request. The tails (p95/p99) are reported but not gated: under concurrent
+writes they are dominated by lock waits and vary run to run.
+Baselines are only comparable for the same dataset and request counts,
+and timings only on similar hardware - re-record them on the machine that
+runs the suite. Read-only scenarios run first, so the query counts they
+report are not disturbed by the writes that follow.
+
+GET /api/farmers/notifications/stream is not covered: the in-process
+transport buffers whole responses and an SSE stream never ends.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+# Latency differences below this many milliseconds are treated as noise
+NOISE_MS = 2.0
+# Mean statements per request may drift slightly with cache-miss timing;
+# an N+1 regression adds at least one per request
+QUERY_SLACK = 0.5
+
+
+class Scenario:
+    """One endpoint: `build(i)` returns the (method, url, request kwargs) of request i."""
+
+    def __init__(self, name, build, requests=None, concurrency=None):
+        self.name = name
+        self.build = build
+        self.requests = requests  # None: the suite default
+        self.concurrency = concurrency
+
+
+def _get(url, **kwargs):
+    return lambda i: ("GET", url, kwargs)
+
+
+def scenarios(ids, today, owner, admin):
+    """The suite, reads first. `ids` holds loan ids by status from the dataset;
+    `owner(loan_id)` is the auth header of the farmer owning a loan, `admin`
+    an operator's."""
+    pending, waiting, active = ids["pending"], ids["waiting_signature"], ids["active"]
+    own_active = ids["own_active"]
+    document = {"application_id": 1, "farmer_name": "Bench Farmer", "amount": 5000.0, "date": today}
+    return [
+        # --- farmer reads ---
+        Scenario("GET /api/farmers/profile", _get("/api/farmers/profile")),
+        Scenario("GET /api/farmers/summary", _get("/api/farmers/summary")),
+        Scenario("GET /api/farmers/loans", _get("/api/farmers/loans")),
+        Scenario("GET /api/farmers/loans/{loan_id}/schedule", lambda i: (
+            "GET", f"/api/farmers/loans/{own_active[i % len(own_active)]}/schedule", {})),
+        Scenario("GET /api/farmers/utilities", _get("/api/farmers/utilities")),
+        Scenario("GET /api/farmers/utilities/history", _get(
+            "/api/farmers/utilities/history", params={"type": "electricity", "start": "2000-01-01", "end": today})),
+        Scenario("GET /api/farmers/recommendations/latest", _get("/api/farmers/recommendations/latest")),
+        Scenario("GET /api/farmers/notifications", _get("/api/farmers/notifications")),
+        # --- bank reads ---
+        Scenario("GET /api/bank/dashboard", _get("/api/bank/dashboard")),
+        Scenario("GET /api/bank/applications", _get("/api/bank/applications")),
+        Scenario("GET /api/bank/applications?sort=amount", _get(
+            "/api/bank/applications", params={"sort": "amount", "order": "asc", "min_score": 600})),
+        Scenario("GET /api/bank/farmers", lambda i: (
+            "GET", "/api/bank/farmers", {"params": {"q": ("karimov", "aziz ras", "orchards", "gofurvo")[i % 4]}})),
+        Scenario("GET /api/bank/export", _get("/api/bank/export", headers=admin), requests=5, concurrency=1),
+        Scenario("GET /api/bank/export?format=columnar", _get(
+            "/api/bank/export", params={"format": "columnar"}, headers=admin), requests=5, concurrency=1),
+        # --- documents ---
+        Scenario("POST /api/documents/contract", lambda i: (
+            "POST", "/api/documents/contract", {"json": {**document, "application_id": i}})),
+        Scenario("POST /api/documents/rejection", lambda i: (
+            "POST", "/api/documents/rejection", {"json": {**document, "application_id": i}})),
+        Scenario("POST /api/documents/batch", lambda i: (
+            "POST", "/api/documents/batch",
+            {"json": {"application_ids": pending[i * 100 % len(pending):][:100], "template": "contract"}}),
+            requests=20),
+        # --- writes ---
+        Scenario("POST /api/farmers/loans", lambda i: (
+            "POST", "/api/farmers/loans", {"json": {"amount": 1000 + i, "term_months": 12, "purpose": "Seeds"}})),
+        Scenario("POST /api/farmers/utilities/readings", lambda i: (
+            "POST", "/api/farmers/utilities/readings", {"json": [{"type": "water", "value": 100_000 + i}]})),
+        Scenario("POST /api/farmers/loans/{loan_id}/pay", lambda i: (
+            "POST", f"/api/farmers/loans/{active[i % len(active)]}/pay",
+            {"json": {"amount": 1.0},
+             "headers": {"Idempotency-Key": f"suite-pay-{i}", **owner(active[i % len(active)])}})),
+        # Each signature consumes a loan waiting for one
+        Scenario("POST /api/farmers/loans/{loan_id}/sign", lambda i: (
+            "POST", f"/api/farmers/loans/{waiting[i]}/sign", {"headers": owner(waiting[i])}),
+            requests=min(len(waiting), 200)),
+        Scenario("POST /api/bank/applications/{app_id}/review", lambda i: (
+            "POST", f"/api/bank/applications/{pending[i % len(pending)]}/review", {"json": {"approved": i % 2 == 0}})),
+        Scenario("POST /api/bank/payments/bulk", lambda i: (
+            "POST", "/api/bank/payments/bulk", {"json": {"payments": [
+                {"loan_id": active[(i * 100 + k) % len(active)], "amount": 1.0, "idempotency_key": f"suite-bulk-{i}-{k}"}
+                for k in range(100)
+            ]}, "headers": admin}), requests=20),
+        Scenario("POST /api/bank/payments/bulk/upload", lambda i: (
+            "POST", "/api/bank/payments/bulk/upload", {
+                "content": "\n".join(
+                    json.dumps({"loan_id": active[(i * 100 + k) % len(active)], "amount": 1.0,
+                                "idempotency_key": f"suite-upload-{i}-{k}"})
+                    for k in range(100)
+                ),
+                "headers": {"content-type": "application/x-ndjson", **admin},
+            }), requests=20),
+        Scenario("POST /api/bank/dashboard/reconcile", lambda i: (
+            "POST", "/api/bank/dashboard/reconcile", {"headers": admin}), requests=5, concurrency=1),
+        Scenario("POST /api/bank/portfolio/rescore", lambda i: (
+            "POST", "/api/bank/portfolio/rescore", {"headers": admin}), requests=3, concurrency=1),
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_scenario(client, scenario, requests, concurrency):
+    latencies, queries = [], []
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            method, url, kwargs = scenario.build(i)
+            started = time.perf_counter()
+            r = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if r.status_code >= 400:
+                raise RuntimeError(f"{scenario.name}: {method} {url} -> {r.status_code} {r.text[:200]}")
+            queries.append(int(r.headers.get("x-query-count", 0)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "throughput": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries": round(sum(queries) / len(queries), 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for results that are worse than the baseline."""
+    failures = []
+    for name, base in baseline.items():
+        result = results.get(name)
+        if result is None:
+            failures.append(f"{name}: missing from this run")
+            continue
+        p50_limit = max(base["p50_ms"] * (1 + tolerance), base["p50_ms"] + NOISE_MS)
+        if result["p50_ms"] > p50_limit:
+            failures.append(f"{name}: p50 {result['p50_ms']:.2f}ms > {p50_limit:.2f}ms")
+        if result["throughput"] < base["throughput"] / (1 + tolerance) and result["p50_ms"] > base["p50_ms"] + NOISE_MS:
+            failures.append(f"{name}: throughput {result['throughput']:,.1f}/s < baseline {base['throughput']:,.1f}/s")
+        if result["queries"] > base["queries"] + QUERY_SLACK:
+            failures.append(f"{name}: {result['queries']} queries/request > baseline {base['queries']}")
+    return failures
+
+
+async def main(args):
+    import httpx
+    from app.auth import ADMIN_ROLE, create_token
+    from app.main import app
+    from app.db.database import db
+    from app.db.seed import seed_demo
+    from app.services import notifications
+
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    seed_demo(conn)  # farmer 1, whom the read scenarios act as
+    conn.commit()
+    started = time.perf_counter()
+    populate(conn, farmers=args.farmers, loans=args.loans, reading_days=args.reading_days, seed=args.seed)
+    print(f"dataset: {args.farmers:,} farmers, {args.loans:,} loans in {time.perf_counter() - started:.1f}s")
+    # Steady state: the notifications job has caught up with the seeded farmer too
+    conn.row_factory = sqlite3.Row
+    notifications.refresh(conn, [1])
+    conn.commit()
+    ids = {
+        status: [r[0] for r in conn.execute(
+            "SELECT id FROM loan_requests WHERE status = ? ORDER BY id", (status,))]
+        for status in ("pending", "waiting_signature", "active")
+    }
+    # Reads act as farmer 1 (the seeded one); its own active loans
+    ids["own_active"] = [r[0] for r in conn.execute(
+        "SELECT lr.id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id "
+        "WHERE fa.farmer_id = 1 AND lr.status = 'active' ORDER BY lr.id")]
+    owners = dict(conn.execute(
+        "SELECT lr.id, fa.farmer_id FROM loan_requests lr JOIN farms fa ON lr.farm_id = fa.id "
+        "WHERE lr.status IN ('waiting_signature', 'active')"))
+    conn.close()
+
+    today = time.strftime("%Y-%m-%d")
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    tokens = {}
+
+    def owner(loan_id):
+        farmer_id = owners[loan_id]
+        if farmer_id not in tokens:
+            tokens[farmer_id] = {"Authorization": f"Bearer {create_token(farmer_id)}"}
+        return tokens[farmer_id]
+
+    # Portfolio recompute endpoints are for operators
+    admin = {"Authorization": f"Bearer {create_token('suite', role=ADMIN_ROLE)}"}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600,
+                                 headers=owner(ids["own_active"][0])) as client:
+        print(f"{'endpoint':<48} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+        for scenario in scenarios(ids, today, owner, admin):
+            if args.only and not any(part in scenario.name for part in args.only):
+                continue
+            result = await run_scenario(
+                client, scenario, scenario.requests or args.requests, scenario.concurrency or args.concurrency
+            )
+            results[scenario.name] = result
+            print(f"{scenario.name:<48} {result['throughput']:>9,.1f} {result['p50_ms']:>9.2f} "
+                  f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['queries']:>8.2f}")
+
+    config = {key: getattr(args, key) for key in ("farmers", "loans", "reading_days", "seed", "requests", "concurrency")}
+    if args.save_baseline:
+        with open(args.baseline, "w") as fp:
+            json.dump({"config": config, "results": results}, fp, indent=2)
+            fp.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as fp:
+        saved = json.load(fp)
+    if saved["config"] != config:
+        print(f"baseline was recorded with {saved['config']}, not {config}; not comparable")
+        return 2
+    baseline = {name: base for name, base in saved["results"].items() if name in results or not args.only}
+    failures = compare(results, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print(f"{len(failures)} regression(s) against {len(baseline)} baseline endpoints")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--farmers", type=int, default=2_000)
+    parser.add_argument("--loans", type=int, default=20_000)
+    parser.add_argument("--reading-days", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="+", help="run endpoints whose name contains any of these")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.0,
+                        help="allowed relative slowdown of p50 and throughput (1.0 = twice as slow)")
+    args = parser.parse_args()
+    os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "suite.db"))
+    os.environ.setdefault("AGROCREDIT_JWT_SECRET", "benchmark-secret")
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Set before anything imports app: the database path and the JWT secret are
+# read at import time, and background jobs must not run against test data
+os.environ.setdefault("AGROCREDIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "tests.db"))
+os.environ.setdefault("AGROCREDIT_JWT_SECRET", "test-secret")
+os.environ.setdefault("AGROCREDIT_SCHEDULER", "0")
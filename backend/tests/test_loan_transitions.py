@@ -0,0 +1,84 @@
+"""Threads racing on the same loans (benchmarks/loan_transitions.py, scaled
+down): every review, signature and payoff applies exactly once, the losers
+never see `database is locked`, and portfolio_stats still matches a full
+recompute."""
+import sqlite3
+
+import pytest
+
+from benchmarks.loan_transitions import race
+from benchmarks.synthetic import populate
+
+THREADS = 8
+
+
+@pytest.fixture
+def db(tmp_path):
+    from app.db.database import DatabaseManager
+    from app.db.pool import PoolSettings
+
+    db = DatabaseManager(str(tmp_path / "transitions.db"), PoolSettings(max_size=THREADS))
+    db.ensure_schema()
+    conn = sqlite3.connect(db.db_path)
+    populate(conn, farmers=20, loans=200, status_mix=[("pending", 1.0)])
+    conn.close()
+    yield db
+    db.close()
+
+
+def loan_ids(db, status):
+    with db.get_connection() as conn:
+        return [r[0] for r in conn.execute("SELECT id FROM loan_requests WHERE status = ? ORDER BY id", (status,))]
+
+
+def transition_attempt(action):
+    from app.services.loan_state import TransitionError
+
+    def attempt(conn, loan_id, thread):
+        try:
+            action(conn, loan_id, thread)
+            return "won"
+        except TransitionError as exc:
+            return exc.reason
+    return attempt
+
+
+def assert_won_once(loans, outcomes, winners):
+    assert not {k: v for k, v in outcomes.items() if k.startswith("error")}
+    assert sorted(winners) == sorted(loans)
+    assert all(len(threads) == 1 for threads in winners.values())
+    assert outcomes["won"] == len(loans)
+
+
+def test_transition_race(db):
+    from app.repositories import bank, farmers
+    from app.services import portfolio
+    from app.services.amortization import schedule_totals
+
+    pending = loan_ids(db, "pending")
+    assert pending
+    # A quarter of the threads reject, so both outcomes race each other
+    review = transition_attempt(lambda conn, loan_id, thread: bank.review_application(conn, loan_id, thread % 4 != 0))
+    outcomes, winners, _ = race(db, pending, THREADS, review)
+    assert_won_once(pending, outcomes, winners)
+    # Every losing attempt found the loan already reviewed
+    assert outcomes["invalid"] == len(pending) * (THREADS - 1)
+
+    approved = loan_ids(db, "waiting_signature")
+    assert len(approved) + len(loan_ids(db, "rejected")) == len(pending)
+    sign = transition_attempt(lambda conn, loan_id, thread: farmers.sign_loan(conn, loan_id))
+    outcomes, winners, _ = race(db, approved, THREADS, sign)
+    assert_won_once(approved, outcomes, winners)
+    assert loan_ids(db, "active") == approved
+
+    def pay_off(conn, loan_id, thread):
+        owed = schedule_totals(conn, [loan_id])[loan_id]
+        _, result = farmers.record_payment(conn, loan_id, owed)
+        return "won" if result['status'] == "paid_off" else result['status']
+
+    outcomes, winners, _ = race(db, approved, THREADS, pay_off)
+    assert_won_once(approved, outcomes, winners)
+    assert loan_ids(db, "paid_off") == approved
+
+    with db.get_connection() as conn:
+        assert portfolio.reconcile(conn, repair=False) == []
@@ -0,0 +1,62 @@
+"""The query-plan regression check (benchmarks/query_plans.py) on a seeded
+database: no statement behind an endpoint plans a full table scan.
+
+This runs at reduced scale, 20k loans. The check is meant for 1M loans,
+where a scan that is cheap here would hurt. Run that either as
+`python -m benchmarks.query_plans` or by setting AGROCREDIT_SLOW_TESTS=1,
+which adds test_no_full_table_scans_at_1m (several minutes).
+"""
+import os
+import sqlite3
+
+import pytest
+
+from benchmarks.query_plans import all_calls, check
+from benchmarks.synthetic import populate
+
+
+def seeded(path, farmers, loans):
+    from app.db.database import DatabaseManager
+
+    db = DatabaseManager(str(path))
+    db.ensure_schema()
+    db.close()
+    conn = sqlite3.connect(db.db_path)
+    conn.row_factory = sqlite3.Row
+    populate(conn, farmers=farmers, loans=loans)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn
+
+
+def assert_no_full_scans(conn):
+    failures = check(conn, all_calls(conn))
+    assert not failures, "\n".join(f"{name}: {detail}\n  {sql}" for name, detail, sql in failures)
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    # Much smaller and the planner rightly prefers scanning for the batched
+    # IN (...) lists of the jobs and archiving
+    conn = seeded(tmp_path_factory.mktemp("plans") / "plans.db", farmers=2_000, loans=20_000)
+    yield conn
+    conn.close()
+
+
+def test_no_full_table_scans(conn):
+    assert_no_full_scans(conn)
+
+
+def test_full_scan_is_reported(conn):
+    calls = [("unindexed", lambda conn: conn.execute("SELECT * FROM loan_requests WHERE purpose = 'x'").fetchall(), ())]
+    assert [name for name, _, _ in check(conn, calls)] == ["unindexed"]
+
+
+@pytest.mark.skipif(os.environ.get("AGROCREDIT_SLOW_TESTS") != "1", reason="set AGROCREDIT_SLOW_TESTS=1")
+def test_no_full_table_scans_at_1m(tmp_path):
+    # The scale benchmarks/query_plans.py runs at by default
+    conn = seeded(tmp_path / "plans.db", farmers=50_000, loans=1_000_000)
+    try:
+        assert_no_full_scans(conn)
+    finally:
+        conn.close()
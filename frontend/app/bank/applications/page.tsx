@@ -33,8 +33,9 @@ export default function BankApplications() {
 
     const fetchApps = async () => {
         try {
+            // Paginated envelope: { items, total, next_cursor }
             const data = await api.getBankApplications();
-            setApplications(data);
+            setApplications(data.items);
         } catch (error) {
             console.error("Failed to fetch applications", error);
         } finally {
@@ -2,19 +2,36 @@
 
 import { useEffect, useState } from "react";
 import { Bell } from "lucide-react";
-import { api } from "@/lib/api";
+import { API_URL } from "@/lib/api";
 import Link from "next/link";
 
 export default function NotificationBell() {
     const [count, setCount] = useState(0);
 
     useEffect(() => {
+        const countAlerts = (notes: any) => {
+            const safeNotes = Array.isArray(notes) ? notes : [];
+            setCount(safeNotes.filter((n: any) => n.type === 'alert').length);
+        };
+
+        // Preferred path: server pushes the list whenever a loan changes state
+        if (typeof EventSource !== "undefined") {
+            const source = new EventSource(`${API_URL}/farmers/notifications/stream`);
+            source.addEventListener("notifications", (e) => countAlerts(JSON.parse((e as MessageEvent).data)));
+            return () => source.close();
+        }
+
+        // Fallback: conditional polling, unchanged lists come back as 304
+        let etag: string | null = null;
         const checkNotifications = async () => {
             try {
-                const notes = await api.getNotifications();
-                const safeNotes = Array.isArray(notes) ? notes : [];
-                const unread = safeNotes.filter((n: any) => n.type === 'alert').length;
-                setCount(unread);
+                const res = await fetch(`${API_URL}/farmers/notifications`, {
+                    headers: etag ? { "If-None-Match": etag } : {},
+                });
+                if (res.status === 304) return;
+                if (!res.ok) throw new Error("API request failed");
+                etag = res.headers.get("ETag");
+                countAlerts(await res.json());
             } catch (e) {
                 console.error("Failed to fetch notifications", e);
             }
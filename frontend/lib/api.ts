@@ -1,5 +1,5 @@
 // const API_URL = "http://localhost:8000/api";
-const API_URL = process.env.NEXT_PUBLIC_API_URL || "https://agrocredit-api.onrender.com/api";
+export const API_URL = process.env.NEXT_PUBLIC_API_URL || "https://agrocredit-api.onrender.com/api";
 
 export async function fetcher(url: string, options?: RequestInit) {
     const res = await fetch(`${API_URL}${url}`, options);
@@ -18,7 +18,10 @@ export const api = {
 
     // Bank API
     getBankDashboard: () => fetcher('/bank/dashboard'),
-    getBankApplications: () => fetcher('/bank/applications'),
+    getBankApplications: (params?: Record<string, string | number>) => {
+        const query = params ? `?${new URLSearchParams(Object.entries(params).map(([k, v]) => [k, String(v)]))}` : '';
+        return fetcher(`/bank/applications${query}`);
+    },
     reviewApplication: (id: number, approved: boolean) =>
         fetcher(`/bank/applications/${id}/review`, {
             method: 'POST',